@@ -0,0 +1,197 @@
+"""Convert a 3DGS point_cloud.ply into the chunked compressed PLY read by gs_editor.
+
+The layout mirrors ``serializePlyCompressed`` in gs_editor/src/splat-serialize.ts:
+splats are sorted in Morton order and packed in chunks of 256, every chunk
+stores the float min/max of position, log scale and colour, every splat four
+uint32 (position 11/10/11, rotation 2/10/10/10, scale 11/10/11, colour 8888)
+and the higher SH bands one byte per coefficient.
+
+Only needs numpy, so it can run in the training environment:
+
+    python -m backend.compressed_ply <point_cloud.ply> [-o <out.compressed.ply>]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+
+CHUNK_SIZE = 256
+SH_C0 = 0.28209479177387814
+
+CHUNK_PROPS = [
+    "min_x", "min_y", "min_z",
+    "max_x", "max_y", "max_z",
+    "min_scale_x", "min_scale_y", "min_scale_z",
+    "max_scale_x", "max_scale_y", "max_scale_z",
+    "min_r", "min_g", "min_b",
+    "max_r", "max_g", "max_b",
+]
+VERTEX_PROPS = ["packed_position", "packed_rotation", "packed_scale", "packed_color"]
+
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "<i2", "int16": "<i2", "ushort": "<u2", "uint16": "<u2",
+    "int": "<i4", "int32": "<i4", "uint": "<u4", "uint32": "<u4",
+    "float": "<f4", "float32": "<f4", "double": "<f8", "float64": "<f8",
+}
+
+
+def read_ply(path: Path) -> Dict[str, np.ndarray]:
+    """Read the vertex element of a binary little endian PLY as float32 columns."""
+    with open(path, "rb") as f:
+        if f.readline().strip() != b"ply":
+            raise ValueError(f"{path} is not a PLY file")
+        count, fields = 0, []
+        while True:
+            line = f.readline()
+            if not line:
+                raise ValueError(f"{path}: unexpected end of header")
+            tokens = line.decode("ascii").split()
+            if not tokens:
+                continue
+            if tokens[0] == "format" and tokens[1] != "binary_little_endian":
+                raise ValueError(f"{path}: unsupported PLY format {tokens[1]}")
+            if tokens[0] == "element":
+                if tokens[1] != "vertex":
+                    raise ValueError(f"{path}: unexpected element {tokens[1]}")
+                count = int(tokens[2])
+            elif tokens[0] == "property":
+                if tokens[1] == "list":
+                    raise ValueError(f"{path}: list properties are not supported")
+                fields.append((tokens[2], _PLY_TYPES[tokens[1]]))
+            elif tokens[0] == "end_header":
+                break
+        vertices = np.frombuffer(f.read(count * np.dtype(fields).itemsize), dtype=fields, count=count)
+    return {name: vertices[name].astype(np.float32) for name, _ in fields}
+
+
+def _pack_unorm(value: np.ndarray, bits: int) -> np.ndarray:
+    t = (1 << bits) - 1
+    return np.clip(np.floor(value * t + 0.5), 0, t).astype(np.uint32)
+
+
+def _pack_111011(v: np.ndarray) -> np.ndarray:
+    return (_pack_unorm(v[:, 0], 11) << 21) | (_pack_unorm(v[:, 1], 10) << 11) | _pack_unorm(v[:, 2], 11)
+
+
+def _pack_rotation(rot: np.ndarray) -> np.ndarray:
+    # 2 bit 最大分量索引 + 其余三个分量各 10 bit
+    rot = rot / np.maximum(np.linalg.norm(rot, axis=1, keepdims=True), 1e-12)
+    largest = np.abs(rot).argmax(1)
+    rot = rot * np.where(rot[np.arange(len(rot)), largest] < 0, -1.0, 1.0)[:, None]
+    result = largest.astype(np.uint32)
+    for k in range(3):
+        # 跳过最大分量后的第 k 个分量
+        value = rot[np.arange(len(rot)), k + (largest <= k)]
+        result = (result << 10) | _pack_unorm(value * np.sqrt(2) * 0.5 + 0.5, 10)
+    return result
+
+
+def _normalize(x: np.ndarray, vmin: np.ndarray, vmax: np.ndarray) -> np.ndarray:
+    x, vmin, vmax = x.astype(np.float64), vmin.astype(np.float64), vmax.astype(np.float64)
+    extent = vmax - vmin
+    out = np.where(extent < 0.00001, 0.0, (x - vmin) / np.where(extent < 0.00001, 1.0, extent))
+    return np.where(x <= vmin, 0.0, np.where(x >= vmax, 1.0, out))
+
+
+def _morton_order(xyz: np.ndarray) -> np.ndarray:
+    def part1by2(v):
+        v = v & 0x000003ff
+        v = (v ^ (v << 16)) & 0xff0000ff
+        v = (v ^ (v << 8)) & 0x0300f00f
+        v = (v ^ (v << 4)) & 0x030c30c3
+        v = (v ^ (v << 2)) & 0x09249249
+        return v
+
+    minn = xyz.min(0)
+    extent = xyz.max(0) - minn
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q = np.floor(1024 * (xyz - minn) / extent)
+    q = np.clip(np.nan_to_num(q), 0, 1023).astype(np.int64)
+    code = (part1by2(q[:, 2]) << 2) + (part1by2(q[:, 1]) << 1) + part1by2(q[:, 0])
+    return np.argsort(code, kind="stable")
+
+
+def compress_ply(src: Path, dst: Path) -> Dict:
+    """Write the compressed PLY of src to dst (atomically). Returns size statistics."""
+    v = read_ply(src)
+    n = len(v["x"])
+    if n == 0:
+        raise ValueError(f"{src}: no vertices")
+
+    xyz = np.stack([v["x"], v["y"], v["z"]], 1)
+    order = _morton_order(xyz)
+    num_chunks = (n + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+    # 按 morton 顺序重排, 最后一个 chunk 用最后一个 splat 补齐 (只参与 min/max)
+    padded = np.concatenate([order, np.full(num_chunks * CHUNK_SIZE - n, order[-1])])
+    position = xyz[padded].reshape(num_chunks, CHUNK_SIZE, 3)
+    scale = np.stack([v["scale_0"], v["scale_1"], v["scale_2"]], 1)[padded].reshape(num_chunks, CHUNK_SIZE, 3)
+    f_dc = np.stack([v["f_dc_0"], v["f_dc_1"], v["f_dc_2"]], 1)[padded].astype(np.float64)
+    color = (f_dc * SH_C0 + 0.5).astype(np.float32).reshape(num_chunks, CHUNK_SIZE, 3)
+
+    p_min, p_max = position.min(1), position.max(1)
+    s_min, s_max = np.clip(scale.min(1), -20, 20), np.clip(scale.max(1), -20, 20)
+    c_min, c_max = color.min(1), color.max(1)
+    chunks = np.concatenate([p_min, p_max, s_min, s_max, c_min, c_max], 1).astype("<f4")
+
+    def packed(values, vmin, vmax):
+        return _normalize(values, vmin[:, None], vmax[:, None]).reshape(-1, 3)[:n]
+
+    opacity = 1 / (1 + np.exp(-v["opacity"][order].astype(np.float64)))
+    rgb = packed(color, c_min, c_max)
+    vertices = np.empty((n, 4), dtype="<u4")
+    vertices[:, 0] = _pack_111011(packed(position, p_min, p_max))
+    vertices[:, 1] = _pack_rotation(np.stack([v["rot_0"], v["rot_1"], v["rot_2"], v["rot_3"]], 1)[order].astype(np.float64))
+    vertices[:, 2] = _pack_111011(packed(scale, s_min, s_max))
+    vertices[:, 3] = ((_pack_unorm(rgb[:, 0], 8) << 24) | (_pack_unorm(rgb[:, 1], 8) << 16) |
+                      (_pack_unorm(rgb[:, 2], 8) << 8) | _pack_unorm(opacity, 8))
+
+    num_rest = sum(1 for name in v if name.startswith("f_rest_"))
+    header = [
+        "ply",
+        "format binary_little_endian 1.0",
+        "comment Generated by 3DGS Online Reconstructor",
+        f"element chunk {num_chunks}",
+        *[f"property float {p}" for p in CHUNK_PROPS],
+        f"element vertex {n}",
+        *[f"property uint {p}" for p in VERTEX_PROPS],
+    ]
+    sh = None
+    if num_rest:
+        header += [f"element sh {n}", *[f"property uchar f_rest_{i}" for i in range(num_rest)]]
+        sh = np.stack([v[f"f_rest_{i}"] for i in range(num_rest)], 1)[order].astype(np.float64)
+        sh = np.clip(np.trunc((sh / 8 + 0.5) * 256), 0, 255).astype(np.uint8)
+    header.append("end_header\n")
+
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        f.write("\n".join(header).encode("ascii"))
+        f.write(chunks.tobytes())
+        f.write(vertices.tobytes())
+        if sh is not None:
+            f.write(sh.tobytes())
+    os.replace(tmp, dst)
+    return {"num_splats": n, "src_bytes": src.stat().st_size, "bytes": dst.stat().st_size}
+
+
+def compressed_path(ply: Path) -> Path:
+    """point_cloud.ply -> point_cloud.compressed.ply (the suffix gs_editor recognises)."""
+    return ply.with_name(ply.stem + ".compressed.ply")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the gs_editor compressed PLY of a 3DGS point cloud")
+    parser.add_argument("ply", type=Path)
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    out = args.output or compressed_path(args.ply)
+    stats = compress_ply(args.ply, out)
+    print(f"{args.ply} -> {out}: {stats['num_splats']} splats, "
+          f"{stats['src_bytes'] / 2**20:.1f} MB -> {stats['bytes'] / 2**20:.1f} MB")
@@ -19,6 +19,24 @@ GAUSSIAN_SPLATTING_DIR: Path = Path(
 COLMAP_BIN: str = os.getenv("COLMAP_BIN", "colmap")  # in PATH or absolute
 PYTHON_EXE: str = os.getenv("PYTHON_EXE", sys.executable)
 GS_EDITOR_URL: str = os.getenv("GS_EDITOR_URL", "/gs_editor/dist/index.html")
+# 训练时间预算（秒），>0 时 msv2 按测得的迭代速度缩放训练计划；0 表示使用预设的固定迭代次数
+TRAIN_TIME_BUDGET: float = float(os.getenv("TRAIN_TIME_BUDGET", 0))
+# 默认训练预设（mini-splatting2/config 下的 fast / balanced / quality / large_scene 等）；auto 表示按图片数量选择
+TRAIN_PRESET: str = os.getenv("TRAIN_PRESET", "fast")
+# auto 时图片数达到该值使用 large_scene，否则使用 fast
+LARGE_SCENE_IMAGES: int = int(os.getenv("LARGE_SCENE_IMAGES", 300))
+# 常驻训练 worker（mini-splatting2/worker.py）地址，如 "127.0.0.1:6100"；为空或连不上时每次启动新进程训练
+TRAIN_WORKER: str = os.getenv("TRAIN_WORKER", "")
+# 与 worker 共享的密钥，必须设置（消息经 pickle 传输，知道密钥即可在 worker 中执行代码）；为空时不连接 worker
+TRAIN_WORKER_AUTHKEY: str = os.getenv("TRAIN_WORKER_AUTHKEY", "")
+# 高斯数量达到该值时训练后额外导出空间分块（mini-splatting2/compress.py --tiles，tiles.json + tile_*.npz），0 表示不导出
+TILE_MIN_GAUSSIANS: int = int(os.getenv("TILE_MIN_GAUSSIANS", 2_000_000))
+# 转台视频（render.py --video）：帧数、相对训练视图的分辨率（预览用较低分辨率）和帧率
+TURNTABLE_FRAMES: int = int(os.getenv("TURNTABLE_FRAMES", 240))
+TURNTABLE_SCALE: float = float(os.getenv("TURNTABLE_SCALE", 0.5))
+TURNTABLE_FPS: int = int(os.getenv("TURNTABLE_FPS", 30))
+# 为 1 时训练完成后自动渲染转台视频，否则通过 POST /turntable/<job_id> 按需渲染
+TURNTABLE_AFTER_TRAIN: bool = os.getenv("TURNTABLE_AFTER_TRAIN", "0") == "1"
 
 # Optional: one-shot script to run COLMAP+3DGS. Placeholders:
 #   {images} {work} {out} {gs} {py} {colmap}
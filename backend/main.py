@@ -19,7 +19,7 @@ from pathlib import Path as _Path
 
 from . import config as C
 from . import reconstruction as R
-from .reconstruction_mini import reconstruct_mini
+from .reconstruction_mini import reconstruct_mini, available_presets
 from .utils import make_job_id, save_upload_files, zip_dir, extract_zip
 
 app = FastAPI(title="3DGS Online Reconstructor", version="0.1.2")
@@ -134,9 +134,9 @@ def list_projects():
 
 
 # --- 2. Viewer 的辅助函数 ---
-#查找生成的点云文件的路径
+#查找生成的点云文件的路径, 默认优先使用后处理生成的 point_cloud.compressed.ply
 import re
-def _find_point_cloud(out_dir: Path) -> str | None:
+def _find_point_cloud(out_dir: Path, prefer_compressed: bool = True) -> str | None:
     pc_dir = out_dir / "point_cloud"
     if not pc_dir.exists() or not pc_dir.is_dir():
         return None
@@ -154,8 +154,19 @@ def _find_point_cloud(out_dir: Path) -> str | None:
     # 选数字最大的
     candidates.sort(reverse=True)
     best_ply = candidates[0][1]
+    compressed = best_ply.with_name("point_cloud.compressed.ply")
+    # 压缩文件比原始 PLY 旧时说明它来自之前的训练, 不使用
+    if prefer_compressed and compressed.exists() and compressed.stat().st_mtime >= best_ply.stat().st_mtime:
+        best_ply = compressed
     return f"/outputs/{out_dir.name}/" + str(best_ply.relative_to(out_dir)).replace("\\", "/")
 
+# 大场景的分块清单 tiles.json（.npz 分块，供 Python 端 utils/tile_utils.load_tiles 按视锥加载；gs_editor 不读取），未导出时为 None
+def _find_tiles(out_dir: Path) -> str | None:
+    manifest = R.latest_tiles(out_dir)
+    if manifest is None:
+        return None
+    return f"/outputs/{out_dir.name}/" + str(manifest.relative_to(out_dir)).replace("\\", "/")
+
 #查找 cameras.json 文件的路径
 def _find_cameras(out_dir: Path) -> str | None:
     target = out_dir / "cameras.json"
@@ -190,6 +201,7 @@ def viewer(job_id: str):
         raise HTTPException(status_code=404, detail="job not found")
     ply = _find_point_cloud(out_dir)
     cams = _find_cameras(out_dir)
+    tiles = _find_tiles(out_dir)
     images_dir = upload_root / "input"
     # 将图片目录暴露为 /uploads/<job_id>/input/ 相对路径
     images_url = f"/uploads/{job_id}/input" if images_dir.exists() else None
@@ -215,7 +227,9 @@ def viewer(job_id: str):
         "gs_editor_mounted": bool(_gs_dist.exists()),
         "gs_editor_index_exists": bool((_gs_dist / "index.html").exists()) if _gs_dist.exists() else False,
         "ply_exists": bool(ply),
+        "ply_compressed": bool(ply and ply.endswith(".compressed.ply")),
         "cameras_exists": bool(cams),
+        "tiles_exists": bool(tiles),
         "images_dir_exists": images_dir.exists(),
         "images_url": images_url,
         "issues": [],
@@ -236,11 +250,89 @@ def viewer(job_id: str):
         "job_id": job_id,
         "ply_url": ply,
         "cameras_url": cams,
+        "tiles_url": tiles,
         "images_url": images_url,
         "editor_url": full_url,
         "diagnostics": diagnostics,
     }
 
+# 训练进程在后台写出的 PLY/checkpoint 快照状态 (snapshots.json)
+def _snapshot_status(job_id: str) -> dict | None:
+    snapshot_file = C.OUTPUT_DIR / job_id / "snapshots.json"
+    if not snapshot_file.exists():
+        return None
+    try:
+        return json.loads(snapshot_file.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+
+# 转台视频 URL（video/ours_<N>/turntable.mp4），尚未渲染时为 None
+def _find_turntable(out_dir: Path) -> str | None:
+    video = R.latest_turntable(out_dir)
+    if video is None:
+        return None
+    return f"/outputs/{out_dir.name}/" + str(video.relative_to(out_dir)).replace("\\", "/")
+
+# minigs2 训练的模型需要用 mini-splatting2/render.py 渲染（只有它写 config.json）
+def _is_mini(job_id: str) -> bool:
+    mode = JOBS.get(job_id, {}).get("mode")
+    if mode is not None:
+        return mode == "minigs2"
+    return (C.OUTPUT_DIR / job_id / "config.json").exists()
+
+TURNTABLE_JOBS: dict[str, dict] = {}
+TURNTABLE_LOCK = threading.Lock()
+
+# 训练已成功结束（内存中的作业或磁盘上的 status.json）
+def _job_done(job_id: str) -> bool:
+    data = JOBS.get(job_id)
+    if data is not None:
+        return bool(data.get("done")) and data.get("exit_code") == 0
+    status_file = C.OUTPUT_DIR / job_id / "status.json"
+    try:
+        return json.loads(status_file.read_text(encoding="utf-8")).get("stage") == "done"
+    except Exception:
+        return False
+
+def _async_turntable(job_id: str, out_dir: Path, log_file: Path):
+    try:
+        code = R.render_turntable(out_dir, log_file, mini=_is_mini(job_id))
+        TURNTABLE_JOBS[job_id] = {"stage": "done" if code == 0 else "failed", "exit_code": code}
+    except Exception as e:
+        TURNTABLE_JOBS[job_id] = {"stage": "failed", "error": str(e), "exit_code": -1}
+
+# 转台视频的状态与地址
+@app.get("/turntable/{job_id}")
+def turntable_status(job_id: str):
+    out_dir = C.OUTPUT_DIR / job_id
+    if not out_dir.exists():
+        raise HTTPException(status_code=404, detail="job not found")
+    video_url = _find_turntable(out_dir)
+    state = TURNTABLE_JOBS.get(job_id) or {"stage": "done" if video_url else "none"}
+    # 渲染中的文件还没写完
+    if state["stage"] == "running":
+        video_url = None
+    return {"job_id": job_id, **state, "video_url": video_url}
+
+# 在后台为已完成的作业渲染转台视频（低分辨率预览，边渲染边编码）
+@app.post("/turntable/{job_id}")
+def turntable(job_id: str):
+    out_dir = C.OUTPUT_DIR / job_id
+    if not out_dir.exists():
+        raise HTTPException(status_code=404, detail="job not found")
+    # 训练中只有中间结果的 PLY，且会与训练争用 GPU
+    if not _job_done(job_id) or _find_point_cloud(out_dir, prefer_compressed=False) is None:
+        raise HTTPException(status_code=409, detail="training not finished")
+    log_file = C.LOG_DIR / f"{job_id}.log"
+    # 同时到达的请求只启动一次渲染
+    with TURNTABLE_LOCK:
+        if TURNTABLE_JOBS.get(job_id, {}).get("stage") == "running":
+            return {"job_id": job_id, "stage": "running", "status_url": f"/turntable/{job_id}"}
+        TURNTABLE_JOBS[job_id] = {"stage": "running"}
+    th = threading.Thread(target=_async_turntable, args=(job_id, out_dir, log_file), daemon=True)
+    th.start()
+    return {"job_id": job_id, "stage": "running", "status_url": f"/turntable/{job_id}", "log_url": f"/logs/{log_file.name}"}
+
 #获取特定作业的详细结果/状态的端点
 @app.get("/result/{job_id}")
 def result(job_id: str):
@@ -254,10 +346,12 @@ def result(job_id: str):
                 zip_path = (C.OUTPUT_DIR / job_id).parent / f"{job_id}.zip"
                 disk_status["zip_url"] = f"/outputs/{zip_path.name}" if zip_path.exists() else None
                 disk_status["job_id"] = job_id
+                disk_status["snapshots"] = _snapshot_status(job_id)
+                disk_status["video_url"] = _find_turntable(C.OUTPUT_DIR / job_id)
                 return disk_status
             except: pass
         return {"error": "job not found"}
-    return data
+    return {**data, "snapshots": _snapshot_status(job_id), "video_url": _find_turntable(C.OUTPUT_DIR / job_id)}
 
 #删除项目及其所有关联文件的端
 @app.delete("/delete/{job_id}")
@@ -276,12 +370,12 @@ def delete_project(job_id: str):
         return {"status": "error", "message": str(e)}
 
 # --- 3. 重建逻辑 ---
-def _async_reconstruct(job_id, scene, upload_type, img_dir, work_dir, out_dir, log_file, mode=None):
+def _async_reconstruct(job_id, scene, upload_type, img_dir, work_dir, out_dir, log_file, mode=None, preset=None):
     prev = JOBS.get(job_id, {})
     JOBS[job_id] = {**prev, "job_id": job_id, "scene": scene, "stage": "running", "done": False, "log_url": f"/logs/{log_file.name}", "mode": mode}
     try:
         if mode == "minigs2":
-            result = reconstruct_mini(images_dir=img_dir, work_dir=work_dir, out_dir=out_dir, log_file=log_file)
+            result = reconstruct_mini(images_dir=img_dir, work_dir=work_dir, out_dir=out_dir, log_file=log_file, preset=preset)
         else:
             result = R.reconstruct(images_dir=img_dir, work_dir=work_dir, out_dir=out_dir, log_file=log_file)
         zip_path = zip_dir(out_dir, out_dir.parent / f"{job_id}.zip")
@@ -302,7 +396,11 @@ async def reconstruct_stream(
     scene_name: Optional[str] = Form(None),
     upload_type: str = Form("files"),
     mode: Optional[str] = Form(None),
+    preset: Optional[str] = Form(None),
 ):
+    # 训练预设只对 minigs2 生效，提前校验避免上传后才失败
+    if preset and preset != "auto" and preset not in available_presets():
+        raise HTTPException(status_code=400, detail=f"Unknown preset {preset}, expected one of {available_presets()} or auto")
     # 清理场景名称以用作作业 ID 或生成一个唯一的 ID
     if scene_name:
         import re
@@ -337,7 +435,7 @@ async def reconstruct_stream(
     base = JOBS.get(job_id, {})
     JOBS[job_id] = {**base, "job_id": job_id, "scene": scene_name or job_id, "cover_url": cover_url, "stage": "running", "done": False, "log_url": f"/logs/{log_file.name}", "mode": mode}
 
-    th = threading.Thread(target=_async_reconstruct, args=(job_id, scene_name or job_id, upload_type, img_dir, work_dir, out_dir, log_file, mode), daemon=True)
+    th = threading.Thread(target=_async_reconstruct, args=(job_id, scene_name or job_id, upload_type, img_dir, work_dir, out_dir, log_file, mode, preset), daemon=True)
     th.start()
 
     return {
@@ -345,6 +443,7 @@ async def reconstruct_stream(
         "scene": scene_name or job_id,
         "upload_type": upload_type,
         "mode": mode,
+        "preset": preset,
         "log_url": f"/logs/{log_file.name}",
         "status_url": f"/result/{job_id}",
         "cover_url": cover_url,
@@ -356,7 +455,7 @@ _frontend_dist = C.BASE_DIR / "frontend" / "dist"
 
 @app.get("/{full_path:path}")
 async def serve_react_app(full_path: str):
-    if full_path.startswith(("api/", "outputs", "logs", "uploads", "reconstruct", "projects", "status", "result", "health", "viewer", "gs_editor")):
+    if full_path.startswith(("api/", "outputs", "logs", "uploads", "reconstruct", "projects", "status", "result", "health", "viewer", "gs_editor", "turntable")):
         return JSONResponse(status_code=404, content={"detail": "Not Found"})
     
     file_path = _frontend_dist / full_path
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import re
 import shlex
 from pathlib import Path
 from typing import Dict, Optional
 
 from . import config as C
+from .train_worker import run_in_worker
 from .utils import write_status
 
 
@@ -35,6 +37,105 @@ def _run(cmd: str, cwd: Optional[Path], log_file: Path, header: str) -> int:
     return proc.returncode
 
 
+def _latest_point_cloud(out_dir: Path) -> Optional[Path]:
+    """point_cloud/iteration_<N>/point_cloud.ply with the largest N."""
+    candidates = []
+    pc_dir = out_dir / "point_cloud"
+    if pc_dir.is_dir():
+        for sub in pc_dir.iterdir():
+            m = re.match(r"iteration_(\d+)$", sub.name)
+            if m and (sub / "point_cloud.ply").exists():
+                candidates.append((int(m.group(1)), sub / "point_cloud.ply"))
+    return max(candidates)[1] if candidates else None
+
+
+def compress_point_cloud(out_dir: Path, log_file: Path, status_path: Path) -> int:
+    """Write point_cloud.compressed.ply (gs_editor chunked format) next to the latest point_cloud.ply.
+
+    Runs in the training interpreter since it needs numpy. A failure here does not fail
+    the job: /viewer falls back to the uncompressed PLY.
+    """
+    ply = _latest_point_cloud(out_dir)
+    if ply is None:
+        return 1
+    write_status(status_path, {"stage": "compress", "message": "Compressing point cloud", "progress": 0})
+    cmd = f"{shlex.quote(C.PYTHON_EXE)} -m backend.compressed_ply {shlex.quote(str(ply))}"
+    return _run(cmd, cwd=C.BASE_DIR, log_file=log_file, header="COMPRESS")
+
+
+def _ply_vertex_count(ply: Path) -> int:
+    """Number of Gaussians from the PLY header."""
+    with ply.open("rb") as f:
+        for line in f:
+            if line.startswith(b"element vertex"):
+                return int(line.split()[2])
+            if line.startswith(b"end_header"):
+                break
+    return 0
+
+
+def tile_point_cloud(out_dir: Path, log_file: Path, status_path: Path) -> int:
+    """Write point_cloud/iteration_<N>/tiles/tiles.json and its tiles for large scenes.
+
+    Tiles are .npz archives for Python clients (utils/tile_utils.load_tiles reads only
+    the tiles in a view frustum); the browser viewer still loads the single PLY. Runs
+    mini-splatting2/compress.py --tiles, which reads any 3DGS model. Skipped (returns 0)
+    below TILE_MIN_GAUSSIANS; a failure does not fail the job.
+    """
+    ply = _latest_point_cloud(out_dir)
+    if ply is None or C.TILE_MIN_GAUSSIANS <= 0 or _ply_vertex_count(ply) < C.TILE_MIN_GAUSSIANS:
+        return 0
+    write_status(status_path, {"stage": "tiles", "message": "Writing tiled point cloud", "progress": 0})
+    iteration = ply.parent.name.split("_")[-1]
+    tile_args = ["-m", str(out_dir), "--iteration", iteration, "--tiles", "--skip_eval"]
+    cmd = " ".join(shlex.quote(a) for a in [C.PYTHON_EXE, "compress.py", *tile_args])
+    return _run(cmd, cwd=C.BASE_DIR / "mini-splatting2", log_file=log_file, header="TILES")
+
+
+def latest_tiles(out_dir: Path) -> Optional[Path]:
+    """tiles.json next to the latest point_cloud.ply, if it was written for that iteration."""
+    ply = _latest_point_cloud(out_dir)
+    if ply is None:
+        return None
+    manifest = ply.parent / "tiles" / "tiles.json"
+    return manifest if manifest.exists() else None
+
+
+TURNTABLE_NAME = "turntable"
+
+
+def latest_turntable(out_dir: Path) -> Optional[Path]:
+    """video/ours_<N>/turntable.mp4 with the largest N."""
+    candidates = []
+    video_dir = out_dir / "video"
+    if video_dir.is_dir():
+        for sub in video_dir.iterdir():
+            m = re.match(r"ours_(\d+)$", sub.name)
+            if m and (sub / f"{TURNTABLE_NAME}.mp4").exists():
+                candidates.append((int(m.group(1)), sub / f"{TURNTABLE_NAME}.mp4"))
+    return max(candidates)[1] if candidates else None
+
+
+def render_turntable(out_dir: Path, log_file: Path, mini: bool = False) -> int:
+    """Render video/ours_<N>/turntable.mp4 along an ellipse around the training cameras.
+
+    Uses render.py --video of the tree that trained the model: gaussian-splatting cannot
+    load the cfg_args of mini-splatting2 models. Frames are encoded while rendering, at
+    TURNTABLE_SCALE of the training resolution.
+    """
+    if _latest_point_cloud(out_dir) is None:
+        return 1
+    render_args = ["-m", str(out_dir), "--video", "--mode", "ellipse", "--video_name", TURNTABLE_NAME,
+                   "--video_frames", str(C.TURNTABLE_FRAMES), "--video_scale", str(C.TURNTABLE_SCALE), "--fps", str(C.TURNTABLE_FPS)]
+    cwd = C.BASE_DIR / "mini-splatting2" if mini else C.GAUSSIAN_SPLATTING_DIR
+    if mini:
+        code = run_in_worker("render.py", render_args, cwd=cwd, log_file=log_file, header="TURNTABLE")
+        if code is not None:
+            return code
+    cmd = " ".join(shlex.quote(a) for a in [C.PYTHON_EXE, "render.py", *render_args])
+    return _run(cmd, cwd=cwd, log_file=log_file, header="TURNTABLE")
+
+
 def reconstruct(
     images_dir: Path,
     work_dir: Path,  # 保留以兼容调用，但本实现使用 dataset_root
@@ -51,6 +152,9 @@ def reconstruct(
       1. cd gaussian-splatting
       2. python convert.py -s <dataset_root>
       3. python train.py -s <dataset_root> -m <out_dir>
+      4. python -m backend.compressed_ply <out_dir>/point_cloud/iteration_<N>/point_cloud.ply
+         (+ mini-splatting2/compress.py --tiles for scenes of TILE_MIN_GAUSSIANS or more)
+      5. python render.py -m <out_dir> --video (only with TURNTABLE_AFTER_TRAIN)
     """
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -94,6 +198,14 @@ def reconstruct(
     write_status(status_path, {"stage": "train", "message": "Training 3DGS", "progress": 0})
     cmd_train = f"{shlex.quote(C.PYTHON_EXE)} train.py -s {shlex.quote(str(dataset_root))} -m {shlex.quote(str(out_dir))}"
     code_train = _run(cmd_train, cwd=C.GAUSSIAN_SPLATTING_DIR, log_file=log_file, header="TRAIN")
+    # Step 3: 生成 gs_editor 使用的压缩 PLY
+    if code_train == 0:
+        compress_point_cloud(out_dir, log_file, status_path)
+        tile_point_cloud(out_dir, log_file, status_path)
+        # Step 4: 可选的转台视频，失败不影响作业结果
+        if C.TURNTABLE_AFTER_TRAIN:
+            write_status(status_path, {"stage": "turntable", "message": "Rendering turntable video", "progress": 0})
+            render_turntable(out_dir, log_file)
     write_status(status_path, {"stage": "done" if code_train == 0 else "train_failed", "exit_code": code_train})
 
     return {
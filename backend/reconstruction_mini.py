@@ -2,22 +2,45 @@ from __future__ import annotations
 
 import shlex
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from . import config as C
 from .utils import write_status
-from .reconstruction import _run
+from .reconstruction import _run, compress_point_cloud, tile_point_cloud, render_turntable
+from .train_worker import run_in_worker
+
+PRESET_DIR = C.BASE_DIR / "mini-splatting2" / "config"
+
+
+def available_presets() -> List[str]:
+    return sorted(p.stem for p in PRESET_DIR.glob("*.json"))
+
+
+def select_preset(preset: Optional[str], images_dir: Path) -> str:
+    """Training preset of a job: the requested one, else TRAIN_PRESET; auto picks by image count."""
+    preset = preset or C.TRAIN_PRESET
+    if preset == "auto":
+        n_images = sum(1 for p in images_dir.iterdir() if p.is_file()) if images_dir.is_dir() else 0
+        return "large_scene" if n_images >= C.LARGE_SCENE_IMAGES else "fast"
+    if preset not in available_presets():
+        raise ValueError(f"unknown training preset {preset!r}, expected one of {available_presets()} or auto")
+    return preset
+
 
 def reconstruct_mini(
     images_dir: Path,
     work_dir: Path,  # 保留以兼容调用，但本实现使用 dataset_root
     out_dir: Path,
     log_file: Path,
+    preset: Optional[str] = None,
 ) -> Dict:
     """Run mini-splatting2 pipeline: convert.py + msv2/train.py
 
     1. cd gaussian-splatting; python convert.py -s <dataset_root>
-    2. cd mini-splatting2; python msv2/train.py -s <dataset_root> -m <out_dir> --config_path ./config/fast
+    2. cd mini-splatting2; python msv2/train.py -s <dataset_root> -m <out_dir> --config_path ./config/<preset>
+    3. python -m backend.compressed_ply <out_dir>/point_cloud/iteration_<N>/point_cloud.ply
+       (+ compress.py --tiles for scenes of TILE_MIN_GAUSSIANS or more)
+    4. cd mini-splatting2; python render.py -m <out_dir> --video (only with TURNTABLE_AFTER_TRAIN)
     """
     out_dir.mkdir(parents=True, exist_ok=True)
     dataset_root = images_dir.parent
@@ -52,14 +75,28 @@ def reconstruct_mini(
         }
 
     # Step 2: run mini-splatting2 training
-    write_status(status_path, {"stage": "train", "message": "Training MiniGS2", "progress": 0})
-    cmd_train = f"{shlex.quote(C.PYTHON_EXE)} msv2/train.py -s {shlex.quote(str(dataset_root))} -m {shlex.quote(str(out_dir))} --imp_metric outdoor --config_path ./config/fast"
-    code_train = _run(cmd_train, cwd=C.BASE_DIR / 'mini-splatting2', log_file=log_file, header="MINI_TRAIN")
+    preset = select_preset(preset, input_dir)
+    write_status(status_path, {"stage": "train", "message": f"Training MiniGS2 ({preset})", "progress": 0})
+    train_args = ["-s", str(dataset_root), "-m", str(out_dir), "--imp_metric", "outdoor", "--config_path", f"./config/{preset}"]
+    if C.TRAIN_TIME_BUDGET > 0:
+        train_args += ["--time_budget", str(C.TRAIN_TIME_BUDGET)]
+    cmd_train = " ".join(shlex.quote(a) for a in [C.PYTHON_EXE, "msv2/train.py", *train_args])
+    # 优先交给常驻 worker（省去进程启动、import 和 CUDA 初始化），不可用时照常启动新进程
+    code_train = run_in_worker("msv2/train.py", train_args, cwd=C.BASE_DIR / 'mini-splatting2', log_file=log_file, header="MINI_TRAIN")
+    if code_train is None:
+        code_train = _run(cmd_train, cwd=C.BASE_DIR / 'mini-splatting2', log_file=log_file, header="MINI_TRAIN")
+    if code_train == 0:
+        compress_point_cloud(out_dir, log_file, status_path)
+        tile_point_cloud(out_dir, log_file, status_path)
+        if C.TURNTABLE_AFTER_TRAIN:
+            write_status(status_path, {"stage": "turntable", "message": "Rendering turntable video", "progress": 0})
+            render_turntable(out_dir, log_file, mini=True)
     write_status(status_path, {"stage": "done" if code_train == 0 else "train_failed", "exit_code": code_train})
     return {
         "exit_code": code_train,
         "stage": "train" if code_train != 0 else "done",
         "command": cmd_train,
+        "preset": preset,
         "dataset_root": str(dataset_root),
         "out_dir": str(out_dir),
         "log_file": str(log_file),
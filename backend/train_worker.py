@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import shlex
+from multiprocessing.connection import Client, AuthenticationError
+from pathlib import Path
+from typing import List, Optional
+
+from . import config as C
+
+
+def _worker_address() -> Optional[tuple]:
+    if not C.TRAIN_WORKER or not C.TRAIN_WORKER_AUTHKEY:
+        return None
+    host, _, port = C.TRAIN_WORKER.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+
+def run_in_worker(script: str, argv: List[str], cwd: Path, log_file: Path, header: str) -> Optional[int]:
+    """Run a mini-splatting2 script in the warm training worker (mini-splatting2/worker.py).
+
+    Output is appended to log_file in the same layout as _run. Returns the exit code,
+    or None when no worker (or no TRAIN_WORKER_AUTHKEY) is configured, it cannot be reached
+    or it exits before starting the job (caller falls back to _run).
+    """
+    address = _worker_address()
+    if address is None:
+        return None
+    try:
+        conn = Client(address, authkey=C.TRAIN_WORKER_AUTHKEY.encode())
+    except (OSError, EOFError, AuthenticationError):
+        return None
+
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    cmd = " ".join(shlex.quote(a) for a in [script, *argv])
+    with log_file.open("a", encoding="utf-8") as lf:
+        lf.write(f"\n===== {header} =====\n")
+        lf.write(f"WORKER: {C.TRAIN_WORKER}\nCMD: {cmd}\nCWD: {cwd}\n\n")
+    started = False
+    try:
+        conn.send({"script": script, "argv": list(argv), "cwd": str(cwd), "log_file": str(log_file.resolve())})
+        # queued -> running -> done
+        while True:
+            msg = conn.recv()
+            if msg.get("status") == "running":
+                started = True
+            elif msg.get("status") == "done":
+                code = int(msg["exit_code"])
+                break
+    except (OSError, EOFError):
+        if not started:
+            # worker 在任务开始前退出（例如前一个任务 CUDA 崩溃），改为启动新进程
+            with log_file.open("a", encoding="utf-8") as lf:
+                lf.write("\nWORKER EXITED BEFORE THE JOB STARTED\n")
+            return None
+        # worker 在任务执行中退出
+        code = 1
+    finally:
+        conn.close()
+    with log_file.open("a", encoding="utf-8") as lf:
+        lf.write(f"\nEXIT_CODE: {code}\n")
+    return code
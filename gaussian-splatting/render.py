@@ -21,10 +21,8 @@ from argparse import ArgumentParser
 from arguments import ModelParams, PipelineParams, get_combined_args
 from gaussian_renderer import GaussianModel
 
-import cv2
-import numpy as np
-from utils.graphics_utils import getWorld2View2
 from utils.pose_utils import generate_ellipse_path, generate_spiral_path_from_views
+from utils.video_pipeline import path_cameras, VideoEncoder, VIDEO_CODECS
 
 try:
     from diff_gaussian_rasterization import SparseGaussianAdam
@@ -52,49 +50,31 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
         torchvision.utils.save_image(gt, os.path.join(gts_path, '{0:05d}'.format(idx) + ".png"))
 
 
-def render_video(model_path, iteration, views, gaussians, pipeline, background, fps=60, mode='ellipse', save_image=False):
-    """渲染视频序列，通过生成相机路径"""
+def render_video(model_path, iteration, views, gaussians, pipeline, background, fps=60, mode='ellipse', save_image=False,
+                 n_frames=600, resolution_scale=1.0, codec="auto", ring_size=8, video_name=None):
+    """渲染视频序列，通过生成相机路径；帧在后台线程编码，参考视图不会被修改"""
     render_path = os.path.join(model_path, 'video', "ours_{}".format(iteration))
     makedirs(render_path, exist_ok=True)
-    
-    # 使用第一个视图作为参考
-    view = views[0]
-    
-    # 选择不同模式
+
+    # 选择不同模式，一次生成全部相机矩阵
     if mode == 'spiral':
-        render_poses = generate_spiral_path_from_views(views, n_frames=600)
-    elif mode == 'ellipse':  # 默认使用椭圆路径
-        render_poses = generate_ellipse_path(views, n_frames=600)
-    
-    # 设置视频编码器和尺寸
-    size = (view.original_image.shape[2], view.original_image.shape[1])
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_path = os.path.join(render_path, os.path.basename(model_path) + '.mp4')
-    final_video = cv2.VideoWriter(video_path, fourcc, fps, size)
-    
-    # 渲染每一帧
-    for idx, pose in enumerate(tqdm(render_poses, desc="Rendering video")):
-        # 更新视图的变换矩阵
-        view.world_view_transform = torch.tensor(getWorld2View2(pose[:3, :3].T, pose[:3, 3], view.trans, view.scale)).transpose(0, 1).cuda()
-        view.full_proj_transform = (view.world_view_transform.unsqueeze(0).bmm(view.projection_matrix.unsqueeze(0))).squeeze(0)
-        view.camera_center = view.world_view_transform.inverse()[3, :3]
-        
-        # 渲染当前视角
-        rendering = render(view, gaussians, pipeline, background)["render"]
-        img = torch.clamp(rendering, min=0., max=1.)
-        
-        # 可选：保存每一帧为图像
-        if save_image:
-            torchvision.utils.save_image(img, os.path.join(render_path, '{0:05d}'.format(idx) + ".png"))
-        
-        # 转换为OpenCV格式并写入视频
-        video_img = (img.permute(1, 2, 0).detach().cpu().numpy() * 255.).astype(np.uint8)
-        # 转换颜色空间从RGB到BGR（OpenCV使用BGR）
-        video_img = cv2.cvtColor(video_img, cv2.COLOR_RGB2BGR)
-        final_video.write(video_img)
-    
-    # 释放视频写入器
-    final_video.release()
+        render_poses = generate_spiral_path_from_views(views, n_frames=n_frames)
+    else:  # 默认使用椭圆路径
+        render_poses = generate_ellipse_path(views, n_frames=n_frames)
+    # 使用第一个视图作为参考（视场角、分辨率）
+    cameras = path_cameras(render_poses, views[0], resolution_scale)
+
+    video_path = os.path.join(render_path, (video_name or os.path.basename(os.path.normpath(model_path))) + '.mp4')
+    size = (cameras[0].image_width, cameras[0].image_height)
+    with VideoEncoder(video_path, fps, size, ring_size=ring_size, codec=codec) as encoder:
+        # 渲染每一帧
+        for idx, camera in enumerate(tqdm(cameras, desc="Rendering video")):
+            rendering = render(camera, gaussians, pipeline, background)["render"]
+            encoder.write(rendering)
+
+            # 可选：保存每一帧为图像
+            if save_image:
+                torchvision.utils.save_image(torch.clamp(rendering, min=0., max=1.), os.path.join(render_path, '{0:05d}'.format(idx) + ".png"))
     print(f'Video saved to: {video_path}')
 
 
@@ -118,7 +98,11 @@ def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParam
                 background, 
                 args.fps if hasattr(args, 'fps') else 30,
                 args.mode if hasattr(args, 'mode') else 'ellipse',
-                args.save_image if hasattr(args, 'save_image') else False
+                args.save_image if hasattr(args, 'save_image') else False,
+                args.video_frames,
+                args.video_scale,
+                args.video_codec,
+                video_name=args.video_name
             )
             return  # 渲染视频后直接返回，不渲染训练/测试集
 
@@ -142,6 +126,10 @@ if __name__ == "__main__":
     parser.add_argument("--fps", default=30, type=int, help="Frames per second for video")
     parser.add_argument("--mode", default="ellipse", choices=["ellipse", "spiral"], help="Camera path mode for video rendering")
     parser.add_argument("--save_image", action="store_true", help="Save individual frames as images")
+    parser.add_argument("--video_frames", default=600, type=int, help="Number of frames along the camera path")
+    parser.add_argument("--video_scale", default=1.0, type=float, help="Frame size relative to the training views, e.g. 0.5 for a preview")
+    parser.add_argument("--video_codec", default="auto", choices=VIDEO_CODECS, help="auto encodes H.264 with ffmpeg when available, mp4v with OpenCV otherwise")
+    parser.add_argument("--video_name", default=None, type=str, help="File name of the video without extension, defaults to the model directory name")
     args = get_combined_args(parser)
     print("Rendering " + args.model_path)
 
@@ -17,6 +17,8 @@ from gaussian_renderer import render, network_gui
 import sys
 from scene import Scene, GaussianModel
 from utils.general_utils import safe_state, get_expon_lr_func
+from utils.profile_utils import Profiler
+from utils.budget_utils import TimeBudget
 import uuid
 from tqdm import tqdm
 from utils.image_utils import psnr
@@ -40,11 +42,14 @@ try:
 except:
     SPARSE_ADAM_AVAILABLE = False
 
-def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from):
+def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, profiler=None, time_budget=0, time_budget_max_scale=1.0):
 
     if not SPARSE_ADAM_AVAILABLE and opt.optimizer_type == "sparse_adam":
         sys.exit(f"Trying to use sparse adam but it is not installed, please install the correct rasterizer using pip install [3dgs_accel].")
 
+    if profiler is None:
+        profiler = Profiler(enabled=False)
+
     first_iter = 0
     tb_writer = prepare_output_and_logger(dataset)
     gaussians = GaussianModel(dataset.sh_degree, opt.optimizer_type)
@@ -70,7 +75,17 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
     progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
     first_iter += 1
-    for iteration in range(first_iter, opt.iterations + 1):
+
+    budget = None
+    if time_budget > 0:
+        budget = TimeBudget(time_budget, [(opt, "iterations"), (opt, "densify_from_iter"), (opt, "densify_until_iter"), (opt, "position_lr_max_steps")],
+                            max_scale=time_budget_max_scale)
+        budget.start(first_iter)
+
+    for iteration in range(first_iter, (opt.iterations if budget is None else budget.max_total) + 1):
+        if iteration > opt.iterations:
+            break
+        profiler.phase("viewer")
         if network_gui.conn == None:
             network_gui.try_connect()
         while network_gui.conn != None:
@@ -88,6 +103,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         iter_start.record()
 
+        profiler.phase("setup")
         gaussians.update_learning_rate(iteration)
 
         # Every 1000 its we increase the levels of SH up to a maximum degree
@@ -103,6 +119,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
         vind = viewpoint_indices.pop(rand_idx)
 
         # Render
+        profiler.phase("render")
         if (iteration - 1) == debug_from:
             pipe.debug = True
 
@@ -116,6 +133,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
             image *= alpha_mask
 
         # Loss
+        profiler.phase("loss")
         gt_image = viewpoint_cam.original_image.cuda()
         Ll1 = l1_loss(image, gt_image)
         if FUSED_SSIM_AVAILABLE:
@@ -139,12 +157,14 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
         else:
             Ll1depth = 0
 
+        profiler.phase("backward")
         loss.backward()
 
         iter_end.record()
 
         with torch.no_grad():
             # Progress bar
+            profiler.phase("logging")
             ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
             ema_Ll1depth_for_log = 0.4 * Ll1depth + 0.6 * ema_Ll1depth_for_log
 
@@ -161,12 +181,14 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
                 scene.save(iteration)
 
             # Densification
+            profiler.phase("densification")
             if iteration < opt.densify_until_iter:
                 # Keep track of max radii in image-space for pruning
                 gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
                 gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
 
                 if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0:
+                    profiler.phase("densify_and_prune")
                     size_threshold = 20 if iteration > opt.opacity_reset_interval else None
                     gaussians.densify_and_prune(opt.densify_grad_threshold, 0.005, scene.cameras_extent, size_threshold, radii)
                 
@@ -174,6 +196,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
                     gaussians.reset_opacity()
 
             # Optimizer step
+            profiler.phase("optimizer")
             if iteration < opt.iterations:
                 gaussians.exposure_optimizer.step()
                 gaussians.exposure_optimizer.zero_grad(set_to_none = True)
@@ -186,9 +209,27 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
                     gaussians.optimizer.zero_grad(set_to_none = True)
 
             if (iteration in checkpoint_iterations):
+                profiler.phase("checkpoint")
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
                 torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
 
+            if profiler.enabled:
+                profiler.count("gaussians", gaussians.get_xyz.shape[0])
+                profiler.count("visible", visibility_filter.sum())
+            profiler.step(iteration)
+
+            if budget is not None and budget.update(iteration):
+                saving_iterations = budget.remap(saving_iterations)
+                testing_iterations = budget.remap(testing_iterations)
+                gaussians.setup_lr_schedule(opt)
+                depth_l1_weight = get_expon_lr_func(opt.depth_l1_weight_init, opt.depth_l1_weight_final, max_steps=opt.iterations)
+                progress_bar.total = opt.iterations - first_iter + 1
+                progress_bar.refresh()
+                print("\n[ITER {}] Time budget: schedule scaled by {:.3f}, training for {} iterations".format(iteration, budget.scale, opt.iterations))
+
+    if profiler.enabled:
+        print("\n[PROFILE]\n" + profiler.save(os.path.join(scene.model_path, "profile.txt")))
+
 def prepare_output_and_logger(args):    
     if not args.model_path:
         if os.getenv('OAR_JOB_ID'):
@@ -267,6 +308,11 @@ if __name__ == "__main__":
     parser.add_argument('--disable_viewer', action='store_true', default=False)
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--time_budget", type=float, default=0, help="wall-clock seconds for the training loop, the schedule is rescaled to fit (0 disables)")
+    parser.add_argument("--time_budget_max_scale", type=float, default=1.0, help="allow the time budget to lengthen the schedule up to this factor")
+    parser.add_argument("--profile", action="store_true", help="time the phases of the training loop, the summary is written to profile.txt")
+    parser.add_argument("--profile_device", action="store_true", help="also time the phases on the GPU with CUDA events")
+    parser.add_argument("--profile_trace", action="store_true", help="also write a Chrome trace of every phase to trace.json")
     args = parser.parse_args(sys.argv[1:])
     args.save_iterations.append(args.iterations)
     
@@ -279,7 +325,8 @@ if __name__ == "__main__":
     if not args.disable_viewer:
         network_gui.init(args.ip, args.port)
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
-    training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from)
+    training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, Profiler(args.profile, args.profile_device, args.profile_trace),
+             args.time_budget, args.time_budget_max_scale)
 
     # All done
     print("\nTraining complete.")
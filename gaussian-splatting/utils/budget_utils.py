@@ -0,0 +1,89 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Wall-clock budget for training. Every check_interval iterations the time per
+# iteration of the last window gives the number of iterations the remaining
+# budget still affords, and every milestone of the schedule that has not been
+# reached yet (total iterations, densification end, simplification steps, LR
+# decay length, ...) is moved to its original value times the same scale.
+# Milestones already reached are left alone and a milestone is never moved
+# before the current iteration, so no schedule event is skipped.
+
+import time
+
+
+class TimeBudget:
+    """
+    :param budget: seconds for the training loop, measured from start()
+    :param milestones: list of (object, attribute) holding iteration numbers,
+                       the first one is the total number of iterations
+    :param margin: fraction of the budget kept for evaluation and saving
+    :param min_scale, max_scale: bounds of the scale of the schedule
+    """
+    def __init__(self, budget, milestones, check_interval=500, first_check=200, margin=0.05, min_scale=0.05, max_scale=1.0):
+        self.budget = budget
+        self.milestones = [(obj, attr, getattr(obj, attr)) for obj, attr in milestones]
+        self.check_interval = check_interval
+        self.first_check = first_check
+        self.margin = margin
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale = 1.0
+        self.previous_total = self.total
+        self._start = None
+        self._window = None
+
+    @property
+    def total(self):
+        obj, attr, _ = self.milestones[0]
+        return getattr(obj, attr)
+
+    @property
+    def max_total(self):
+        return int(self.milestones[0][2] * self.max_scale)
+
+    def start(self, iteration):
+        self._start = time.time()
+        self._window = (self._start, iteration)
+        self._next_check = iteration + self.first_check
+
+    def update(self, iteration):
+        """
+        Call at the end of every iteration.
+        :return True when the schedule was rescaled
+        """
+        if iteration < self._next_check or iteration >= self.total:
+            return False
+        now = time.time()
+        window_start, window_iteration = self._window
+        seconds_per_iteration = (now - window_start) / max(iteration - window_iteration, 1)
+        self._window = (now, iteration)
+        self._next_check = iteration + self.check_interval
+
+        remaining = self.budget * (1 - self.margin) - (now - self._start)
+        original_total = self.milestones[0][2]
+        total = iteration + max(remaining, 0) / seconds_per_iteration
+        scale = min(max(total / original_total, self.min_scale), self.max_scale)
+        if abs(scale - self.scale) * original_total < 1:
+            return False
+        self.scale = scale
+        self.previous_total = self.total
+
+        for obj, attr, original in self.milestones:
+            if getattr(obj, attr) > iteration:
+                setattr(obj, attr, max(int(round(original * scale)), iteration + 1))
+        return True
+
+    def remap(self, iterations):
+        """
+        Move the last iteration in a list of iterations (e.g. save_iterations) to the rescaled total.
+        """
+        return [self.total if i == self.previous_total else i for i in iterations]
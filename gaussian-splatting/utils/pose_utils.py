@@ -5,6 +5,34 @@ def normalize(x):
     return x / np.linalg.norm(x)
 
 
+def normalize_rows(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def views_to_poses(views):
+    """Camera to world matrices [N, 4, 4] of views, with OpenGL y/z axes, in one pass."""
+    w2c = np.tile(np.eye(4), (len(views), 1, 1))
+    w2c[:, :3, :3] = np.stack([view.R.T for view in views])
+    w2c[:, :3, 3] = np.stack([view.T for view in views])
+    poses = np.linalg.inv(w2c)
+    poses[:, :, 1:3] *= -1
+    return poses
+
+
+def lookat_render_poses(positions, center, up, transform, radius_scale=1.0):
+    """World to camera matrices [N, 4, 4] looking from positions [N, 3] to center,
+    taken back out of the frame of transform (see transform_poses_pca)."""
+    vec2 = normalize_rows(positions - center)
+    vec0 = normalize_rows(np.cross(up, vec2))
+    vec1 = normalize_rows(np.cross(vec2, vec0))
+    render_poses = np.tile(np.eye(4), (len(positions), 1, 1))
+    render_poses[:, :3] = np.stack([vec0, vec1, vec2, positions], axis=-1)
+    render_poses = np.linalg.inv(transform) @ render_poses
+    render_poses[:, :3, 1:3] *= -1
+    render_poses[:, :3, 3] *= radius_scale
+    return np.linalg.inv(render_poses)
+
+
 def viewmatrix(lookdir, up, position, subtract_position=False):
   """Construct lookat view matrix."""
   vec2 = normalize((lookdir - position) if subtract_position else lookdir)
@@ -107,14 +135,7 @@ def generate_spiral_path_from_views(views, n_frames=600, n_rots=2, z_rate=0.5):
         render_poses: 渲染姿态数组
     """
     # 将views转换为4x4姿态矩阵
-    poses = []
-    for view in views:
-        tmp_view = np.eye(4, 4)
-        tmp_view[:3] = np.concatenate([view.R.T, view.T[:, None]], 1)
-        tmp_view = np.linalg.inv(tmp_view)
-        tmp_view[:, 1:3] *= -1
-        poses.append(tmp_view)
-    poses = np.stack(poses, 0)
+    poses = views_to_poses(views)
     
     # 对姿态进行PCA变换以中心化
     poses, transform = transform_poses_pca(poses)
@@ -135,25 +156,13 @@ def generate_spiral_path_from_views(views, n_frames=600, n_rots=2, z_rate=0.5):
     ind_up = np.argmax(np.abs(avg_up))
     up = np.eye(3)[ind_up] * np.sign(avg_up[ind_up])
     
-    # 生成螺旋路径
-    render_poses = []
-    for theta in np.linspace(0., 2. * np.pi * n_rots, n_frames, endpoint=False):
-        # 计算螺旋上的点
-        t = radii * [np.cos(theta), -np.sin(theta), -np.sin(theta * z_rate), 1.]
-        position = t[:3] + center[:3]  # 添加中心偏移
-        
-        # 创建视图矩阵（相机看向中心点）
-        render_pose = np.eye(4)
-        render_pose[:3] = viewmatrix(position - center, up, position)
-        
-        # 应用逆变换并调整坐标系
-        render_pose = np.linalg.inv(transform) @ render_pose
-        render_pose[:3, 1:3] *= -1
-        
-        # 添加到结果列表
-        render_poses.append(np.linalg.inv(render_pose))
-    
-    return np.stack(render_poses, axis=0)
+    # 生成螺旋路径：一次计算所有帧的位置（相机看向中心点）
+    theta = np.linspace(0., 2. * np.pi * n_rots, n_frames, endpoint=False)
+    t = radii[:3] * np.stack([np.cos(theta), -np.sin(theta), -np.sin(theta * z_rate)], -1)
+    positions = t + center[:3]  # 添加中心偏移
+
+    # 应用逆变换并调整坐标系
+    return lookat_render_poses(positions, center, up, transform)
 
 
 
@@ -272,14 +281,7 @@ def generate_arf_path(views, n_frames=600, radius=0.85):
     return render_poses
 
 def generate_ellipse_path(views, n_frames=600, const_speed=True, z_variation=0., z_phase=0.):
-    poses = []
-    for view in views:
-        tmp_view = np.eye(4,4)
-        tmp_view[:3] = np.concatenate([view.R.T, view.T[:, None]], 1)
-        tmp_view = np.linalg.inv(tmp_view)
-        tmp_view[:, 1:3] *= -1
-        poses.append(tmp_view)
-    poses = np.stack(poses, 0)
+    poses = views_to_poses(views)
 
     poses, transform = transform_poses_pca(poses)
 
@@ -326,16 +328,8 @@ def generate_ellipse_path(views, n_frames=600, const_speed=True, z_variation=0.,
     up = np.eye(3)[ind_up] * np.sign(avg_up[ind_up])
     # up = normalize(poses[:, :3, 1].sum(0))
 
-    render_poses = []
-    for p in positions:
-        render_pose = np.eye(4)
-        render_pose[:3] = viewmatrix(p - center, up, p)
-        render_pose = np.linalg.inv(transform) @ render_pose
-        render_pose[:3, 1:3] *= -1
-        # scale the radius
-        render_pose[:3,3] *= 1.1
-        render_poses.append(np.linalg.inv(render_pose))
-    return render_poses
+    # scale the radius
+    return lookat_render_poses(positions, center, up, transform, radius_scale=1.1)
 
 
 
@@ -9,9 +9,18 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
-from argparse import ArgumentParser, Namespace
+from argparse import ArgumentParser, Namespace, SUPPRESS
 import sys
 import os
+import ast
+import json
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
 
 class GroupParams:
     pass
@@ -91,50 +100,163 @@ class OptimizationParams(ParamGroup):
         self.random_background = False
         super().__init__(parser, "Optimization Parameters")
 
+# Config files are JSON, TOML (Python 3.11+ or tomli) or the "Namespace(key=value, ...)"
+# text of cfg_args, whose values are parsed as literals, never evaluated. "extends" names
+# the file or preset a config starts from, "description" is ignored. A bare name such as
+# "fast" is looked up in the config directory, an extension may be omitted.
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+CONFIG_EXTENSIONS = ["", ".json", ".toml"]
+
+def resolve_config_path(path, base_dir=None):
+    candidates = [path]
+    if base_dir is not None and not os.path.isabs(path):
+        candidates.insert(0, os.path.join(base_dir, path))
+    if os.path.dirname(path) == "":
+        candidates.append(os.path.join(CONFIG_DIR, path))
+    for candidate in candidates:
+        for extension in CONFIG_EXTENSIONS:
+            if os.path.isfile(candidate + extension):
+                return os.path.abspath(candidate + extension)
+    raise FileNotFoundError("Config file not found: {}".format(path))
+
+def _parse_namespace(text, path):
+    tree = ast.parse(text.strip() or "Namespace()", mode="eval").body
+    if not (isinstance(tree, ast.Call) and isinstance(tree.func, ast.Name) and tree.func.id == "Namespace" and not tree.args):
+        raise ValueError("{}: expected Namespace(key=value, ...)".format(path))
+    try:
+        return {keyword.arg: ast.literal_eval(keyword.value) for keyword in tree.keywords}
+    except ValueError:
+        raise ValueError("{}: only literal values are allowed".format(path))
+
+def load_config(path, base_dir=None, _chain=()):
+    """
+    Values of a config file, merged over the configs it extends.
+    """
+    path = resolve_config_path(path, base_dir)
+    if path in _chain:
+        raise ValueError("Circular extends: {}".format(" -> ".join(_chain + (path,))))
+    extension = os.path.splitext(path)[1]
+    if extension == ".toml":
+        if tomllib is None:
+            raise ValueError("{}: reading TOML needs Python 3.11 or the tomli package".format(path))
+        with open(path, "rb") as f:
+            values = tomllib.load(f)
+    else:
+        with open(path) as f:
+            text = f.read()
+        values = json.loads(text) if extension == ".json" else _parse_namespace(text, path)
+    if not isinstance(values, dict):
+        raise ValueError("{}: expected a table of values".format(path))
+
+    parent = values.pop("extends", None)
+    values.pop("description", None)
+    if parent is None:
+        return values
+    merged = load_config(parent, os.path.dirname(path), _chain + (path,))
+    merged.update(values)
+    return merged
+
+def _check_scalar(value_type, choices, key, value):
+    if value is None:
+        return value
+    if value_type is float and isinstance(value, int) and not isinstance(value, bool):
+        value = float(value)
+    elif value_type is int and isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if value_type in (int, float, str) and type(value) is not value_type:
+        raise ValueError("{} must be {}, got {!r}".format(key, value_type.__name__, value))
+    if choices is not None and value not in choices:
+        raise ValueError("{} must be one of {}, got {!r}".format(key, list(choices), value))
+    return value
+
+def _check_value(action, key, value):
+    if action.nargs == 0:
+        if not isinstance(value, bool):
+            raise ValueError("{} must be true or false, got {!r}".format(key, value))
+        return value
+    if action.nargs in ("+", "*"):
+        if not isinstance(value, list):
+            raise ValueError("{} must be a list, got {!r}".format(key, value))
+        return [_check_scalar(action.type, action.choices, key, v) for v in value]
+    return _check_scalar(action.type, action.choices, key, value)
+
+def validate_config(parser : ArgumentParser, values, source=""):
+    """
+    Check the keys and types of config values against the arguments of parser.
+    """
+    actions = {action.dest: action for action in parser._actions if action.dest != "help"}
+    checked = {}
+    for key, value in values.items():
+        if key not in actions:
+            raise ValueError("{}: unknown parameter {}".format(source, key))
+        try:
+            checked[key] = _check_value(actions[key], key, value)
+        except ValueError as e:
+            raise ValueError("{}: {}".format(source, e))
+    return checked
+
+def _explicit_args(parser : ArgumentParser, argv):
+    """
+    Names of the arguments given on the command line.
+    """
+    defaults = [(action, action.default) for action in parser._actions]
+    try:
+        for action, _ in defaults:
+            action.default = SUPPRESS
+        return set(vars(parser.parse_known_args(argv)[0]))
+    finally:
+        for action, default in defaults:
+            action.default = default
+
+def save_config(args, path):
+    """
+    Write the resolved configuration as JSON.
+    """
+    values = {key: value if isinstance(value, (bool, int, float, str, list, type(None))) else str(value) for key, value in vars(args).items()}
+    with open(path, "w") as f:
+        json.dump(values, f, indent=2, sort_keys=True)
+
 def get_combined_args(parser : ArgumentParser):
     cmdlne_string = sys.argv[1:]
-    cfgfile_string = "Namespace()"
     args_cmdline = parser.parse_args(cmdlne_string)
+    args_cfgfile = {}
 
     try:
         cfgfilepath = os.path.join(args_cmdline.model_path, "cfg_args")
         print("Looking for config file in", cfgfilepath)
-        with open(cfgfilepath) as cfg_file:
-            print("Config file found: {}".format(cfgfilepath))
-            cfgfile_string = cfg_file.read()
+        args_cfgfile = load_config(cfgfilepath)
+        print("Config file found: {}".format(cfgfilepath))
     except TypeError:
         print("Config file not found at")
-        pass
-    args_cfgfile = eval(cfgfile_string)
+    except ValueError as e:
+        parser.error(str(e))
 
-    merged_dict = vars(args_cfgfile).copy()
+    merged_dict = args_cfgfile.copy()
     for k,v in vars(args_cmdline).items():
         if v != None:
             merged_dict[k] = v
     return Namespace(**merged_dict)
 
-
-
 def read_config(parser : ArgumentParser):
+    """
+    Command line arguments over the config file given by --config_path over the defaults.
+    """
     cmdlne_string = sys.argv[1:]
-    cfgfile_string = "Namespace()"
     args_cmdline = parser.parse_args(cmdlne_string)
+    if args_cmdline.config_path is None:
+        print("No config file given")
+        return args_cmdline
 
     try:
-        cfgfilepath = os.path.join(args_cmdline.config_path)
-        print("Looking for config file in", cfgfilepath)
-        with open(cfgfilepath) as cfg_file:
-            print("Config file found: {}".format(cfgfilepath))
-            cfgfile_string = cfg_file.read()
-    except TypeError:
-        print("Config file not found at")
-        pass
-    args_cfgfile = eval(cfgfile_string)
+        cfgfilepath = resolve_config_path(args_cmdline.config_path)
+        print("Config file found: {}".format(cfgfilepath))
+        args_cfgfile = validate_config(parser, load_config(cfgfilepath), cfgfilepath)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
 
+    explicit = _explicit_args(parser, cmdlne_string)
     merged_dict = vars(args_cmdline).copy()
-    for k,v in vars(args_cfgfile).items():
-        if k not in merged_dict:
-            merged_dict[k] = v
-        else:
+    for k,v in args_cfgfile.items():
+        if k not in explicit:
             merged_dict[k] = v
     return Namespace(**merged_dict)
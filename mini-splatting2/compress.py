@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import torch
+from scene import Scene
+import os
+import json
+from tqdm import tqdm
+from gaussian_renderer import render
+from utils.general_utils import safe_state
+from utils.image_utils import psnr
+from argparse import ArgumentParser
+from arguments import ModelParams, PipelineParams, get_combined_args
+from gaussian_renderer import GaussianModel
+
+def compress_model(dataset : ModelParams, iteration : int, pipeline : PipelineParams, codebook_size : int, kmeans_iterations : int, skip_eval : bool, tiles : bool, tile_target_count : int, tile_cell_size : float):
+    with torch.no_grad():
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        gaussians = GaussianModel(dataset.sh_degree, device=device)
+        scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+
+        point_cloud_dir = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+        ply_path = os.path.join(point_cloud_dir, "point_cloud.ply")
+        compressed_path = os.path.join(point_cloud_dir, "point_cloud_compressed.npz")
+        stats = gaussians.save_compressed(compressed_path, codebook_size=codebook_size, kmeans_iterations=kmeans_iterations)
+        stats["ply_bytes"] = os.path.getsize(ply_path)
+        stats["ratio"] = stats["ply_bytes"] / stats["bytes"]
+        print("{} Gaussians: {:.1f} MB -> {:.1f} MB ({:.1f}x)".format(stats["num_gaussians"], stats["ply_bytes"] / 2**20, stats["bytes"] / 2**20, stats["ratio"]))
+
+        if tiles:
+            manifest = gaussians.save_tiles(os.path.join(point_cloud_dir, "tiles"), cell_size=tile_cell_size, target_count=tile_target_count,
+                                            codebook_size=codebook_size, kmeans_iterations=kmeans_iterations)
+            stats["tiles"] = len(manifest["tiles"])
+            print("{} tiles written to {}".format(len(manifest["tiles"]), os.path.join(point_cloud_dir, "tiles")))
+
+        if not skip_eval:
+            decoded = GaussianModel(dataset.sh_degree, device=device)
+            decoded.load_compressed(compressed_path)
+
+            bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
+            background = torch.tensor(bg_color, dtype=torch.float32, device=device)
+
+            views = scene.getTestCameras() or scene.getTrainCameras()
+            drift, psnr_ref, psnr_dec = [], [], []
+            for view in tqdm(views, desc="Evaluation progress"):
+                gt = view.original_image[0:3, :, :].to(device)
+                rendering = render(view, gaussians, pipeline, background)["render"].clamp(0.0, 1.0)
+                rendering_dec = render(view, decoded, pipeline, background)["render"].clamp(0.0, 1.0)
+                drift.append(psnr(rendering_dec[None], rendering[None]).item())
+                psnr_ref.append(psnr(rendering[None], gt[None]).item())
+                psnr_dec.append(psnr(rendering_dec[None], gt[None]).item())
+
+            stats["psnr_vs_uncompressed"] = sum(drift) / len(drift)
+            stats["psnr_uncompressed"] = sum(psnr_ref) / len(psnr_ref)
+            stats["psnr_compressed"] = sum(psnr_dec) / len(psnr_dec)
+            print("  PSNR compressed vs uncompressed : {:>12.7f}".format(stats["psnr_vs_uncompressed"]))
+            print("  PSNR uncompressed               : {:>12.7f}".format(stats["psnr_uncompressed"]))
+            print("  PSNR compressed                 : {:>12.7f}".format(stats["psnr_compressed"]))
+
+        with open(os.path.join(point_cloud_dir, "compression.json"), 'w') as fp:
+            json.dump(stats, fp, indent=True)
+
+if __name__ == "__main__":
+    # Set up command line argument parser
+    parser = ArgumentParser(description="Compression script parameters")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--codebook_size", default=4096, type=int)
+    parser.add_argument("--kmeans_iterations", default=10, type=int)
+    parser.add_argument("--skip_eval", action="store_true")
+    parser.add_argument("--tiles", action="store_true")
+    parser.add_argument("--tile_target_count", default=262144, type=int)
+    parser.add_argument("--tile_cell_size", default=None, type=float)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Compressing " + args.model_path)
+
+    # Initialize system state (RNG)
+    safe_state(args.quiet)
+
+    compress_model(model.extract(args), args.iteration, pipeline.extract(args), args.codebook_size, args.kmeans_iterations, args.skip_eval, args.tiles, args.tile_target_count, args.tile_cell_size)
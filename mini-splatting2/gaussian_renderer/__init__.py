@@ -12,26 +12,33 @@
 import torch
 import math
 from scene.gaussian_model import GaussianModel
-from utils.sh_utils import eval_sh
-
-
-
-
-
+from utils.sh_utils import eval_sh_batched
 
 
+def get_rasterizer(means3D, ms=True):
+    """
+    Rasterizer classes matching the device of the Gaussians: the CUDA extensions
+    on the GPU, the pure PyTorch reference rasterizer otherwise.
+    """
+    if not means3D.is_cuda:
+        from gaussian_renderer.cpu_rasterizer import GaussianRasterizationSettings, GaussianRasterizer
+    elif ms:
+        from diff_gaussian_rasterization_ms import GaussianRasterizationSettings, GaussianRasterizer
+    else:
+        from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
+    return GaussianRasterizationSettings, GaussianRasterizer
 
 
 def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor, scaling_modifier = 1.0, override_color = None):
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the device of the Gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    GaussianRasterizationSettings, GaussianRasterizer = get_rasterizer(pc.get_xyz, ms=False)
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -79,10 +86,9 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
     colors_precomp = None
     if override_color is None:
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
             dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
-            sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
+            sh2rgb = eval_sh_batched(pc.active_sh_degree, pc.get_features, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
         else:
             shs = pc.get_features
@@ -90,6 +96,7 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
         colors_precomp = override_color
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
+    # The CPU reference rasterizer also returns the max contribution counts, drop them
     rendered_image, radii = rasterizer(
         means3D = means3D,
         means2D = means2D,
@@ -98,7 +105,7 @@ def render(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tensor,
         opacities = opacity,
         scales = scales,
         rotations = rotations,
-        cov3D_precomp = cov3D_precomp)
+        cov3D_precomp = cov3D_precomp)[:2]
 
     # Those Gaussians that were frustum culled or had a radius of 0 were not visible.
     # They will be excluded from value updates used in the splitting criteria.
@@ -112,12 +119,12 @@ def render_imp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tens
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the device of the Gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    from diff_gaussian_rasterization_ms import GaussianRasterizationSettings, GaussianRasterizer
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    GaussianRasterizationSettings, GaussianRasterizer = get_rasterizer(pc.get_xyz)
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -161,14 +168,14 @@ def render_imp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tens
 
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
+    dc = None
     shs = None
     colors_precomp = None
     if override_color is None:
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
             dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
-            sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
+            sh2rgb = eval_sh_batched(pc.active_sh_degree, pc.get_features, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
         else:
             dc, shs = pc.get_features_dc, pc.get_features_rest
@@ -176,7 +183,7 @@ def render_imp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tens
         colors_precomp = override_color
 
     if culling==None:
-        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device='cuda')
+        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device=means3D.device)
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii, accum_max_count  = rasterizer(
@@ -198,7 +205,7 @@ def render_imp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Tens
     # They will be excluded from value updates used in the splitting criteria.
     return {"render": rendered_image,
             "viewspace_points": screenspace_points,
-            "visibility_filter" : (radii > 0).nonzero(),
+            "visibility_filter" : radii > 0,
             "radii": radii,
             "area_max": accum_max_count,
             }
@@ -208,12 +215,12 @@ def render_simp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the device of the Gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    from diff_gaussian_rasterization_ms import GaussianRasterizationSettings, GaussianRasterizer
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    GaussianRasterizationSettings, GaussianRasterizer = get_rasterizer(pc.get_xyz)
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -257,14 +264,14 @@ def render_simp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
 
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
+    dc = None
     shs = None
     colors_precomp = None
     if override_color is None:
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
             dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
-            sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
+            sh2rgb = eval_sh_batched(pc.active_sh_degree, pc.get_features, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
         else:
             dc, shs = pc.get_features_dc, pc.get_features_rest
@@ -272,7 +279,7 @@ def render_simp(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Ten
         colors_precomp = override_color
 
     if culling==None:
-        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device='cuda')
+        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device=means3D.device)
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     rendered_image, radii, \
@@ -305,12 +312,12 @@ def render_depth(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Te
     """
     Render the scene. 
     
-    Background tensor (bg_color) must be on GPU!
+    Background tensor (bg_color) must be on the device of the Gaussians!
     """
  
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
-    from diff_gaussian_rasterization_ms import GaussianRasterizationSettings, GaussianRasterizer
-    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
+    GaussianRasterizationSettings, GaussianRasterizer = get_rasterizer(pc.get_xyz)
+    screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device=pc.get_xyz.device) + 0
     try:
         screenspace_points.retain_grad()
     except:
@@ -354,14 +361,14 @@ def render_depth(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Te
 
     # If precomputed colors are provided, use them. Otherwise, if it is desired to precompute colors
     # from SHs in Python, do it. If not, then SH -> RGB conversion will be done by rasterizer.
+    dc = None
     shs = None
     colors_precomp = None
     if override_color is None:
         if pipe.convert_SHs_python:
-            shs_view = pc.get_features.transpose(1, 2).view(-1, 3, (pc.max_sh_degree+1)**2)
             dir_pp = (pc.get_xyz - viewpoint_camera.camera_center.repeat(pc.get_features.shape[0], 1))
             dir_pp_normalized = dir_pp/dir_pp.norm(dim=1, keepdim=True)
-            sh2rgb = eval_sh(pc.active_sh_degree, shs_view, dir_pp_normalized)
+            sh2rgb = eval_sh_batched(pc.active_sh_degree, pc.get_features, dir_pp_normalized)
             colors_precomp = torch.clamp_min(sh2rgb + 0.5, 0.0)
         else:
             dc, shs = pc.get_features_dc, pc.get_features_rest
@@ -369,7 +376,7 @@ def render_depth(viewpoint_camera, pc : GaussianModel, pipe, bg_color : torch.Te
         colors_precomp = override_color
 
     if culling==None:
-        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device='cuda')
+        culling=torch.zeros(means3D.shape[0], dtype=torch.bool, device=means3D.device)
 
     # Rasterize visible Gaussians to image, obtain their radii (on screen). 
     res  = rasterizer.render_depth(
@@ -0,0 +1,366 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Pure PyTorch reference implementation of the forward pass of
+# diff_gaussian_rasterization_ms. It follows the CUDA kernels step by step
+# (same culling, tile binning, depth ordering and early termination) so that
+# CPU-only machines can render previews and evaluation frames. There is no
+# backward pass, gradients do not flow through the outputs.
+
+import torch
+import torch.nn as nn
+from typing import NamedTuple
+from utils.sh_utils import C0, eval_sh_batched
+from utils.general_utils import build_rotation, build_scaling_rotation, strip_symmetric
+
+BLOCK_X = 16
+BLOCK_Y = 16
+
+# Number of Gaussians blended at once for one tile, bounds the [chunk, 256] buffers
+CHUNK_SIZE = 512
+
+
+class GaussianRasterizationSettings(NamedTuple):
+    image_height: int
+    image_width: int
+    tanfovx : float
+    tanfovy : float
+    bg : torch.Tensor
+    scale_modifier : float
+    viewmatrix : torch.Tensor
+    projmatrix : torch.Tensor
+    sh_degree : int
+    campos : torch.Tensor
+    prefiltered : bool
+    debug : bool
+
+
+def ndc2Pix(v, S):
+    return ((v + 1.0) * S - 1.0) * 0.5
+
+
+def Pix2ndc(v, S):
+    return (2.0 * v + 1.0) / S - 1.0
+
+
+def preprocess(means3D, opacities, culling, dc, shs, colors_precomp, scales, rotations, cov3D_precomp, raster_settings):
+    """
+    Per-Gaussian part of the rasterizer: culling, projection, 2D covariance,
+    screen-space extent and colour.
+    """
+    H, W = raster_settings.image_height, raster_settings.image_width
+    device = means3D.device
+    viewmatrix = raster_settings.viewmatrix.to(device)
+    projmatrix = raster_settings.projmatrix.to(device)
+    campos = raster_settings.campos.to(device)
+    P = means3D.shape[0]
+
+    # Row vector convention, see Camera.world_view_transform
+    p_view = means3D @ viewmatrix[:3, :3] + viewmatrix[3, :3]
+    p_hom = means3D @ projmatrix[:3] + projmatrix[3]
+    p_proj = p_hom[:, :3] / (p_hom[:, 3:] + 0.0000001)
+
+    if cov3D_precomp is None:
+        L = build_scaling_rotation(raster_settings.scale_modifier * scales, rotations)
+        cov3D_precomp = strip_symmetric(L @ L.transpose(1, 2))
+    Vrk = cov3D_precomp[:, [0, 1, 2, 1, 3, 4, 2, 4, 5]].view(P, 3, 3)
+
+    # EWA splatting, with the same frustum clamping of the Jacobian as the CUDA code
+    focal_x = W / (2.0 * raster_settings.tanfovx)
+    focal_y = H / (2.0 * raster_settings.tanfovy)
+    limx = 1.3 * raster_settings.tanfovx
+    limy = 1.3 * raster_settings.tanfovy
+    tz = p_view[:, 2]
+    tx = (p_view[:, 0] / tz).clamp(-limx, limx) * tz
+    ty = (p_view[:, 1] / tz).clamp(-limy, limy) * tz
+    J = torch.zeros((P, 2, 3), device=device)
+    J[:, 0, 0] = focal_x / tz
+    J[:, 0, 2] = -(focal_x * tx) / (tz * tz)
+    J[:, 1, 1] = focal_y / tz
+    J[:, 1, 2] = -(focal_y * ty) / (tz * tz)
+    T = J @ viewmatrix[:3, :3].T
+    cov = T @ Vrk @ T.transpose(1, 2)
+    cov_x = cov[:, 0, 0] + 0.3
+    cov_y = cov[:, 0, 1]
+    cov_z = cov[:, 1, 1] + 0.3
+
+    det = cov_x * cov_z - cov_y * cov_y
+    det_inv = 1.0 / torch.where(det == 0, torch.ones_like(det), det)
+    conic = torch.stack([cov_z * det_inv, -cov_y * det_inv, cov_x * det_inv], dim=-1)
+
+    opacity = opacities.view(-1)
+    opacity_power_threshold = torch.log(opacity / (1.0 / 255.0))
+    extent = torch.sqrt((2.0 * opacity_power_threshold).clamp_min(0.0)).clamp_max(3.33)
+    mid = 0.5 * (cov_x + cov_z)
+    lam = mid + torch.sqrt((mid * mid - det).clamp_min(0.01))
+    my_radius = extent * torch.sqrt(lam)
+
+    point_image = torch.stack([ndc2Pix(p_proj[:, 0], W), ndc2Pix(p_proj[:, 1], H)], dim=-1)
+    rect_extent = torch.stack([torch.minimum(extent * torch.sqrt(cov_x), my_radius),
+                               torch.minimum(extent * torch.sqrt(cov_z), my_radius)], dim=-1)
+    grid = torch.tensor([(W + BLOCK_X - 1) // BLOCK_X, (H + BLOCK_Y - 1) // BLOCK_Y], device=device)
+    block = torch.tensor([BLOCK_X, BLOCK_Y], device=device)
+    rect_min = torch.floor((point_image - rect_extent) / block).long().clamp_min(0)
+    rect_min = torch.minimum(rect_min, grid)
+    rect_max = torch.ceil((point_image + rect_extent) / block).long().clamp_min(0)
+    rect_max = torch.minimum(rect_max, grid)
+    tiles_touched = (rect_max - rect_min).prod(-1)
+
+    visible = ~culling.to(device).bool() & (tz > 0.2) & (det != 0) & (my_radius > 0) & (tiles_touched > 0)
+    radii = torch.where(visible, torch.ceil(my_radius), torch.zeros_like(my_radius)).int()
+
+    if colors_precomp is None:
+        sh = shs if dc is None else torch.cat((dc, shs), dim=1)
+        colors_precomp = C0 * sh[:, 0]
+        # Gaussians without higher-order coefficients (e.g. baked by bake_sh_dc) skip the view dependent part
+        if raster_settings.sh_degree > 0 and sh.shape[1] > 1:
+            view_dependent = (sh[:, 1:] != 0).any(dim=2).any(dim=1).nonzero().squeeze(-1)
+            dirs = means3D[view_dependent] - campos
+            dirs = dirs / dirs.norm(dim=1, keepdim=True)
+            colors_precomp = colors_precomp.index_copy(0, view_dependent, eval_sh_batched(raster_settings.sh_degree, sh[view_dependent], dirs))
+        colors_precomp = torch.clamp_min(colors_precomp + 0.5, 0.0)
+
+    return {"radii": radii,
+            "visible": visible,
+            "depths": tz,
+            "points_xy_image": point_image,
+            "conic": conic,
+            "opacity": opacity,
+            "colors": colors_precomp,
+            "rect_min": rect_min,
+            "rect_max": rect_max,
+            }
+
+
+def bin_gaussians(geom, raster_settings):
+    """
+    Duplicate every visible Gaussian once per overlapped tile and sort the
+    pairs by tile, then by depth. Returns the Gaussian ids and the [start, end)
+    range of every tile.
+    """
+    device = geom["depths"].device
+    tiles_x = (raster_settings.image_width + BLOCK_X - 1) // BLOCK_X
+    tiles_y = (raster_settings.image_height + BLOCK_Y - 1) // BLOCK_Y
+
+    ids = geom["visible"].nonzero().squeeze(-1)
+    ids = ids[torch.argsort(geom["depths"][ids], stable=True)]
+    rect_min = geom["rect_min"][ids]
+    rect_size = geom["rect_max"][ids] - rect_min
+    counts = rect_size.prod(-1)
+
+    point_list = ids.repeat_interleave(counts)
+    offsets = torch.cumsum(counts, 0) - counts
+    local = torch.arange(point_list.shape[0], device=device) - offsets.repeat_interleave(counts)
+    width = rect_size[:, 0].repeat_interleave(counts)
+    tile_x = rect_min[:, 0].repeat_interleave(counts) + local % width
+    tile_y = rect_min[:, 1].repeat_interleave(counts) + local // width
+    tile_id = tile_y * tiles_x + tile_x
+
+    tile_id, order = torch.sort(tile_id, stable=True)
+    point_list = point_list[order]
+    num = torch.bincount(tile_id, minlength=tiles_x * tiles_y)
+    ends = torch.cumsum(num, 0)
+    return point_list, ends - num, ends
+
+
+def _ray_directions(raster_settings, pix, device):
+    # Unproject every pixel on the far-ish plane exactly like renderDepthCUDA
+    W, H = raster_settings.image_width, raster_settings.image_height
+    projmatrix_inv = torch.inverse(raster_settings.projmatrix.to(device))
+    campos = raster_settings.campos.to(device)
+    p_hom = torch.stack([Pix2ndc(pix[:, 0], W) * 1.0000001,
+                         Pix2ndc(pix[:, 1], H) * 1.0000001,
+                         torch.full_like(pix[:, 0], (100 - 100 * 0.01) / (100 - 0.01))], dim=-1)
+    p_orig = p_hom @ projmatrix_inv[:3, :3] + projmatrix_inv[3, :3]
+    ray_direction = p_orig - campos
+    return ray_direction / ray_direction.norm(dim=-1, keepdim=True), ray_direction.norm(dim=-1)
+
+
+def _gather(values, arg):
+    return values.gather(0, arg[None]).squeeze(0)
+
+
+@torch.no_grad()
+def rasterize(raster_settings, means3D, opacities, culling, dc, shs, colors_precomp, scales, rotations, cov3D_precomp, mode="forward", flag_max_count=False):
+    """
+    Tile based alpha blending of the preprocessed Gaussians.
+    :param mode: "forward", "simp" or "depth", selects the auxiliary buffers of the matching CUDA entry point
+    """
+    H, W = raster_settings.image_height, raster_settings.image_width
+    device = means3D.device
+    P = means3D.shape[0]
+    if culling is None:
+        culling = torch.zeros(P, dtype=torch.bool, device=device)
+    bg = raster_settings.bg.to(device)
+
+    geom = preprocess(means3D, opacities, culling, dc, shs, colors_precomp, scales, rotations, cov3D_precomp, raster_settings)
+    point_list, tile_start, tile_end = bin_gaussians(geom, raster_settings)
+    xy, conic, opacity, colors = geom["points_xy_image"], geom["conic"], geom["opacity"], geom["colors"]
+    C = colors.shape[1]
+
+    out_color = bg.view(C, 1).repeat(1, H * W)
+    final_T = torch.ones(H * W, device=device)
+    accum_max_count = torch.zeros(P, device=device)
+    accum_weights_p = torch.zeros(P, device=device)
+    accum_weights_count = torch.zeros(P, dtype=torch.int32, device=device)
+
+    if mode == "depth":
+        campos = raster_settings.campos.to(device)
+        R = build_rotation(rotations)
+        # Gaussians are intersected as ellipsoids of 3 sigma, in their local frame
+        inv_scale = 1.0 / (3.0 * scales)
+        rotated_origin = torch.einsum("nji,nj->ni", R, campos - means3D) * inv_scale
+        out_pts = torch.zeros((3, H * W), device=device)
+        out_depth = torch.zeros(H * W, device=device)
+        discriminants = torch.zeros(H * W, device=device)
+        gidx = torch.zeros(H * W, dtype=torch.int32, device=device)
+
+    tiles_x = (W + BLOCK_X - 1) // BLOCK_X
+    tile_start, tile_end = tile_start.tolist(), tile_end.tolist()
+    for tile in range(len(tile_start)):
+        if tile_start[tile] == tile_end[tile]:
+            continue
+        x0, y0 = (tile % tiles_x) * BLOCK_X, (tile // tiles_x) * BLOCK_Y
+        py, px = torch.meshgrid(torch.arange(y0, min(y0 + BLOCK_Y, H), device=device),
+                                torch.arange(x0, min(x0 + BLOCK_X, W), device=device), indexing="ij")
+        pix_id = (py * W + px).reshape(-1)
+        pix = torch.stack([px.reshape(-1), py.reshape(-1)], dim=-1).float()
+        num_pix = pix.shape[0]
+
+        T = torch.ones(num_pix, device=device)
+        done = torch.zeros(num_pix, dtype=torch.bool, device=device)
+        color = torch.zeros((num_pix, C), device=device)
+        weight_max = torch.zeros(num_pix, device=device)
+        idx_max = torch.zeros(num_pix, dtype=torch.long, device=device)
+        if mode == "depth":
+            ray_dir, ray_len = _ray_directions(raster_settings, pix, device)
+            depth_max = torch.zeros(num_pix, device=device)
+            discriminant_max = torch.zeros(num_pix, device=device)
+            t_max = torch.zeros(num_pix, device=device)
+
+        ids = point_list[tile_start[tile]:tile_end[tile]]
+        for lo in range(0, ids.shape[0], CHUNK_SIZE):
+            g = ids[lo:lo + CHUNK_SIZE]
+            dx = xy[g, 0:1] - pix[None, :, 0]
+            dy = xy[g, 1:2] - pix[None, :, 1]
+            con = conic[g]
+            power = -0.5 * (con[:, 0:1] * dx * dx + con[:, 2:3] * dy * dy) - con[:, 1:2] * dx * dy
+            alpha = torch.clamp_max(opacity[g, None] * torch.exp(power), 0.99)
+            valid = (power <= 0) & (alpha >= 1.0 / 255.0) & ~done[None]
+            alpha = alpha * valid
+
+            if mode == "depth":
+                rotated_dir = torch.einsum("gji,pj->gpi", R[g], ray_dir) * inv_scale[g, None]
+                ro = rotated_origin[g, None]
+                a = (rotated_dir * rotated_dir).sum(-1)
+                b = 2 * (rotated_dir * ro).sum(-1)
+                c = (ro * ro).sum(-1) - 1
+                t = -b / 2 / a
+                depth = t / ray_len[None]
+                # Gaussians behind the ray origin are blended but do not occlude
+                blend = valid & (depth >= 0)
+                one_minus_alpha = 1 - alpha * blend
+            else:
+                one_minus_alpha = 1 - alpha
+
+            # Transmittance in front of every Gaussian, the pixel is cut off at the
+            # first Gaussian that would drop it below the threshold
+            T_back = T[None] * torch.cumprod(one_minus_alpha, dim=0)
+            T_front = torch.cat([T[None], T_back[:-1]])
+            stop = valid & (T_front * (1 - alpha) < 0.0001)
+            stopped = stop.any(0)
+            first_stop = torch.where(stopped, stop.byte().argmax(0), torch.full_like(T, g.shape[0], dtype=torch.long))
+            contrib = valid & (torch.arange(g.shape[0], device=device)[:, None] < first_stop[None])
+            weights = alpha * T_front * contrib
+
+            color += weights.T @ colors[g]
+            T = torch.where(stopped, _gather(T_front, first_stop.clamp_max(g.shape[0] - 1)), T_back[-1])
+            done |= stopped
+
+            candidates = weights if mode != "depth" else weights * blend
+            chunk_max, arg = candidates.max(0)
+            update = chunk_max > weight_max
+            weight_max = torch.where(update, chunk_max, weight_max)
+            idx_max = torch.where(update, g[arg], idx_max)
+            if mode == "depth":
+                depth_max = torch.where(update, _gather(depth, arg), depth_max)
+                discriminant_max = torch.where(update, _gather(b * b - 4 * a * c, arg), discriminant_max)
+                t_max = torch.where(update, _gather(t, arg), t_max)
+            if mode == "simp":
+                accum_weights_p.index_add_(0, g, weights.sum(1))
+                accum_weights_count.index_add_(0, g, contrib.sum(1).int())
+
+            if done.all():
+                break
+
+        out_color[:, pix_id] = (color + T[:, None] * bg[None]).T
+        final_T[pix_id] = T
+        if mode == "simp" or flag_max_count:
+            accum_max_count.index_add_(0, idx_max[weight_max > 0], torch.ones_like(weight_max[weight_max > 0]))
+        if mode == "depth":
+            out_pts[:, pix_id] = torch.where((weight_max > 0)[:, None], campos + t_max[:, None] * ray_dir, torch.zeros_like(ray_dir)).T
+            out_depth[pix_id] = depth_max
+            discriminants[pix_id] = discriminant_max
+            gidx[pix_id] = idx_max.int()
+
+    out_color = out_color.view(C, H, W)
+    if mode == "depth":
+        return {"render": out_color,
+                "out_pts": out_pts.view(3, H, W),
+                "rendered_depth": out_depth.view(1, H, W),
+                "discriminants": discriminants.view(1, H, W),
+                "gidx": gidx.view(1, H, W),
+                "accum_alpha": final_T.view(1, H, W),
+                }
+    if mode == "simp":
+        return out_color, geom["radii"], accum_weights_p, accum_weights_count, accum_max_count
+    return out_color, geom["radii"], accum_max_count
+
+
+class GaussianRasterizer(nn.Module):
+    """
+    Drop-in CPU replacement of diff_gaussian_rasterization_ms.GaussianRasterizer.
+    Also accepts the arguments of the plain diff_gaussian_rasterization rasterizer
+    (no culling, dc folded into shs).
+    """
+    def __init__(self, raster_settings):
+        super().__init__()
+        self.raster_settings = raster_settings
+
+    def markVisible(self, positions):
+        with torch.no_grad():
+            viewmatrix = self.raster_settings.viewmatrix.to(positions.device)
+            p_view = positions @ viewmatrix[:3, :3] + viewmatrix[3, :3]
+        return p_view[:, 2] > 0.2
+
+    def _check_args(self, shs, colors_precomp, scales, rotations, cov3D_precomp):
+        if (shs is None and colors_precomp is None) or (shs is not None and colors_precomp is not None):
+            raise Exception('Please provide excatly one of either SHs or precomputed colors!')
+
+        if ((scales is None or rotations is None) and cov3D_precomp is None) or ((scales is not None or rotations is not None) and cov3D_precomp is not None):
+            raise Exception('Please provide exactly one of either scale/rotation pair or precomputed 3D covariance!')
+
+    def forward(self, means3D, means2D, opacities, culling = None, dc = None, shs = None, colors_precomp = None, scales = None, rotations = None, cov3D_precomp = None, flag_max_count=False):
+        self._check_args(shs, colors_precomp, scales, rotations, cov3D_precomp)
+        return rasterize(self.raster_settings, means3D, opacities, culling, dc, shs, colors_precomp,
+                         scales, rotations, cov3D_precomp, mode="forward", flag_max_count=flag_max_count)
+
+    def render_simp(self, means3D, means2D, opacities, culling = None, dc = None, shs = None, colors_precomp = None, scales = None, rotations = None, cov3D_precomp = None):
+        self._check_args(shs, colors_precomp, scales, rotations, cov3D_precomp)
+        return rasterize(self.raster_settings, means3D, opacities, culling, dc, shs, colors_precomp,
+                         scales, rotations, cov3D_precomp, mode="simp")
+
+    def render_depth(self, means3D, means2D, opacities, culling = None, dc = None, shs = None, colors_precomp = None, scales = None, rotations = None, cov3D_precomp = None):
+        self._check_args(shs, colors_precomp, scales, rotations, cov3D_precomp)
+        if scales is None:
+            raise Exception('Depth rendering intersects the scale/rotation ellipsoids, precomputed 3D covariances are not supported!')
+        return rasterize(self.raster_settings, means3D, opacities, culling, dc, shs, colors_precomp,
+                         scales, rotations, cov3D_precomp, mode="depth")
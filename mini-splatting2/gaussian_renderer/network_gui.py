@@ -3,18 +3,45 @@
 # GRAPHDECO research group, https://team.inria.fr/graphdeco
 # All rights reserved.
 #
-# This software is free for non-commercial, research and evaluation use 
+# This software is free for non-commercial, research and evaluation use
 # under the terms of the LICENSE.md file.
 #
 # For inquiries contact  george.drettakis@inria.fr
 #
 
-import torch
-import traceback
-import socket
+# Network viewer server. Socket I/O runs on background threads: a reader
+# keeps only the latest camera request of the client (mailbox), a sender
+# encodes and writes the frames. The training loop calls serve() once per
+# iteration, which renders at most one frame when one is due and only blocks
+# while the viewer has paused training. Alternatively frames are rendered on
+# a viewer thread from a parameter snapshot, see snapshot_interval below.
+#
+# Protocol, every client message is a uint32 length followed by JSON. The
+# reply to a message with a camera is the frame followed by the uint32 length
+# prefixed verification string. Optional message fields:
+#   encoding      "raw" (default, width*height*3 bytes), "jpeg" or "webp",
+#                 encoded frames are prefixed by their uint32 length. They
+#                 need Pillow, without it the client is disconnected
+#   quality       encoder quality, 85 by default
+#   frame_width, frame_height   render resolution, resolution_x/y by default
+
+import io
+import copy
+import time
 import json
+import queue
+import socket
+import threading
+import traceback
+import torch
 from scene.cameras import MiniCam
 
+try:
+    from PIL import Image
+    PIL_FOUND = True
+except ImportError:
+    PIL_FOUND = False
+
 host = "127.0.0.1"
 port = 6009
 
@@ -23,64 +50,259 @@ addr = None
 
 listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
-def init(wish_host, wish_port):
-    global host, port, listener
+max_fps = 30.0
+iters_per_frame = 1
+
+_lock = threading.Condition()
+_request = None
+_state = {"train": True, "keep_alive": False, "last_frame": 0.0, "last_iteration": None, "verify": ""}
+_outbox = queue.Queue(maxsize=2)
+
+_listening = None
+_threads = set()
+
+def init(wish_host, wish_port, wish_max_fps=30.0, wish_iters_per_frame=1, wish_snapshot_interval=0, wish_budget=0.1):
+    """
+    Start the server. Can be called again in the same process (training
+    worker), the viewer of the previous run is then disconnected and the
+    listener is only rebound when the address changes.
+    """
+    global host, port, listener, max_fps, iters_per_frame, snapshot_interval, budget, _listening, _snapshot
     host = wish_host
     port = wish_port
-    listener.bind((host, port))
-    listener.listen()
-    listener.settimeout(0)
+    max_fps = wish_max_fps
+    iters_per_frame = wish_iters_per_frame
+    snapshot_interval = wish_snapshot_interval
+    budget = min(max(wish_budget, 1e-3), 1.0)
 
-def try_connect():
-    global conn, addr, listener
-    try:
-        conn, addr = listener.accept()
+    _disconnect()
+    with _lock:
+        # Drop the references to the model of a previous run
+        _snapshot = None
+        _state.pop("render_fn", None)
+        _state.pop("pipe", None)
+        _state["last_frame"], _state["last_iteration"] = 0.0, None
+
+    if _listening != (host, port):
+        if _listening is not None:
+            listener.close()
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind((host, port))
+        listener.listen()
+        _listening = (host, port)
+        threading.Thread(target=_accept_loop, args=(listener,), daemon=True).start()
+    _start_once(_send_loop)
+    if snapshot_interval > 0:
+        _start_once(_viewer_loop)
+
+def _start_once(target):
+    if target not in _threads:
+        _threads.add(target)
+        threading.Thread(target=target, daemon=True).start()
+
+def _accept_loop(sock):
+    global conn, addr
+    while True:
+        try:
+            new_conn, new_addr = sock.accept()
+        except OSError:
+            return
+        new_conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        _disconnect()
+        with _lock:
+            conn, addr = new_conn, new_addr
+            _state["train"] = True
+            _state["keep_alive"] = False
         print(f"\nConnected by {addr}")
-        conn.settimeout(None)
-    except Exception as inst:
-        pass
-            
-def read():
-    global conn
-    messageLength = conn.recv(4)
-    messageLength = int.from_bytes(messageLength, 'little')
-    message = conn.recv(messageLength)
-    return json.loads(message.decode("utf-8"))
-
-def send(message_bytes, verify):
-    global conn
-    if message_bytes != None:
-        conn.sendall(message_bytes)
-    conn.sendall(len(verify).to_bytes(4, 'little'))
-    conn.sendall(bytes(verify, 'ascii'))
-
-def receive():
-    message = read()
-
-    width = message["resolution_x"]
-    height = message["resolution_y"]
-
-    if width != 0 and height != 0:
+        threading.Thread(target=_read_loop, args=(new_conn,), daemon=True).start()
+
+def _disconnect(sock=None):
+    global conn, addr, _request
+    with _lock:
+        if conn is None or (sock is not None and conn is not sock):
+            return
         try:
-            do_training = bool(message["train"])
-            fovy = message["fov_y"]
-            fovx = message["fov_x"]
-            znear = message["z_near"]
-            zfar = message["z_far"]
-            do_shs_python = bool(message["shs_python"])
-            do_rot_scale_python = bool(message["rot_scale_python"])
-            keep_alive = bool(message["keep_alive"])
-            scaling_modifier = message["scaling_modifier"]
-            world_view_transform = torch.reshape(torch.tensor(message["view_matrix"]), (4, 4)).cuda()
-            world_view_transform[:,1] = -world_view_transform[:,1]
-            world_view_transform[:,2] = -world_view_transform[:,2]
-            full_proj_transform = torch.reshape(torch.tensor(message["view_projection_matrix"]), (4, 4)).cuda()
-            full_proj_transform[:,1] = -full_proj_transform[:,1]
-            custom_cam = MiniCam(width, height, fovy, fovx, znear, zfar, world_view_transform, full_proj_transform)
+            conn.close()
+        except OSError:
+            pass
+        conn, addr, _request = None, None, None
+        _lock.notify_all()
+
+def _recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("viewer disconnected")
+        data += chunk
+    return bytes(data)
+
+def read(sock):
+    message_length = int.from_bytes(_recv_exact(sock, 4), 'little')
+    return json.loads(_recv_exact(sock, message_length).decode("utf-8"))
+
+def _read_loop(sock):
+    global _request
+    try:
+        while True:
+            message = read(sock)
+            with _lock:
+                if message["resolution_x"] != 0 and message["resolution_y"] != 0:
+                    _state["train"] = bool(message["train"])
+                    _state["keep_alive"] = bool(message["keep_alive"])
+                    # Only the latest camera matters, an unanswered older request is replaced
+                    _request = message
+                    _lock.notify_all()
+                    continue
+            # No camera: answer right away with the verification string only
+            _outbox.put((sock, None, None))
+    except Exception:
+        _disconnect(sock)
+
+def _encode(image, message):
+    encoding = message.get("encoding", "raw")
+    if encoding == "raw":
+        return image.tobytes(), False
+    if not PIL_FOUND:
+        # A raw frame instead would break the framing the client expects
+        raise RuntimeError("the viewer asked for {} frames, which need Pillow".format(encoding))
+    buffer = io.BytesIO()
+    quality = int(message.get("quality", 85))
+    try:
+        Image.fromarray(image).save(buffer, format="WEBP" if encoding == "webp" else "JPEG", quality=quality)
+    except (KeyError, OSError):
+        # Pillow built without WebP
+        buffer = io.BytesIO()
+        Image.fromarray(image).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue(), True
+
+def _send_loop():
+    while True:
+        sock, image, message = _outbox.get()
+        try:
+            if image is not None:
+                payload, prefixed = _encode(image, message)
+                if prefixed:
+                    sock.sendall(len(payload).to_bytes(4, 'little'))
+                sock.sendall(payload)
+            verify = _state["verify"]
+            sock.sendall(len(verify).to_bytes(4, 'little'))
+            sock.sendall(bytes(verify, 'ascii'))
+        except OSError:
+            _disconnect(sock)
         except Exception as e:
-            print("")
-            traceback.print_exc()
-            raise e
-        return custom_cam, do_training, do_shs_python, do_rot_scale_python, keep_alive, scaling_modifier
-    else:
-        return None, None, None, None, None, None
\ No newline at end of file
+            print("\nDisconnecting the viewer: {}".format(e))
+            _disconnect(sock)
+
+def _make_camera(message, device):
+    width = message.get("frame_width", message["resolution_x"])
+    height = message.get("frame_height", message["resolution_y"])
+    world_view_transform = torch.reshape(torch.tensor(message["view_matrix"]), (4, 4)).to(device)
+    world_view_transform[:,1] = -world_view_transform[:,1]
+    world_view_transform[:,2] = -world_view_transform[:,2]
+    full_proj_transform = torch.reshape(torch.tensor(message["view_projection_matrix"]), (4, 4)).to(device)
+    full_proj_transform[:,1] = -full_proj_transform[:,1]
+    return MiniCam(width, height, message["fov_y"], message["fov_x"], message["z_near"], message["z_far"], world_view_transform, full_proj_transform)
+
+def _frame_due(iteration, holding):
+    if time.time() - _state["last_frame"] < 1.0 / max_fps:
+        return False
+    last = _state["last_iteration"]
+    return holding or last is None or iteration - last >= iters_per_frame or iteration < last
+
+def _render_message(render_fn, gaussians, pipe, message, sock):
+    try:
+        # The training loop keeps reading pipe, the viewer options only apply to this frame
+        pipe = copy.copy(pipe)
+        pipe.convert_SHs_python = bool(message["shs_python"])
+        pipe.compute_cov3D_python = bool(message["rot_scale_python"])
+        with torch.no_grad():
+            camera = _make_camera(message, gaussians.get_xyz.device)
+            image = render_fn(gaussians, camera, message["scaling_modifier"])
+            image = (torch.clamp(image, min=0, max=1.0) * 255).byte().permute(1, 2, 0).contiguous().cpu().numpy()
+        _outbox.put((sock, image, message))
+    except Exception:
+        print("")
+        traceback.print_exc()
+        _disconnect(sock)
+
+def serve(render_fn, gaussians, verify, pipe, iteration, last_iteration):
+    """
+    Training loop hook, call once per iteration.
+    :param render_fn: (gaussians, camera, scaling_modifier) -> image [3, H, W] in [0, 1]
+    :param verify: verification string sent after every frame (the source path)
+    Renders at most one frame when the viewer waits for one and the frame
+    budget (max_fps, iters_per_frame) allows it. Blocks while the viewer has
+    paused training, or after the last iteration when it asked to keep alive.
+    With a snapshot interval the frames are rendered on a separate thread, see
+    _serve_snapshot.
+    """
+    global _request
+    _state["verify"] = verify
+    if snapshot_interval > 0:
+        _serve_snapshot(render_fn, gaussians, pipe, iteration, last_iteration)
+        return
+    while conn is not None:
+        with _lock:
+            holding = not _state["train"] or (_state["keep_alive"] and iteration >= last_iteration)
+            if holding and _request is None:
+                _lock.wait(timeout=0.1)
+            message = None
+            if _request is not None and _frame_due(iteration, holding):
+                message, _request = _request, None
+            sock = conn
+        if message is not None:
+            _render_message(render_fn, gaussians, pipe, message, sock)
+            _state["last_frame"] = time.time()
+            _state["last_iteration"] = iteration
+        if not holding:
+            return
+        if message is None:
+            time.sleep(0.001)
+
+# Snapshot mode: the training loop only refreshes a read-only copy of the
+# parameters every snapshot_interval iterations, a viewer thread renders from
+# it. This decouples the viewer from the training loop on the CPU side only:
+# the rasterizer launches on the default CUDA stream, so viewer kernels still
+# queue with the training kernels. After a frame that took t seconds the
+# viewer thread idles t * (1 - budget) / budget, so previews use about a
+# fraction budget of the device time whatever the resolution the client asks for.
+
+snapshot_interval = 0
+budget = 0.1
+
+_snapshot = None
+
+def _make_snapshot(gaussians, iteration):
+    # Copied on the default stream, which the viewer renders on as well
+    return {"gaussians": gaussians.snapshot(), "iteration": iteration}
+
+def _serve_snapshot(render_fn, gaussians, pipe, iteration, last_iteration):
+    global _snapshot
+    if conn is None:
+        return
+    _state["render_fn"], _state["pipe"] = render_fn, pipe
+    if _snapshot is None or iteration - _snapshot["iteration"] >= snapshot_interval or iteration < _snapshot["iteration"]:
+        _snapshot = _make_snapshot(gaussians, iteration)
+    while conn is not None:
+        holding = not _state["train"] or (_state["keep_alive"] and iteration >= last_iteration)
+        if not holding:
+            return
+        if _snapshot["iteration"] != iteration:
+            _snapshot = _make_snapshot(gaussians, iteration)
+        time.sleep(0.01)
+
+def _viewer_loop():
+    global _request
+    while True:
+        with _lock:
+            while _request is None or _snapshot is None or "render_fn" not in _state:
+                _lock.wait(timeout=0.1)
+            message, _request = _request, None
+            snapshot, sock = _snapshot, conn
+        if sock is None:
+            continue
+        start = time.time()
+        _render_message(_state["render_fn"], snapshot["gaussians"], _state["pipe"], message, sock)
+        elapsed = time.time() - start
+        time.sleep(max(1.0 / max_fps - elapsed, elapsed * (1 - budget) / budget))
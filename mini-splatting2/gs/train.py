@@ -2,145 +2,219 @@ import os
 import sys
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(os.path.abspath(os.path.join(BASE_DIR, '..')))
+from utils.startup_utils import StartupTimer
+startup = StartupTimer("--startup_report" in sys.argv)
 
 
 import torch
 from random import randint
-from utils.loss_utils import l1_loss, ssim
+from utils.loss_utils import l1_loss
 from fused_ssim import fused_ssim
 
 from gaussian_renderer import network_gui
 from gaussian_renderer import render_imp as render
 import sys
 from scene import Scene, GaussianModel
-from utils.general_utils import safe_state
+from utils.general_utils import safe_state, batch_lr_scale
+from utils.sync_utils import SyncCounter, TrainingMetrics
+from utils.profile_utils import Profiler
+from utils.eval_utils import Evaluator, EVAL_MODES
+from utils.snapshot_utils import SnapshotWriter
+from utils.checkpoint_utils import load_checkpoint
+from utils.budget_utils import scale_schedule, scale_iterations
 import uuid
 from tqdm import tqdm
-from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams, read_config
-try:
-    from torch.utils.tensorboard import SummaryWriter
-    TENSORBOARD_FOUND = True
-except ImportError:
-    TENSORBOARD_FOUND = False
+from importlib.util import find_spec
+# torch.utils.tensorboard is imported when the writer is created
+TENSORBOARD_FOUND = find_spec("tensorboard") is not None
 
 import numpy as np
-from lpipsPyTorch import lpips
 from utils.sh_utils import SH2RGB
 import time
+startup.mark("imports")
 
 
 
-def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from):
+def schedule_milestones(opt, args):
+    """
+    (object, attribute) of every iteration number of the schedule, the total number of iterations first.
+    """
+    return [(opt, "iterations"), (opt, "densify_from_iter"), (opt, "densify_until_iter"), (opt, "position_lr_max_steps")]
+
+
+def schedule_intervals(opt, args):
+    return [(opt, "densification_interval"), (opt, "opacity_reset_interval")]
+
+
+def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, args):
     first_iter = 0
     tb_writer = prepare_output_and_logger(dataset)
     gaussians = GaussianModel(dataset.sh_degree)
     scene = Scene(dataset, gaussians)
-    gaussians.training_setup(opt)
-    if checkpoint:
-        (model_params, first_iter) = torch.load(checkpoint)
-        gaussians.restore(model_params, opt)
-
-    bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
-
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
-
-    viewpoint_stack = None
-    ema_loss_for_log = 0.0
-    progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
-    first_iter += 1
-    gaussians.init_culling(len(scene.getTrainCameras()))
-    for iteration in range(first_iter, opt.iterations + 1):        
-        if network_gui.conn == None:
-            network_gui.try_connect()
-        while network_gui.conn != None:
-            try:
-                net_image_bytes = None
-                custom_cam, do_training, pipe.convert_SHs_python, pipe.compute_cov3D_python, keep_alive, scaling_modifer = network_gui.receive()
-                if custom_cam != None:
-                    net_image = render(custom_cam, gaussians, pipe, background, scaling_modifer)["render"]
-                    net_image_bytes = memoryview((torch.clamp(net_image, min=0, max=1.0) * 255).byte().permute(1, 2, 0).contiguous().cpu().numpy())
-                network_gui.send(net_image_bytes, dataset.source_path)
-                if do_training and ((iteration < int(opt.iterations)) or not keep_alive):
-                    break
-            except Exception as e:
-                network_gui.conn = None
-
-        iter_start.record()
-
-        gaussians.update_learning_rate(iteration)
-
-        # Every 1000 its we increase the levels of SH up to a maximum degree
-        if iteration % 1000 == 0:
-            gaussians.oneupSHdegree()
-
-        # Pick a random Camera
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
-
-        # Render
-        if (iteration - 1) == debug_from:
-            pipe.debug = True
-
-        bg = torch.rand((3), device="cuda") if opt.random_background else background
-
-        render_pkg = render(viewpoint_cam, gaussians, pipe, bg)
-        
-        image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
-
-        # Loss
-        gt_image = viewpoint_cam.original_image.cuda()
-        Ll1 = l1_loss(image, gt_image)
-        ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
-
-        loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim_value)
-        loss.backward()
-
-        iter_end.record()
-
-        with torch.no_grad():
-            # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
-            if iteration % 10 == 0:
-                progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
-                progress_bar.update(10)
-            if iteration == opt.iterations:
-                progress_bar.close()
-
-            # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), testing_iterations, scene, render, (pipe, background))
-            if (iteration in saving_iterations):
-                print("\n[ITER {}] Saving Gaussians".format(iteration))
-                scene.save(iteration)
-
-            # Densification
-            if iteration < opt.densify_until_iter:
-                # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
-                gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
-
-                if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0:
-                    size_threshold = 20 if iteration > opt.opacity_reset_interval else None
-                    gaussians.densify_and_prune(opt.densify_grad_threshold, 0.005, scene.cameras_extent, size_threshold)
+    startup.mark("scene")
+    snapshot_writer = SnapshotWriter(scene.model_path, checkpoint_format=args.checkpoint_format, fp16_moments=args.fp16_moments)
+    evaluator = Evaluator(args.eval_mode, tb_writer)
+    try:
+        gaussians.lr_scale = batch_lr_scale(args.batch_size, args.batch_lr_scaling)
+        sh_interval = 1000
+        if args.batch_size > 1:
+            # batch_size views per step: the same views seen in 1 / batch_size of the steps
+            scale = 1.0 / args.batch_size
+            scale_schedule(schedule_milestones(opt, args) + schedule_intervals(opt, args), scale)
+            testing_iterations = scale_iterations(testing_iterations, scale)
+            saving_iterations = scale_iterations(saving_iterations, scale)
+            checkpoint_iterations = scale_iterations(checkpoint_iterations, scale)
+            sh_interval = max(int(round(sh_interval * scale)), 1)
+        gaussians.training_setup(opt)
+        if checkpoint:
+            (model_params, first_iter, checkpoint_extras) = load_checkpoint(checkpoint)
+            gaussians.restore(model_params, opt)
+
+        bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+
+        iter_start = torch.cuda.Event(enable_timing = True)
+        iter_end = torch.cuda.Event(enable_timing = True)
+
+        viewpoint_stack = None
+        ema_loss_for_log = 0.0
+        metrics = TrainingMetrics(args.sync_interval) if args.low_sync else None
+        sync_counter = SyncCounter() if args.count_syncs else None
+        profiler = Profiler(args.profile, args.profile_device, args.profile_trace)
+        progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
+        first_iter += 1
+        gaussians.init_culling(len(scene.getTrainCameras()))
+        if checkpoint and "culling" in checkpoint_extras:
+            gaussians._culling = checkpoint_extras["culling"].to(gaussians.device)
+            gaussians.factor_culling = checkpoint_extras["factor_culling"].to(gaussians.device)
+        for iteration in range(first_iter, opt.iterations + 1):        
+            profiler.phase("viewer")
+            if network_gui.conn != None:
+                network_gui.serve(lambda model, custom_cam, scaling_modifer: render(custom_cam, model, pipe, background, scaling_modifer)["render"],
+                                  gaussians, dataset.source_path, pipe, iteration, opt.iterations)
+
+            if metrics is not None:
+                iter_start, iter_end = metrics.events()
+            iter_start.record()
+
+            profiler.phase("setup")
+            gaussians.update_learning_rate(iteration)
+
+            # Every 1000 its we increase the levels of SH up to a maximum degree
+            if iteration % sh_interval == 0:
+                gaussians.oneupSHdegree()
+
+            # Render
+            if (iteration - 1) == debug_from:
+                pipe.debug = True
+
+            # Every view of the batch is backpropagated on its own, the viewspace gradients stay per view for the densification statistics
+            Ll1_batch, loss_batch, visible = 0.0, 0.0, None
+            for _ in range(args.batch_size):
+                # Pick a random Camera
+                if not viewpoint_stack:
+                    viewpoint_stack = scene.getTrainCameras().copy()
+                viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+
+                profiler.phase("render")
+                bg = torch.rand((3), device="cuda") if opt.random_background else background
+
+                render_pkg = render(viewpoint_cam, gaussians, pipe, bg)
+
+                image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
+
+                # Loss
+                profiler.phase("loss")
+                gt_image = viewpoint_cam.original_image.cuda()
+                Ll1 = l1_loss(image, gt_image)
+                ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
+
+                loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim_value)
+                profiler.phase("backward")
+                loss.backward()
+
+                with torch.no_grad():
+                    Ll1_batch, loss_batch = Ll1_batch + Ll1.detach(), loss_batch + loss.detach()
+                    visible = visibility_filter if visible is None else torch.logical_or(visible, visibility_filter)
+
+                    if iteration < opt.densify_until_iter:
+                        # Keep track of max radii in image-space for pruning
+                        gaussians.max_radii2D = torch.where(visibility_filter, torch.max(gaussians.max_radii2D, radii), gaussians.max_radii2D)
+                        gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
+
+            Ll1, loss = Ll1_batch / args.batch_size, loss_batch / args.batch_size
+
+            iter_end.record()
+            if iteration == first_iter and startup.enabled:
+                torch.cuda.synchronize()
+                startup.mark("first iteration")
+                tqdm.write(startup.report())
+
+            with torch.no_grad():
+                # Progress bar
+                profiler.phase("logging")
+                if metrics is None:
+                    ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
+                else:
+                    metrics.record(iteration, Ll1, loss)
+                    if metrics.due(iteration, opt.iterations):
+                        metrics.flush(tb_writer)
+                        ema_loss_for_log = metrics.ema_loss
+                if iteration % 10 == 0:
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
+                    progress_bar.update(10)
+                if iteration == opt.iterations:
+                    progress_bar.close()
+
+                # Log and save
+                training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end) if metrics is None else None, testing_iterations, scene, render, (pipe, background), evaluator)
+                if (iteration in saving_iterations):
+                    print("\n[ITER {}] Saving Gaussians".format(iteration))
+                    snapshot_writer.save_ply(gaussians, iteration)
+
+                # Densification
+                profiler.phase("densification")
+                if iteration < opt.densify_until_iter:
+                    if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0:
+                        profiler.phase("densify_and_prune")
+                        size_threshold = 20 if iteration > opt.opacity_reset_interval else None
+                        gaussians.densify_and_prune(opt.densify_grad_threshold, 0.005, scene.cameras_extent, size_threshold)
                 
-                if iteration % opt.opacity_reset_interval == 0 or (dataset.white_background and iteration == opt.densify_from_iter):
-                    gaussians.reset_opacity()
-
-            # Optimizer step
-            if iteration < opt.iterations:
-                visible = radii>0
-                gaussians.optimizer.step(visible, radii.shape[0])
-                # gaussians.optimizer.step()
-                gaussians.optimizer.zero_grad(set_to_none = True)
-
-            if (iteration in checkpoint_iterations):
-                print("\n[ITER {}] Saving Checkpoint".format(iteration))
-                torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")
-
+                    if iteration % opt.opacity_reset_interval == 0 or (dataset.white_background and iteration == opt.densify_from_iter):
+                        gaussians.reset_opacity()
+
+                # Optimizer step
+                profiler.phase("optimizer")
+                if iteration < opt.iterations:
+                    gaussians.optimizer.step(visible, visible.shape[0])
+                    # gaussians.optimizer.step()
+                    gaussians.optimizer.zero_grad(set_to_none = True)
+
+                if (iteration in checkpoint_iterations):
+                    profiler.phase("checkpoint")
+                    print("\n[ITER {}] Saving Checkpoint".format(iteration))
+                    snapshot_writer.save_checkpoint(gaussians, iteration)
+
+                if profiler.enabled:
+                    profiler.count("gaussians", gaussians._xyz.shape[0])
+                    profiler.count("visible", visible.sum())
+                profiler.step(iteration)
+
+                if sync_counter is not None:
+                    syncs = sync_counter.step()
+                    if tb_writer:
+                        tb_writer.add_scalar('syncs_per_iter', syncs, iteration)
+    finally:
+        # Also on errors and early exits: flush queued PLY/checkpoint writes, stop the background threads
+        evaluator.finish()
+        snapshot_writer.close()
+    if sync_counter is not None:
+        print("\n[SYNC] " + sync_counter.summary())
+        sync_counter.close()
+    if profiler.enabled:
+        print("\n[PROFILE]\n" + profiler.save(os.path.join(scene.model_path, "profile.txt")))
     print('Num of Guassians: %d'%(gaussians._xyz.shape[0]))
     return 
 
@@ -163,67 +237,27 @@ def prepare_output_and_logger(args):
     # Create Tensorboard writer
     tb_writer = None
     if TENSORBOARD_FOUND:
+        from torch.utils.tensorboard import SummaryWriter
         tb_writer = SummaryWriter(args.model_path)
     else:
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
-def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs):
-    if tb_writer:
+def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs, evaluator):
+    # elapsed is None in low-sync mode, TrainingMetrics logs the losses
+    if tb_writer and elapsed is not None:
         tb_writer.add_scalar('train_loss_patches/l1_loss', Ll1.item(), iteration)
         tb_writer.add_scalar('train_loss_patches/total_loss', loss.item(), iteration)
         tb_writer.add_scalar('iter_time', elapsed, iteration)
 
     # Report test and samples of training set
     if iteration in testing_iterations:
-        torch.cuda.empty_cache()
         validation_configs = ({'name': 'test', 'cameras' : scene.getTestCameras()}, 
                               {'name': 'train', 'cameras' : [scene.getTrainCameras()[idx % len(scene.getTrainCameras())] for idx in range(5, 30, 5)]})
         # validation_configs = ({'name': 'test', 'cameras' : scene.getTestCameras()},)        
 
-        for config in validation_configs:
-            if config['cameras'] and len(config['cameras']) > 0:
-                l1_test = 0.0
-                psnr_test = 0.0
-                ssims = []
-                lpipss = []
-                for idx, viewpoint in enumerate(config['cameras']):
-                    image = torch.clamp(renderFunc(viewpoint, scene.gaussians, *renderArgs)["render"], 0.0, 1.0)
-
-                    gt_image = torch.clamp(viewpoint.original_image.to("cuda"), 0.0, 1.0)
-
-                    if tb_writer and (idx < 5):
-                        tb_writer.add_images(config['name'] + "_view_{}/render".format(viewpoint.image_name), image[None], global_step=iteration)
-                        if iteration == testing_iterations[0]:
-                            tb_writer.add_images(config['name'] + "_view_{}/ground_truth".format(viewpoint.image_name), gt_image[None], global_step=iteration)
-                    l1_test += l1_loss(image, gt_image).mean().double()
-                    psnr_test += psnr(image, gt_image).mean().double()
-
-                    ssims.append(ssim(image, gt_image))
-                    lpipss.append(lpips(image, gt_image, net_type='vgg'))                    
-
-
-                psnr_test /= len(config['cameras'])
-                l1_test /= len(config['cameras']) 
-
-                ssims_test=torch.tensor(ssims).mean()
-                lpipss_test=torch.tensor(lpipss).mean()
-
-                print("\n[ITER {}] Evaluating {}: ".format(iteration, config['name']))
-                print("  SSIM : {:>12.7f}".format(ssims_test.mean(), ".5"))
-                print("  PSNR : {:>12.7f}".format(psnr_test.mean(), ".5"))
-                print("  LPIPS : {:>12.7f}".format(lpipss_test.mean(), ".5"))
-                print("")
-                
-                
-                if tb_writer:
-                    tb_writer.add_scalar(config['name'] + '/loss_viewpoint - l1_loss', l1_test, iteration)
-                    tb_writer.add_scalar(config['name'] + '/loss_viewpoint - psnr', psnr_test, iteration)
-
-        if tb_writer:
-            tb_writer.add_histogram("scene/opacity_histogram", scene.gaussians.get_opacity, iteration)
-            tb_writer.add_scalar('total_points', scene.gaussians.get_xyz.shape[0], iteration)
-        torch.cuda.empty_cache()
+        evaluator.submit(iteration, validation_configs, scene.gaussians, lambda viewpoint, gaussians: renderFunc(viewpoint, gaussians, *renderArgs)["render"],
+                         first=iteration == testing_iterations[0], final=iteration == max(testing_iterations))
 
 if __name__ == "__main__":
     # Set up command line argument parser
@@ -233,6 +267,10 @@ if __name__ == "__main__":
     pp = PipelineParams(parser)
     parser.add_argument('--ip', type=str, default="127.0.0.1")
     parser.add_argument('--port', type=int, default=6009)
+    parser.add_argument('--gui_max_fps', type=float, default=30.0)
+    parser.add_argument('--gui_iters_per_frame', type=int, default=1)
+    parser.add_argument('--gui_snapshot_interval', type=int, default=0, help="render viewer frames on a separate thread from a parameter snapshot refreshed every N iterations")
+    parser.add_argument('--gui_budget', type=float, default=0.1, help="fraction of device time the snapshot viewer may use")
     parser.add_argument('--debug_from', type=int, default=-1)
     parser.add_argument('--detect_anomaly', action='store_true', default=False)
     parser.add_argument("--test_iterations", nargs="+", type=int, default=[])
@@ -240,8 +278,21 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--low_sync", action="store_true", help="keep the training metrics on the device and read them back every --sync_interval iterations")
+    parser.add_argument("--sync_interval", type=int, default=100)
+    parser.add_argument("--count_syncs", action="store_true", help="count the host-device synchronisations of every iteration")
+    parser.add_argument("--batch_size", type=int, default=1, help="views rendered and backpropagated per optimizer step, every iteration of the schedule (total, densification, simplification, LR decay, SH upgrades, test/save/checkpoint iterations) is divided by it so that the same number of views is seen")
+    parser.add_argument("--batch_lr_scaling", type=str, default="sqrt", choices=["sqrt", "linear", "none"], help="learning rate scaling with the batch size")
+    parser.add_argument("--profile", action="store_true", help="time the phases of the training loop, the summary is written to profile.txt")
+    parser.add_argument("--profile_device", action="store_true", help="also time the phases on the GPU with CUDA events")
+    parser.add_argument("--profile_trace", action="store_true", help="also write a Chrome trace of every phase to trace.json")
+    parser.add_argument("--checkpoint_format", type=str, default="compact", choices=["compact", "pth"])
+    parser.add_argument("--eval_mode", type=str, default="sync", choices=EVAL_MODES, help="sync: evaluate inline, async: evaluate a snapshot on a background thread, deferred: only PSNR inline until the last test iteration")
+    parser.add_argument("--startup_report", action="store_true", help="report import and setup times up to the first iteration")
+    parser.add_argument("--fp16_moments", action="store_true", help="store the Adam moments of compact checkpoints in half precision")
 
     args = parser.parse_args(sys.argv[1:])
+    startup.mark("arguments")
     args.save_iterations.append(args.iterations)
     if not -1 in args.test_iterations:
         args.test_iterations.append(args.iterations)
@@ -252,13 +303,14 @@ if __name__ == "__main__":
     safe_state(args.quiet)
 
     # Start GUI server, configure and run training
-    network_gui.init(args.ip, args.port)
+    network_gui.init(args.ip, args.port, args.gui_max_fps, args.gui_iters_per_frame, args.gui_snapshot_interval, args.gui_budget)
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
+    startup.mark("state and viewer")
 
     torch.cuda.synchronize()
     time_start=time.time()
     
-    training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from)
+    training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, args)
 
     torch.cuda.synchronize()
     time_end=time.time()
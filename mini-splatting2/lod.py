@@ -0,0 +1,47 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import torch
+from scene import Scene
+import os
+from utils.general_utils import safe_state
+from argparse import ArgumentParser
+from arguments import ModelParams, get_combined_args
+from gaussian_renderer import GaussianModel
+
+def build_lod(dataset : ModelParams, iteration : int, max_depth : int, min_depth : int, reduction : float):
+    with torch.no_grad():
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        gaussians = GaussianModel(dataset.sh_degree, device=device)
+        scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+
+        lod_path = os.path.join(dataset.model_path, "lod", "iteration_{}".format(scene.loaded_iter))
+        manifest = gaussians.save_lod(lod_path, max_depth=max_depth, min_depth=min_depth, reduction=reduction)
+        for level in manifest["levels"]:
+            print("Level {}: {:>10d} Gaussians in {:>6d} tiles (octree depth {})".format(level["level"], level["count"], level["tiles"], level["octree_depth"]))
+        print("LOD written to " + lod_path)
+
+if __name__ == "__main__":
+    # Set up command line argument parser
+    parser = ArgumentParser(description="LOD hierarchy parameters")
+    model = ModelParams(parser, sentinel=True)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--max_depth", default=10, type=int)
+    parser.add_argument("--min_depth", default=2, type=int)
+    parser.add_argument("--reduction", default=0.5, type=float)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Building LOD for " + args.model_path)
+
+    # Initialize system state (RNG)
+    safe_state(args.quiet)
+
+    build_lod(model.extract(args), args.iteration, args.max_depth, args.min_depth, args.reduction)
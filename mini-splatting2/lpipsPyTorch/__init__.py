@@ -1,6 +1,14 @@
 import torch
 
-from .modules.lpips import LPIPS
+# LPIPS (and torchvision with it) is imported on first use, importing the
+# package stays cheap for scripts that may never evaluate
+
+
+def __getattr__(name):
+    if name == 'LPIPS':
+        from .modules.lpips import LPIPS
+        return LPIPS
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 # def lpips(x: torch.Tensor,
@@ -39,6 +47,7 @@ def lpips(x: torch.Tensor,
     global criterion
     device = x.device
     if criterion is None:
+        from .modules.lpips import LPIPS
         criterion = LPIPS(net_type, version).to(device)
     return criterion(x, y)
 
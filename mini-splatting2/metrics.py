@@ -11,6 +11,8 @@
 
 from pathlib import Path
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 import torch
 import torchvision.transforms.functional as tf
@@ -21,19 +23,49 @@ from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser
 
-def readImages(renders_dir, gt_dir):
-    renders = []
-    gts = []
-    image_names = []
-    for fname in os.listdir(renders_dir):
-        render = Image.open(renders_dir / fname)
-        gt = Image.open(gt_dir / fname)
-        renders.append(tf.to_tensor(render).unsqueeze(0)[:, :3, :, :].cuda())
-        gts.append(tf.to_tensor(gt).unsqueeze(0)[:, :3, :, :].cuda())
-        image_names.append(fname)
-    return renders, gts, image_names
-
-def evaluate(model_paths):
+def readImage(path):
+    # uint8 on the host, converted to float on the device
+    with Image.open(path) as image:
+        return tf.pil_to_tensor(image)[:3]
+
+def streamImages(renders_dir, gt_dir, workers=8, prefetch=32):
+    """
+    Decode the render / ground truth pairs on a thread pool, at most prefetch pairs ahead.
+    :return generator of (name, render, gt), uint8 [3, H, W]
+    """
+    image_names = sorted(os.listdir(renders_dir))
+    with ThreadPoolExecutor(workers) as pool:
+        pending = deque()
+        for fname in image_names:
+            pending.append((fname, pool.submit(readImage, renders_dir / fname), pool.submit(readImage, gt_dir / fname)))
+            if len(pending) >= prefetch:
+                fname, render, gt = pending.popleft()
+                yield fname, render.result(), gt.result()
+        while pending:
+            fname, render, gt = pending.popleft()
+            yield fname, render.result(), gt.result()
+
+def batchImages(stream, batch_size):
+    """
+    Group consecutive pairs of the same resolution into batches of up to batch_size.
+    """
+    batch = []
+    for item in stream:
+        if batch and (len(batch) == batch_size or item[1].shape != batch[0][1].shape):
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+def toDevice(images, device):
+    images = torch.stack(images)
+    if device.type == "cuda":
+        images = images.pin_memory()
+    return images.to(device, non_blocking=True).float() / 255.0
+
+@torch.no_grad()
+def evaluate(model_paths, device=torch.device("cuda"), batch_size=4, workers=8):
 
     full_dict = {}
     per_view_dict = {}
@@ -62,17 +94,28 @@ def evaluate(model_paths):
                 method_dir = test_dir / method
                 gt_dir = method_dir/ "gt"
                 renders_dir = method_dir / "renders"
-                renders, gts, image_names = readImages(renders_dir, gt_dir)
 
                 ssims = []
                 psnrs = []
                 lpipss = []
-
-                for idx in tqdm(range(len(renders)), desc="Metric evaluation progress"):
-                    ssims.append(ssim(renders[idx], gts[idx]))
-                    psnrs.append(psnr(renders[idx], gts[idx]))
-                    lpipss.append(lpips(renders[idx], gts[idx], net_type='vgg'))
-                    print()
+                image_names = []
+
+                progress_bar = tqdm(total=len(os.listdir(renders_dir)), desc="Metric evaluation progress")
+                for batch in batchImages(streamImages(renders_dir, gt_dir, workers, prefetch=max(4 * batch_size, workers)), batch_size):
+                    names, renders, gts = zip(*batch)
+                    renders = toDevice(renders, device)
+                    gts = toDevice(gts, device)
+                    # One value per view, read back once per batch
+                    values = torch.stack([ssim(renders, gts, size_average=False),
+                                          psnr(renders, gts).flatten(),
+                                          lpips(renders, gts, net_type='vgg').flatten()], 1).tolist()
+                    for ssim_value, psnr_value, lpips_value in values:
+                        ssims.append(ssim_value)
+                        psnrs.append(psnr_value)
+                        lpipss.append(lpips_value)
+                    image_names += names
+                    progress_bar.update(len(batch))
+                progress_bar.close()
 
                 print("  SSIM : {:>12.7f}".format(torch.tensor(ssims).mean(), ".5"))
                 print("  PSNR : {:>12.7f}".format(torch.tensor(psnrs).mean(), ".5"))
@@ -82,9 +125,9 @@ def evaluate(model_paths):
                 full_dict[scene_dir][method].update({"SSIM": torch.tensor(ssims).mean().item(),
                                                         "PSNR": torch.tensor(psnrs).mean().item(),
                                                         "LPIPS": torch.tensor(lpipss).mean().item()})
-                per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(torch.tensor(ssims).tolist(), image_names)},
-                                                            "PSNR": {name: psnr for psnr, name in zip(torch.tensor(psnrs).tolist(), image_names)},
-                                                            "LPIPS": {name: lp for lp, name in zip(torch.tensor(lpipss).tolist(), image_names)}})
+                per_view_dict[scene_dir][method].update({"SSIM": {name: ssim for ssim, name in zip(ssims, image_names)},
+                                                            "PSNR": {name: psnr for psnr, name in zip(psnrs, image_names)},
+                                                            "LPIPS": {name: lp for lp, name in zip(lpipss, image_names)}})
 
             with open(scene_dir + "/results.json", 'w') as fp:
                 json.dump(full_dict[scene_dir], fp, indent=True)
@@ -94,11 +137,15 @@ def evaluate(model_paths):
             print("Unable to compute metrics for model", scene_dir)
 
 if __name__ == "__main__":
-    device = torch.device("cuda:0")
-    torch.cuda.set_device(device)
-
     # Set up command line argument parser
     parser = ArgumentParser(description="Training script parameters")
     parser.add_argument('--model_paths', '-m', required=True, nargs="+", type=str, default=[])
+    parser.add_argument('--device', type=str, default="cuda:0" if torch.cuda.is_available() else "cpu")
+    parser.add_argument('--batch_size', type=int, default=4, help="views scored together, views of different resolutions are never batched")
+    parser.add_argument('--workers', type=int, default=8, help="image decoding threads")
     args = parser.parse_args()
-    evaluate(args.model_paths)
+
+    device = torch.device(args.device)
+    if device.type == "cuda":
+        torch.cuda.set_device(device)
+    evaluate(args.model_paths, device, args.batch_size, args.workers)
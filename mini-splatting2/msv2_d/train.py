@@ -14,16 +14,17 @@ from gaussian_renderer import render, render_imp, render_simp, render_depth
 import sys
 from scene import Scene, GaussianModel
 from utils.general_utils import safe_state
+from utils.sync_utils import SyncCounter, TrainingMetrics
+from utils.snapshot_utils import SnapshotWriter
+from utils.checkpoint_utils import load_checkpoint
 import uuid
 from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
-from arguments import ModelParams, PipelineParams, OptimizationParams, read_config
-try:
-    from torch.utils.tensorboard import SummaryWriter
-    TENSORBOARD_FOUND = True
-except ImportError:
-    TENSORBOARD_FOUND = False
+from arguments import ModelParams, PipelineParams, OptimizationParams, read_config, save_config
+from importlib.util import find_spec
+# torch.utils.tensorboard is imported when the writer is created
+TENSORBOARD_FOUND = find_spec("tensorboard") is not None
 
 import numpy as np
 from lpipsPyTorch import lpips
@@ -36,168 +37,184 @@ import time
 def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoint_iterations, checkpoint, debug_from, args):
     first_iter = 0
     tb_writer = prepare_output_and_logger(dataset)
+    args.model_path = dataset.model_path
+    save_config(args, os.path.join(dataset.model_path, "config.json"))
 
     gaussians = GaussianModel(sh_degree=0)
 
     scene = Scene(dataset, gaussians, resolution_scales=[1,2])
-    gaussians.training_setup(opt)
-    if checkpoint:
-        (model_params, first_iter) = torch.load(checkpoint)
-        gaussians.restore(model_params, opt)
+    snapshot_writer = SnapshotWriter(scene.model_path, checkpoint_format=args.checkpoint_format, fp16_moments=args.fp16_moments)
+    try:
+        gaussians.training_setup(opt)
+        if checkpoint:
+            (model_params, first_iter, checkpoint_extras) = load_checkpoint(checkpoint)
+            gaussians.restore(model_params, opt)
          
-    bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
-    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
 
-    iter_start = torch.cuda.Event(enable_timing = True)
-    iter_end = torch.cuda.Event(enable_timing = True)
+        iter_start = torch.cuda.Event(enable_timing = True)
+        iter_end = torch.cuda.Event(enable_timing = True)
 
-    viewpoint_stack = None
-    ema_loss_for_log = 0.0
-    progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
-    first_iter += 1
+        viewpoint_stack = None
+        ema_loss_for_log = 0.0
+        metrics = TrainingMetrics(args.sync_interval) if args.low_sync else None
+        sync_counter = SyncCounter() if args.count_syncs else None
+        progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
+        first_iter += 1
 
-    mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
-    gaussians.init_culling(len(scene.getTrainCameras()))
+        mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
+        gaussians.init_culling(len(scene.getTrainCameras()))
+        if checkpoint and "culling" in checkpoint_extras:
+            gaussians._culling = checkpoint_extras["culling"].to(gaussians.device)
+            gaussians.factor_culling = checkpoint_extras["factor_culling"].to(gaussians.device)
 
 
-    for iteration in range(first_iter, opt.iterations + 1):   
+        for iteration in range(first_iter, opt.iterations + 1):   
 
-        if network_gui.conn == None:
-            network_gui.try_connect()
-        while network_gui.conn != None:
-            try:
-                net_image_bytes = None
-                custom_cam, do_training, pipe.convert_SHs_python, pipe.compute_cov3D_python, keep_alive, scaling_modifer = network_gui.receive()
-                if custom_cam != None:
-                    net_image = render_imp(custom_cam, gaussians, pipe, background, scaling_modifer)["render"]
-                    net_image_bytes = memoryview((torch.clamp(net_image, min=0, max=1.0) * 255).byte().permute(1, 2, 0).contiguous().cpu().numpy())
-                network_gui.send(net_image_bytes, dataset.source_path)
-                if do_training and ((iteration < int(opt.iterations)) or not keep_alive):
-                    break
-            except Exception as e:
-                network_gui.conn = None
+            if network_gui.conn != None:
+                network_gui.serve(lambda model, custom_cam, scaling_modifer: render_imp(custom_cam, model, pipe, background, scaling_modifer)["render"],
+                                  gaussians, dataset.source_path, pipe, iteration, opt.iterations)
 
-        iter_start.record()
+            if metrics is not None:
+                iter_start, iter_end = metrics.events()
+            iter_start.record()
 
-        gaussians.update_learning_rate(iteration)
+            gaussians.update_learning_rate(iteration)
 
 
-        if iteration % 1000 == 0 and iteration>args.simp_iteration1:
-            gaussians.oneupSHdegree()
+            if iteration % 1000 == 0 and iteration>args.simp_iteration1:
+                gaussians.oneupSHdegree()
 
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
+            if not viewpoint_stack:
+                viewpoint_stack = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+            viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
 
-        # Render
-        if (iteration - 1) == debug_from:
-            pipe.debug = True
+            # Render
+            if (iteration - 1) == debug_from:
+                pipe.debug = True
 
-        render_pkg = render_imp(viewpoint_cam, gaussians, pipe, background, culling=gaussians._culling[:,viewpoint_cam.uid])
+            render_pkg = render_imp(viewpoint_cam, gaussians, pipe, background, culling=gaussians._culling[:,viewpoint_cam.uid])
 
-        image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
+            image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
 
-        # Loss
-        gt_image = viewpoint_cam.original_image.cuda()
-        Ll1 = l1_loss(image, gt_image)
-        ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
+            # Loss
+            gt_image = viewpoint_cam.original_image.cuda()
+            Ll1 = l1_loss(image, gt_image)
+            ssim_value = fused_ssim(image.unsqueeze(0), gt_image.unsqueeze(0))
 
-        loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim_value)
-        loss.backward()
+            loss = (1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim_value)
+            loss.backward()
 
-        iter_end.record()
+            iter_end.record()
 
-        with torch.no_grad():
-            # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
-            if iteration % 10 == 0:
-                progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
-                progress_bar.update(10)
-            if iteration == opt.iterations:
-                progress_bar.close()
-
-            # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), testing_iterations, scene, render, (pipe, background))
-            if (iteration in saving_iterations):
-                print("\n[ITER {}] Saving Gaussians".format(iteration))
-                scene.save(iteration)
-
-            # # Densification
-            if iteration < opt.densify_until_iter:
-                # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
-
-                if gaussians._culling[:,viewpoint_cam.uid].sum()==0:
-                    gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
+            with torch.no_grad():
+                # Progress bar
+                if metrics is None:
+                    ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
                 else:
-                    # normalize xy gradient after culling
-                    gaussians.add_densification_stats_culling(viewspace_point_tensor, visibility_filter, gaussians.factor_culling)
-
-                area_max = render_pkg["area_max"]
-                mask_blur = torch.logical_or(mask_blur, area_max>(image.shape[1]*image.shape[2]/5000))
-
-                if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 and iteration != args.depth_reinit_iter:
+                    metrics.record(iteration, Ll1, loss)
+                    if metrics.due(iteration, opt.iterations):
+                        metrics.flush(tb_writer)
+                        ema_loss_for_log = metrics.ema_loss
+                if iteration % 10 == 0:
+                    progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
+                    progress_bar.update(10)
+                if iteration == opt.iterations:
+                    progress_bar.close()
+
+                # Log and save
+                training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end) if metrics is None else None, testing_iterations, scene, render, (pipe, background))
+                if (iteration in saving_iterations):
+                    print("\n[ITER {}] Saving Gaussians".format(iteration))
+                    snapshot_writer.save_ply(gaussians, iteration)
+
+                # # Densification
+                if iteration < opt.densify_until_iter:
+                    # Keep track of max radii in image-space for pruning
+                    gaussians.max_radii2D = torch.where(visibility_filter, torch.max(gaussians.max_radii2D, radii), gaussians.max_radii2D)
+
+                    if not gaussians.view_culled(viewpoint_cam.uid):
+                        gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
+                    else:
+                        # normalize xy gradient after culling
+                        gaussians.add_densification_stats_culling(viewspace_point_tensor, visibility_filter, gaussians.factor_culling)
+
+                    area_max = render_pkg["area_max"]
+                    mask_blur = torch.logical_or(mask_blur, area_max>(image.shape[1]*image.shape[2]/5000))
+
+                    if iteration > opt.densify_from_iter and iteration % opt.densification_interval == 0 and iteration != args.depth_reinit_iter:
                                 
-                    size_threshold = 20 if iteration > opt.opacity_reset_interval else None
+                        size_threshold = 20 if iteration > opt.opacity_reset_interval else None
 
-                    gaussians.densify_and_prune_mask(opt.densify_grad_threshold, 
-                                                    0.005, scene.cameras_extent, 
-                                                    size_threshold, mask_blur)
-                    mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
+                        gaussians.densify_and_prune_mask(opt.densify_grad_threshold, 
+                                                        0.005, scene.cameras_extent, 
+                                                        size_threshold, mask_blur)
+                        mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
                     
                     
-                if iteration == args.depth_reinit_iter:
+                    if iteration == args.depth_reinit_iter:
 
-                    num_depth = gaussians._xyz.shape[0]*args.num_depth_factor
+                        num_depth = gaussians._xyz.shape[0]*args.num_depth_factor
                     
-                    # interesction_preserving for better point cloud reconstruction result at the early stage, not affect rendering quality
-                    gaussians.interesction_preserving(scene, render_simp, iteration, args, pipe, background)
-                    pts, rgb = gaussians.depth_reinit(scene, render_depth, iteration, num_depth, args, pipe, background)
-
-                    gaussians.reinitial_pts(pts, rgb)
-
-                    gaussians.training_setup(opt)
-                    gaussians.init_culling(len(scene.getTrainCameras()))
-                    mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
-                    torch.cuda.empty_cache()
+                        # interesction_preserving for better point cloud reconstruction result at the early stage, not affect rendering quality
+                        gaussians.interesction_preserving(scene, render_simp, iteration, args, pipe, background)
+                        pts, rgb = gaussians.depth_reinit(scene, render_depth, iteration, num_depth, args, pipe, background)
 
+                        gaussians.reinitial_pts(pts, rgb)
 
-                if iteration >= args.aggressive_clone_from_iter and iteration % args.aggressive_clone_interval == 0 and iteration!=args.depth_reinit_iter:
-                    gaussians.culling_with_clone(scene, render_simp, iteration, args, pipe, background)
-                    torch.cuda.empty_cache()
-                    mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
+                        gaussians.training_setup(opt)
+                        gaussians.init_culling(len(scene.getTrainCameras()))
+                        mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
+                        torch.cuda.empty_cache()
 
 
-            if iteration == args.simp_iteration1:
-                gaussians.culling_with_importance_pruning(scene, render_simp, iteration, args, pipe, background)
-                gaussians.max_sh_degree=dataset.sh_degree
-                gaussians.extend_features_rest()
+                    if iteration >= args.aggressive_clone_from_iter and iteration % args.aggressive_clone_interval == 0 and iteration!=args.depth_reinit_iter:
+                        gaussians.culling_with_clone(scene, render_simp, iteration, args, pipe, background)
+                        torch.cuda.empty_cache()
+                        mask_blur = torch.zeros(gaussians._xyz.shape[0], device='cuda')
 
-                gaussians.training_setup(opt)
-                torch.cuda.empty_cache()   
 
+                if iteration == args.simp_iteration1:
+                    gaussians.culling_with_importance_pruning(scene, render_simp, iteration, args, pipe, background)
+                    gaussians.max_sh_degree=dataset.sh_degree
+                    gaussians.extend_features_rest()
 
-            if iteration == args.simp_iteration2:
-                gaussians.culling_with_importance_pruning(scene, render_simp, iteration, args, pipe, background)
-                torch.cuda.empty_cache()
+                    gaussians.training_setup(opt)
+                    torch.cuda.empty_cache()   
 
-            if iteration == (args.simp_iteration2+opt.iterations)//2:
-                gaussians.init_culling(len(scene.getTrainCameras()))
 
+                if iteration == args.simp_iteration2:
+                    gaussians.culling_with_importance_pruning(scene, render_simp, iteration, args, pipe, background)
+                    torch.cuda.empty_cache()
 
+                if iteration == (args.simp_iteration2+opt.iterations)//2:
+                    gaussians.init_culling(len(scene.getTrainCameras()))
 
-            # Optimizer step
-            if iteration < opt.iterations:
-                visible = radii>0
-                gaussians.optimizer.step(visible, radii.shape[0])
-                # gaussians.optimizer.step()
-                gaussians.optimizer.zero_grad(set_to_none = True)
 
-            if (iteration in checkpoint_iterations):
-                print("\n[ITER {}] Saving Checkpoint".format(iteration))
-                torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")  
 
+                # Optimizer step
+                if iteration < opt.iterations:
+                    visible = radii>0
+                    gaussians.optimizer.step(visible, radii.shape[0])
+                    # gaussians.optimizer.step()
+                    gaussians.optimizer.zero_grad(set_to_none = True)
+
+                if (iteration in checkpoint_iterations):
+                    print("\n[ITER {}] Saving Checkpoint".format(iteration))
+                    snapshot_writer.save_checkpoint(gaussians, iteration)
+
+                if sync_counter is not None:
+                    syncs = sync_counter.step()
+                    if tb_writer:
+                        tb_writer.add_scalar('syncs_per_iter', syncs, iteration)
+    finally:
+        # Also on errors and early exits: flush queued PLY/checkpoint writes, stop the writer thread
+        snapshot_writer.close()
+    if sync_counter is not None:
+        print("\n[SYNC] " + sync_counter.summary())
+        sync_counter.close()
     print('Num of Guassians: %d'%(gaussians._xyz.shape[0]))
     return 
 
@@ -226,13 +243,15 @@ def prepare_output_and_logger(args):
     # Create Tensorboard writer
     tb_writer = None
     if TENSORBOARD_FOUND:
+        from torch.utils.tensorboard import SummaryWriter
         tb_writer = SummaryWriter(args.model_path)
     else:
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
 def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs):
-    if tb_writer:
+    # elapsed is None in low-sync mode, TrainingMetrics logs the losses
+    if tb_writer and elapsed is not None:
         tb_writer.add_scalar('train_loss_patches/l1_loss', Ll1.item(), iteration)
         tb_writer.add_scalar('train_loss_patches/total_loss', loss.item(), iteration)
         tb_writer.add_scalar('iter_time', elapsed, iteration)
@@ -296,6 +315,10 @@ if __name__ == "__main__":
     pp = PipelineParams(parser)
     parser.add_argument('--ip', type=str, default="127.0.0.1")
     parser.add_argument('--port', type=int, default=6009)
+    parser.add_argument('--gui_max_fps', type=float, default=30.0)
+    parser.add_argument('--gui_iters_per_frame', type=int, default=1)
+    parser.add_argument('--gui_snapshot_interval', type=int, default=0, help="render viewer frames on a separate thread from a parameter snapshot refreshed every N iterations")
+    parser.add_argument('--gui_budget', type=float, default=0.1, help="fraction of device time the snapshot viewer may use")
     parser.add_argument('--debug_from', type=int, default=-1)
     parser.add_argument('--detect_anomaly', action='store_true', default=False)
     parser.add_argument("--test_iterations", nargs="+", type=int, default=[])
@@ -303,6 +326,11 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--low_sync", action="store_true", help="keep the training metrics on the device and read them back every --sync_interval iterations")
+    parser.add_argument("--sync_interval", type=int, default=100)
+    parser.add_argument("--count_syncs", action="store_true", help="count the host-device synchronisations of every iteration")
+    parser.add_argument("--checkpoint_format", type=str, default="compact", choices=["compact", "pth"])
+    parser.add_argument("--fp16_moments", action="store_true", help="store the Adam moments of compact checkpoints in half precision")
 
     parser.add_argument("--imp_metric", required=True, type=str, default = None)
 
@@ -333,7 +361,7 @@ if __name__ == "__main__":
     safe_state(args.quiet)
 
     # Start GUI server, configure and run training
-    network_gui.init(args.ip, args.port)
+    network_gui.init(args.ip, args.port, args.gui_max_fps, args.gui_iters_per_frame, args.gui_snapshot_interval, args.gui_budget)
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
 
     torch.cuda.synchronize()
@@ -9,19 +9,25 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+import sys
+from utils.startup_utils import StartupTimer
+startup = StartupTimer("--startup_report" in sys.argv)
 import torch
 from scene import Scene
 import os
 from tqdm import tqdm
 from os import makedirs
 from gaussian_renderer import render
-import torchvision
 from utils.general_utils import safe_state
+from utils.image_writer import ImageWriter, IMAGE_FORMATS
+from utils.pose_utils import generate_ellipse_path, generate_spiral_path_from_views
+from utils.video_pipeline import path_cameras, VideoEncoder, VIDEO_CODECS
 from argparse import ArgumentParser
 from arguments import ModelParams, PipelineParams, get_combined_args
 from gaussian_renderer import GaussianModel
+startup.mark("imports")
 
-def render_set(model_path, name, iteration, views, gaussians, pipeline, background):
+def render_set(model_path, name, iteration, views, gaussians, pipeline, background, writer, image_format="png", skip_existing_gt=False):
     render_path = os.path.join(model_path, name, "ours_{}".format(iteration), "renders")
     gts_path = os.path.join(model_path, name, "ours_{}".format(iteration), "gt")
 
@@ -30,23 +36,63 @@ def render_set(model_path, name, iteration, views, gaussians, pipeline, backgrou
 
     for idx, view in enumerate(tqdm(views, desc="Rendering progress")):
         rendering = render(view, gaussians, pipeline, background)["render"]
-        gt = view.original_image[0:3, :, :]
-        torchvision.utils.save_image(rendering, os.path.join(render_path, '{0:05d}'.format(idx) + ".png"))
-        torchvision.utils.save_image(gt, os.path.join(gts_path, '{0:05d}'.format(idx) + ".png"))
+        file_name = '{0:05d}'.format(idx) + "." + image_format
+        writer.write(rendering, os.path.join(render_path, file_name))
+        if not (skip_existing_gt and os.path.exists(os.path.join(gts_path, file_name))):
+            writer.write(view.original_image[0:3, :, :], os.path.join(gts_path, file_name))
+        if idx == 0 and startup.enabled and startup.marks[-1][0] != "first view":
+            startup.mark("first view")
+            tqdm.write(startup.report())
 
-def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool):
-    with torch.no_grad():
+def render_video(model_path, iteration, views, gaussians, pipeline, background, fps=30, mode="ellipse", n_frames=600,
+                 resolution_scale=1.0, codec="auto", ring_size=8, video_name=None):
+    """
+    Render a turntable video along an ellipse or spiral path fitted to views.
+    Frames are encoded on a background thread, views are not modified.
+    """
+    render_path = os.path.join(model_path, "video", "ours_{}".format(iteration))
+    makedirs(render_path, exist_ok=True)
+
+    if mode == "spiral":
+        render_poses = generate_spiral_path_from_views(views, n_frames=n_frames)
+    else:
+        render_poses = generate_ellipse_path(views, n_frames=n_frames)
+    cameras = path_cameras(render_poses, views[0], resolution_scale)
+
+    video_path = os.path.join(render_path, (video_name or os.path.basename(os.path.normpath(model_path))) + ".mp4")
+    size = (cameras[0].image_width, cameras[0].image_height)
+    with VideoEncoder(video_path, fps, size, ring_size=ring_size, codec=codec) as encoder:
+        for idx, camera in enumerate(tqdm(cameras, desc="Rendering video")):
+            encoder.write(render(camera, gaussians, pipeline, background)["render"])
+            if idx == 0 and startup.enabled and startup.marks[-1][0] != "first view":
+                startup.mark("first view")
+                tqdm.write(startup.report())
+    print("Video saved to: {}".format(video_path))
+
+def render_sets(dataset : ModelParams, iteration : int, pipeline : PipelineParams, skip_train : bool, skip_test : bool, bake_sh_dc : bool = False,
+                image_format : str = "png", writer_workers : int = 4, skip_existing_gt : bool = False, video_args = None):
+    with torch.no_grad(), ImageWriter(writer_workers) as writer:
         gaussians = GaussianModel(dataset.sh_degree)
         scene = Scene(dataset, gaussians, load_iteration=iteration, shuffle=False)
+        startup.mark("scene")
+
+        if bake_sh_dc:
+            camera_centers = torch.stack([view.camera_center for view in scene.getTrainCameras()])
+            baked = gaussians.bake_sh_dc(camera_centers)
+            print("Baked SH of {} / {} Gaussians into DC".format(int(baked.sum()), baked.shape[0]))
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
         background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
 
+        if video_args is not None:
+            render_video(dataset.model_path, scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background, **video_args)
+            return
+
         if not skip_train:
-             render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background)
+             render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background, writer, image_format, skip_existing_gt)
 
         if not skip_test:
-             render_set(dataset.model_path, "test", scene.loaded_iter, scene.getTestCameras(), gaussians, pipeline, background)
+             render_set(dataset.model_path, "test", scene.loaded_iter, scene.getTestCameras(), gaussians, pipeline, background, writer, image_format, skip_existing_gt)
 
 if __name__ == "__main__":
     # Set up command line argument parser
@@ -57,10 +103,29 @@ if __name__ == "__main__":
     parser.add_argument("--skip_train", action="store_true")
     parser.add_argument("--skip_test", action="store_true")
     parser.add_argument("--quiet", action="store_true")
+    parser.add_argument("--bake_sh_dc", action="store_true", help="fold the SH of distant/low-frequency Gaussians into their DC colour")
+    parser.add_argument("--image_format", type=str, default="png", choices=IMAGE_FORMATS, help="exr writes unclamped float renders and needs OpenCV")
+    parser.add_argument("--writer_workers", type=int, default=4, help="image encoding processes, 0 encodes on the main thread")
+    parser.add_argument("--skip_existing_gt", action="store_true", help="do not rewrite ground truth images that already exist")
+    parser.add_argument("--video", action="store_true", help="render a turntable video instead of the train/test views")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--mode", type=str, default="ellipse", choices=["ellipse", "spiral"], help="camera path of the video")
+    parser.add_argument("--video_frames", type=int, default=600)
+    parser.add_argument("--video_scale", type=float, default=1.0, help="frame size relative to the training views, e.g. 0.5 for a preview")
+    parser.add_argument("--video_codec", type=str, default="auto", choices=VIDEO_CODECS, help="auto encodes H.264 with ffmpeg when available, mp4v with OpenCV otherwise")
+    parser.add_argument("--video_name", type=str, default=None, help="file name without extension, defaults to the model directory name")
+    parser.add_argument("--startup_report", action="store_true", help="report import and setup times up to the first rendered view")
     args = get_combined_args(parser)
+    startup.mark("arguments")
     print("Rendering " + args.model_path)
 
     # Initialize system state (RNG)
     safe_state(args.quiet)
 
-    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.skip_train, args.skip_test)
\ No newline at end of file
+    video_args = None
+    if args.video:
+        video_args = {"fps": args.fps, "mode": args.mode, "n_frames": args.video_frames, "resolution_scale": args.video_scale,
+                      "codec": args.video_codec, "video_name": args.video_name}
+
+    render_sets(model.extract(args), args.iteration, pipeline.extract(args), args.skip_train, args.skip_test, args.bake_sh_dc,
+                args.image_format, args.writer_workers, args.skip_existing_gt, video_args)
\ No newline at end of file
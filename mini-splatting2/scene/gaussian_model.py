@@ -14,10 +14,15 @@ import numpy as np
 from utils.general_utils import inverse_sigmoid, get_expon_lr_func, build_rotation
 from torch import nn
 import os
+import copy
+import weakref
 from utils.system_utils import mkdir_p
 from plyfile import PlyData, PlyElement
-from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
+from utils.sh_utils import RGB2SH, C0, eval_sh_basis
+from utils.knn_utils import distKNN
+from utils.compression_utils import compress_gaussians, decompress_gaussians
+from utils.lod_utils import save_lod
+from utils.tile_utils import save_tiles, load_tiles
 from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation
 from utils.sh_utils import SH2RGB
@@ -63,7 +68,8 @@ class GaussianModel:
         self.rotation_activation = torch.nn.functional.normalize
 
 
-    def __init__(self, sh_degree : int):
+    def __init__(self, sh_degree : int, device="cuda"):
+        self.device = torch.device(device)
         self.active_sh_degree = 0
         self.max_sh_degree = sh_degree  
         self._xyz = torch.empty(0)
@@ -78,6 +84,8 @@ class GaussianModel:
         self.optimizer = None
         self.percent_dense = 0
         self.spatial_lr_scale = 0
+        self._view_culled = None
+        self.lr_scale = 1.0
         self.setup_functions()
 
     def capture(self):
@@ -95,23 +103,42 @@ class GaussianModel:
             self.optimizer.state_dict(),
             self.spatial_lr_scale,
         )
+
+    def snapshot(self):
+        """
+        Copy for rendering from another thread: the parameters are cloned, the
+        optimizer and training statistics are not.
+        """
+        snapshot = copy.copy(self)
+        for name in ("_xyz", "_features_dc", "_features_rest", "_scaling", "_rotation", "_opacity"):
+            setattr(snapshot, name, getattr(self, name).detach().clone())
+        snapshot.optimizer = None
+        return snapshot
     
     def restore(self, model_args, training_args):
         (self.active_sh_degree, 
-        self._xyz, 
-        self._features_dc, 
-        self._features_rest,
-        self._scaling, 
-        self._rotation, 
-        self._opacity,
-        self.max_radii2D, 
+        xyz, 
+        features_dc, 
+        features_rest,
+        scaling, 
+        rotation, 
+        opacity,
+        max_radii2D, 
         xyz_gradient_accum, 
         denom,
         opt_dict, 
         self.spatial_lr_scale) = model_args
+        # Checkpoints written by SnapshotWriter hold host copies, move them back to the model device
+        self._xyz = nn.Parameter(xyz.to(self.device).requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.to(self.device).requires_grad_(True))
+        self._features_rest = nn.Parameter(features_rest.to(self.device).requires_grad_(True))
+        self._scaling = nn.Parameter(scaling.to(self.device).requires_grad_(True))
+        self._rotation = nn.Parameter(rotation.to(self.device).requires_grad_(True))
+        self._opacity = nn.Parameter(opacity.to(self.device).requires_grad_(True))
+        self.max_radii2D = max_radii2D.to(self.device)
         self.training_setup(training_args)
-        self.xyz_gradient_accum = xyz_gradient_accum
-        self.denom = denom
+        self.xyz_gradient_accum = xyz_gradient_accum.to(self.device)
+        self.denom = denom.to(self.device)
         self.optimizer.load_state_dict(opt_dict)
 
     @property
@@ -153,20 +180,20 @@ class GaussianModel:
 
     def create_from_pcd(self, pcd : BasicPointCloud, spatial_lr_scale : float):
         self.spatial_lr_scale = spatial_lr_scale
-        fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().cuda()
-        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().cuda())
-        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().cuda()
+        fused_point_cloud = torch.tensor(np.asarray(pcd.points)).float().to(self.device)
+        fused_color = RGB2SH(torch.tensor(np.asarray(pcd.colors)).float().to(self.device))
+        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().to(self.device)
         features[:, :3, 0 ] = fused_color
         features[:, 3:, 1:] = 0.0
 
         print("Number of points at initialisation : ", fused_point_cloud.shape[0])
 
-        dist2 = torch.clamp_min(distCUDA2(torch.from_numpy(np.asarray(pcd.points)).float().cuda()), 0.0000001)
+        dist2 = torch.clamp_min(distKNN(torch.from_numpy(np.asarray(pcd.points)).float().to(self.device)), 0.0000001)
         scales = torch.log(torch.sqrt(dist2))[...,None].repeat(1, 3)
-        rots = torch.zeros((fused_point_cloud.shape[0], 4), device="cuda")
+        rots = torch.zeros((fused_point_cloud.shape[0], 4), device=self.device)
         rots[:, 0] = 1
 
-        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
+        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device=self.device))
 
         self._xyz = nn.Parameter(fused_point_cloud.contiguous().requires_grad_(True))
         self._features_dc = nn.Parameter(features[:,:,0:1].transpose(1, 2).contiguous().requires_grad_(True))
@@ -174,13 +201,13 @@ class GaussianModel:
         self._scaling = nn.Parameter(scales.requires_grad_(True))
         self._rotation = nn.Parameter(rots.requires_grad_(True))
         self._opacity = nn.Parameter(opacities.requires_grad_(True))
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)
 
 
     def training_setup(self, training_args):
         self.percent_dense = training_args.percent_dense
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
 
         l = [
             {'params': [self._xyz], 'lr': training_args.position_lr_init * self.spatial_lr_scale, "name": "xyz"},
@@ -191,9 +218,17 @@ class GaussianModel:
             {'params': [self._rotation], 'lr': training_args.rotation_lr, "name": "rotation"}
         ]
 
-        self.optimizer = SparseGaussianAdam(l, lr=0.0, eps=1e-15)
-        # self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        if self.device.type == "cuda":
+            self.optimizer = SparseGaussianAdam(l, lr=0.0, eps=1e-15)
+        else:
+            # SparseGaussianAdam is a CUDA kernel, fall back to dense Adam for CPU tooling
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        for group in self.optimizer.param_groups:
+            group["lr"] *= self.lr_scale
+
+        self.setup_lr_schedule(training_args)
 
+    def setup_lr_schedule(self, training_args):
         self.xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init*self.spatial_lr_scale,
                                                     lr_final=training_args.position_lr_final*self.spatial_lr_scale,
                                                     lr_delay_mult=training_args.position_lr_delay_mult,
@@ -204,7 +239,7 @@ class GaussianModel:
         ''' Learning rate scheduling per step '''
         for param_group in self.optimizer.param_groups:
             if param_group["name"] == "xyz":
-                lr = self.xyz_scheduler_args(iteration)
+                lr = self.xyz_scheduler_args(iteration) * self.lr_scale
                 param_group['lr'] = lr
                 return lr
 
@@ -223,25 +258,40 @@ class GaussianModel:
             l.append('rot_{}'.format(i))
         return l
 
-    def save_ply(self, path):
-        mkdir_p(os.path.dirname(path))
-
-        xyz = self._xyz.detach().cpu().numpy()
+    def capture_ply(self):
+        """
+        Host copy of everything save_ply writes, see write_ply. The arrays never
+        alias the parameters, even when the model lives on the CPU.
+        """
+        return {"attributes": self.construct_list_of_attributes(),
+                "xyz": self._xyz.detach().to("cpu", copy=True).numpy(),
+                "f_dc": self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().to("cpu", copy=True).numpy(),
+                "f_rest": self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().to("cpu", copy=True).numpy(),
+                "opacities": self._opacity.detach().to("cpu", copy=True).numpy(),
+                "scale": self._scaling.detach().to("cpu", copy=True).numpy(),
+                "rotation": self._rotation.detach().to("cpu", copy=True).numpy(),
+                }
+
+    @staticmethod
+    def write_ply(data, path):
+        """
+        Write the output of capture_ply, does not touch the model so it can run on another thread.
+        """
+        xyz = data["xyz"]
         normals = np.zeros_like(xyz)
-        f_dc = self._features_dc.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        f_rest = self._features_rest.detach().transpose(1, 2).flatten(start_dim=1).contiguous().cpu().numpy()
-        opacities = self._opacity.detach().cpu().numpy()
-        scale = self._scaling.detach().cpu().numpy()
-        rotation = self._rotation.detach().cpu().numpy()
 
-        dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
+        dtype_full = [(attribute, 'f4') for attribute in data["attributes"]]
 
         elements = np.empty(xyz.shape[0], dtype=dtype_full)
-        attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
+        attributes = np.concatenate((xyz, normals, data["f_dc"], data["f_rest"], data["opacities"], data["scale"], data["rotation"]), axis=1)
         elements[:] = list(map(tuple, attributes))
         el = PlyElement.describe(elements, 'vertex')
         PlyData([el]).write(path)
 
+    def save_ply(self, path):
+        mkdir_p(os.path.dirname(path))
+        self.write_ply(self.capture_ply(), path)
+
     def reset_opacity(self):
         opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity)*0.01))
         optimizable_tensors = self.replace_tensor_to_optimizer(opacities_new, "opacity")
@@ -281,15 +331,60 @@ class GaussianModel:
         for idx, attr_name in enumerate(rot_names):
             rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
 
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").contiguous().requires_grad_(True))
-        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device=self.device).contiguous().requires_grad_(True))
+        self._features_dc = nn.Parameter(torch.tensor(features_dc, dtype=torch.float, device=self.device).transpose(1, 2).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(torch.tensor(features_extra, dtype=torch.float, device=self.device).transpose(1, 2).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device=self.device).requires_grad_(True))
+        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device=self.device).requires_grad_(True))
+        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device=self.device).requires_grad_(True))
 
         self.active_sh_degree = self.max_sh_degree
 
+    def save_compressed(self, path, **kwargs):
+        """
+        Quantised export, see utils/compression_utils.py. Keyword arguments are
+        forwarded to compress_gaussians.
+        """
+        mkdir_p(os.path.dirname(path))
+        return compress_gaussians(self, path, **kwargs)
+
+    def save_lod(self, path, **kwargs):
+        """
+        Tiled level of detail hierarchy, see utils/lod_utils.py. Keyword
+        arguments are forwarded to lod_utils.save_lod.
+        """
+        mkdir_p(path)
+        return save_lod(self, path, **kwargs)
+
+    def save_tiles(self, path, **kwargs):
+        """
+        Spatially tiled compressed export, see utils/tile_utils.py. Keyword
+        arguments are forwarded to tile_utils.save_tiles.
+        """
+        mkdir_p(path)
+        return save_tiles(self, path, **kwargs)
+
+    def load_tiles(self, path, camera=None):
+        """
+        Load the tiles written by save_tiles, only those visible from camera if given.
+        """
+        self.load_decoded(load_tiles(path, camera=camera))
+
+    def load_compressed(self, path):
+        self.load_decoded(decompress_gaussians(path))
+
+    def load_decoded(self, data):
+        assert data["sh_degree"] == self.max_sh_degree
+
+        self._xyz = nn.Parameter(torch.tensor(data["xyz"], dtype=torch.float, device=self.device).requires_grad_(True))
+        self._features_dc = nn.Parameter(torch.tensor(data["f_dc"], dtype=torch.float, device=self.device).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(torch.tensor(data["f_rest"], dtype=torch.float, device=self.device).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(torch.tensor(data["opacity"], dtype=torch.float, device=self.device).requires_grad_(True))
+        self._scaling = nn.Parameter(torch.tensor(data["scaling"], dtype=torch.float, device=self.device).requires_grad_(True))
+        self._rotation = nn.Parameter(torch.tensor(data["rotation"], dtype=torch.float, device=self.device).requires_grad_(True))
+
+        self.active_sh_degree = data["active_sh_degree"]
+
     def replace_tensor_to_optimizer(self, tensor, name):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
@@ -382,9 +477,9 @@ class GaussianModel:
         self._scaling = optimizable_tensors["scaling"]
         self._rotation = optimizable_tensors["rotation"]
 
-        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device=self.device)
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)
 
 
     def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size):
@@ -405,13 +500,26 @@ class GaussianModel:
 
 
     def add_densification_stats(self, viewspace_point_tensor, update_filter):
-        self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)
-        self.denom[update_filter] += 1
+        # update_filter is a boolean mask, torch.where avoids the sync of boolean indexing
+        update_filter = update_filter.reshape(-1, 1)
+        self.xyz_gradient_accum += torch.where(update_filter, torch.norm(viewspace_point_tensor.grad[:,:2], dim=-1, keepdim=True), 0)
+        self.denom += update_filter
 
 
     def add_densification_stats_culling(self, viewspace_point_tensor, update_filter, factor):
-        self.xyz_gradient_accum[update_filter] += (torch.norm(viewspace_point_tensor.grad[update_filter,:2], dim=-1, keepdim=True)*factor[update_filter])
-        self.denom[update_filter] += 1        
+        update_filter = update_filter.reshape(-1, 1)
+        self.xyz_gradient_accum += torch.where(update_filter, torch.norm(viewspace_point_tensor.grad[:,:2], dim=-1, keepdim=True)*factor, 0)
+        self.denom += update_filter
+
+
+    def view_culled(self, view_index):
+        """
+        Whether any Gaussian is culled in the training view view_index.
+        The flags of all views are read back once after every change of _culling.
+        """
+        if self._view_culled is None or self._view_culled[0]() is not self._culling or self._view_culled[1] != self._culling._version:
+            self._view_culled = (weakref.ref(self._culling), self._culling._version, self._culling.any(dim=0).tolist())
+        return self._view_culled[2][view_index]
 
 
     def densify_and_clone(self, grads, grad_threshold, scene_extent):
@@ -439,14 +547,14 @@ class GaussianModel:
     def densify_and_split(self, grads, grad_threshold, scene_extent, N=2):
         n_init_points = self.get_xyz.shape[0]
         # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
+        padded_grad = torch.zeros((n_init_points), device=self.device)
         padded_grad[:grads.shape[0]] = grads.squeeze()
         selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
         selected_pts_mask = torch.logical_and(selected_pts_mask,
                                               torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent)
 
         stds = self.get_scaling[selected_pts_mask].repeat(N,1)
-        means =torch.zeros((stds.size(0), 3),device="cuda")
+        means =torch.zeros((stds.size(0), 3),device=self.device)
         samples = torch.normal(mean=means, std=stds)
         rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N,1,1)
         new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
@@ -463,7 +571,7 @@ class GaussianModel:
         new_factor_culling = self.factor_culling[selected_pts_mask].repeat(N,1)
         self.factor_culling = torch.cat((self.factor_culling, new_factor_culling))                  
 
-        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
+        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device=self.device, dtype=bool)))
         self.prune_points(prune_filter)
 
 
@@ -489,19 +597,19 @@ class GaussianModel:
     def densify_and_split_mask(self, grads, grad_threshold, scene_extent, mask, N=2):
         n_init_points = self.get_xyz.shape[0]
         # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
+        padded_grad = torch.zeros((n_init_points), device=self.device)
         padded_grad[:grads.shape[0]] = grads.squeeze()
         selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
         selected_pts_mask = torch.logical_and(selected_pts_mask,
                                               torch.max(self.get_scaling, dim=1).values > self.percent_dense*scene_extent)
 
-        padded_mask = torch.zeros((n_init_points), dtype=torch.bool, device='cuda')
+        padded_mask = torch.zeros((n_init_points), dtype=torch.bool, device=self.device)
         padded_mask[:grads.shape[0]] = mask
         selected_pts_mask = torch.logical_or(selected_pts_mask, padded_mask)
         
 
         stds = self.get_scaling[selected_pts_mask].repeat(N,1)
-        means = torch.zeros((stds.size(0), 3),device="cuda")
+        means = torch.zeros((stds.size(0), 3),device=self.device)
         samples = torch.normal(mean=means, std=stds)
         rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N,1,1)
         new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
@@ -519,7 +627,7 @@ class GaussianModel:
         new_factor_culling = self.factor_culling[selected_pts_mask].repeat(N,1)
         self.factor_culling = torch.cat((self.factor_culling, new_factor_culling))          
 
-        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
+        prune_filter = torch.cat((selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device=self.device, dtype=bool)))
         self.prune_points(prune_filter)
 
 
@@ -528,18 +636,18 @@ class GaussianModel:
 
         fused_point_cloud = pts
         fused_color = RGB2SH(rgb)
-        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().cuda()
+        features = torch.zeros((fused_color.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().to(self.device)
         features[:, :3, 0 ] = fused_color
         features[:, 3:, 1:] = 0.0
 
         # print("Number of points at initialisation : ", fused_point_cloud.shape[0])
 
-        dist2 = torch.clamp_min(distCUDA2(fused_point_cloud), 0.0000001)
+        dist2 = torch.clamp_min(distKNN(fused_point_cloud), 0.0000001)
         scales = torch.log(torch.sqrt(dist2))[...,None].repeat(1, 3)
-        rots = torch.zeros((fused_point_cloud.shape[0], 4), device="cuda")
+        rots = torch.zeros((fused_point_cloud.shape[0], 4), device=self.device)
         rots[:, 0] = 1
 
-        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device="cuda"))
+        opacities = inverse_sigmoid(0.1 * torch.ones((fused_point_cloud.shape[0], 1), dtype=torch.float, device=self.device))
 
         self._xyz = nn.Parameter(fused_point_cloud.contiguous().requires_grad_(True))
         self._features_dc = nn.Parameter(features[:,:,0:1].transpose(1, 2).contiguous().requires_grad_(True))
@@ -547,13 +655,13 @@ class GaussianModel:
         self._scaling = nn.Parameter(scales.requires_grad_(True))
         self._rotation = nn.Parameter(rots.requires_grad_(True))
         self._opacity = nn.Parameter(opacities.requires_grad_(True))
-        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")  
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device=self.device)  
 
 
 
     def init_culling(self, num_views):
-        self._culling=torch.zeros((self._xyz.shape[0], num_views), dtype=torch.bool, device='cuda')
-        self.factor_culling=torch.ones((self._xyz.shape[0],1), device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], num_views), dtype=torch.bool, device=self.device)
+        self.factor_culling=torch.ones((self._xyz.shape[0],1), device=self.device)
 
 
 
@@ -601,8 +709,8 @@ class GaussianModel:
 
     def interesction_sampling(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -641,8 +749,8 @@ class GaussianModel:
 
     def interesction_preserving(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -669,7 +777,7 @@ class GaussianModel:
 
     def importance_pruning(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -687,13 +795,13 @@ class GaussianModel:
 
     def visibility_culling(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device=self.device)
 
-        count_rad = torch.zeros((self._xyz.shape[0],1)).cuda()
-        count_vis = torch.zeros((self._xyz.shape[0],1)).cuda()
+        count_rad = torch.zeros((self._xyz.shape[0],1)).to(self.device)
+        count_vis = torch.zeros((self._xyz.shape[0],1)).to(self.device)
 
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -719,8 +827,8 @@ class GaussianModel:
 
     def aggressive_clone(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
         for view in views:
@@ -745,14 +853,14 @@ class GaussianModel:
     # aggressive_clone with visibility_culling
     def culling_with_clone(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device=self.device)
 
-        count_rad = torch.zeros((self._xyz.shape[0],1)).cuda()
-        count_vis = torch.zeros((self._xyz.shape[0],1)).cuda()
+        count_rad = torch.zeros((self._xyz.shape[0],1)).to(self.device)
+        count_vis = torch.zeros((self._xyz.shape[0],1)).to(self.device)
 
         for view in views:
             # render_pkg = render_simp(view, self, pipe, background)
@@ -818,14 +926,14 @@ class GaussianModel:
     # interesction_preserving with visibility_culling
     def culling_with_interesction_preserving(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device=self.device)
 
-        count_rad = torch.zeros((self._xyz.shape[0],1)).cuda()
-        count_vis = torch.zeros((self._xyz.shape[0],1)).cuda()
+        count_rad = torch.zeros((self._xyz.shape[0],1)).to(self.device)
+        count_vis = torch.zeros((self._xyz.shape[0],1)).to(self.device)
 
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -864,14 +972,14 @@ class GaussianModel:
     # interesction_sampling with visibility_culling
     def culling_with_interesction_sampling(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
-        accum_area_max = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
+        accum_area_max = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device=self.device)
 
-        count_rad = torch.zeros((self._xyz.shape[0],1)).cuda()
-        count_vis = torch.zeros((self._xyz.shape[0],1)).cuda()
+        count_rad = torch.zeros((self._xyz.shape[0],1)).to(self.device)
+        count_vis = torch.zeros((self._xyz.shape[0],1)).to(self.device)
 
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -913,20 +1021,20 @@ class GaussianModel:
         self.factor_culling=count_vis/(count_rad+1e-1)
 
         prune_mask = (count_vis<=1)[:,0]
-        prune_mask = torch.logical_or(prune_mask, torch.tensor(non_prune_mask==False, device='cuda'))
+        prune_mask = torch.logical_or(prune_mask, torch.tensor(non_prune_mask==False, device=self.device))
         self.prune_points(prune_mask) 
 
 
     # importance_pruning with visibility_culling
     def culling_with_importance_pruning(self, scene, render_simp, iteration, args, pipe, background):
 
-        imp_score = torch.zeros(self._xyz.shape[0]).cuda()
+        imp_score = torch.zeros(self._xyz.shape[0]).to(self.device)
         views = scene.getTrainCameras_warn_up(iteration, args.warn_until_iter, scale=1.0, scale2=2.0).copy()
 
-        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device='cuda')
+        self._culling=torch.zeros((self._xyz.shape[0], len(views)), dtype=torch.bool, device=self.device)
 
-        count_rad = torch.zeros((self._xyz.shape[0],1)).cuda()
-        count_vis = torch.zeros((self._xyz.shape[0],1)).cuda()
+        count_rad = torch.zeros((self._xyz.shape[0],1)).to(self.device)
+        count_vis = torch.zeros((self._xyz.shape[0],1)).to(self.device)
 
         for view in views:
             render_pkg = render_simp(view, self, pipe, background, culling=self._culling[:,view.uid])
@@ -953,13 +1061,40 @@ class GaussianModel:
 
     def extend_features_rest(self):
 
-        features = torch.zeros((self._xyz.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().cuda()
+        features = torch.zeros((self._xyz.shape[0], 3, (self.max_sh_degree + 1) ** 2)).float().to(self.device)
         self._features_rest = nn.Parameter(features[:,:,1:].transpose(1, 2).contiguous().requires_grad_(True))
 
 
-
-
-
-
-
-
+    @torch.no_grad()
+    def bake_sh_dc(self, camera_centers, distance_factor=10.0, rest_ratio=0.05, chunk_size=8192):
+        """
+        Fold the view dependent colour of distant or low-frequency Gaussians into
+        their DC term and zero their higher-order coefficients, so that renderers
+        and exports can skip them.
+        :param camera_centers: [M, 3] positions the model is viewed from
+        :param distance_factor: Gaussians further than this many camera extents from the cameras are baked
+        :param rest_ratio: Gaussians whose higher-order energy is below this fraction of the DC one are baked
+        :return mask of the baked Gaussians
+        """
+        camera_centers = camera_centers.to(self.device)
+        if self._features_rest.shape[1] == 0 or self.active_sh_degree == 0:
+            return torch.zeros(self._xyz.shape[0], dtype=torch.bool, device=self.device)
+
+        center = camera_centers.mean(0)
+        camera_extent = (camera_centers - center).norm(dim=1).max()
+        distant = (self._xyz - center).norm(dim=1) > distance_factor * camera_extent
+        low_frequency = self._features_rest.norm(dim=(1, 2)) < rest_ratio * self._features_dc.norm(dim=(1, 2))
+        mask = distant | low_frequency
+
+        # SH evaluation is linear in the basis, so the colour averaged over all
+        # cameras only needs the averaged basis
+        indices = mask.nonzero().squeeze(-1)
+        for start in range(0, indices.shape[0], chunk_size):
+            idx = indices[start:start + chunk_size]
+            dirs = self._xyz[idx, None] - camera_centers[None]
+            dirs = dirs / dirs.norm(dim=-1, keepdim=True)
+            basis = eval_sh_basis(self.active_sh_degree, dirs).mean(1)
+            colors = (basis.unsqueeze(1) @ self.get_features[idx, :basis.shape[-1]]).squeeze(1)
+            self._features_dc[idx] = (colors / C0).unsqueeze(1)
+        self._features_rest[mask] = 0
+        return mask
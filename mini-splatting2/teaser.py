@@ -10,25 +10,23 @@ from gaussian_renderer import render, render_imp, render_simp, render_depth
 import sys
 from scene import Scene, GaussianModel
 from utils.general_utils import safe_state
+from utils.sync_utils import SyncCounter, TrainingMetrics
 import uuid
 from tqdm import tqdm
 from utils.image_utils import psnr
 from argparse import ArgumentParser, Namespace
 from arguments import ModelParams, PipelineParams, OptimizationParams, read_config
-try:
-    from torch.utils.tensorboard import SummaryWriter
-    TENSORBOARD_FOUND = True
-except ImportError:
-    TENSORBOARD_FOUND = False
+from importlib.util import find_spec
+# torch.utils.tensorboard is imported when the writer is created
+TENSORBOARD_FOUND = find_spec("tensorboard") is not None
 
 import numpy as np
 from lpipsPyTorch import lpips
 from utils.sh_utils import SH2RGB
 import time
 
-import open3d as o3d
-
 def gs2ply(gaussians, path_save):
+    import open3d as o3d
 
     path_dir = os.path.dirname(path_save)
     if not os.path.exists(path_dir):
@@ -64,6 +62,8 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
     viewpoint_stack = None
     ema_loss_for_log = 0.0
+    metrics = TrainingMetrics(args.sync_interval) if args.low_sync else None
+    sync_counter = SyncCounter() if args.count_syncs else None
     progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
     first_iter += 1
 
@@ -72,21 +72,12 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
     for iteration in range(first_iter, opt.iterations + 1):   
 
-        if network_gui.conn == None:
-            network_gui.try_connect()
-        while network_gui.conn != None:
-            try:
-                net_image_bytes = None
-                custom_cam, do_training, pipe.convert_SHs_python, pipe.compute_cov3D_python, keep_alive, scaling_modifer = network_gui.receive()
-                if custom_cam != None:
-                    net_image = render_imp(custom_cam, gaussians, pipe, background, scaling_modifer)["render"]
-                    net_image_bytes = memoryview((torch.clamp(net_image, min=0, max=1.0) * 255).byte().permute(1, 2, 0).contiguous().cpu().numpy())
-                network_gui.send(net_image_bytes, dataset.source_path)
-                if do_training and ((iteration < int(opt.iterations)) or not keep_alive):
-                    break
-            except Exception as e:
-                network_gui.conn = None
+        if network_gui.conn != None:
+            network_gui.serve(lambda model, custom_cam, scaling_modifer: render_imp(custom_cam, model, pipe, background, scaling_modifer)["render"],
+                              gaussians, dataset.source_path, pipe, iteration, opt.iterations)
 
+        if metrics is not None:
+            iter_start, iter_end = metrics.events()
         iter_start.record()
 
         gaussians.update_learning_rate(iteration)
@@ -120,7 +111,13 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
 
         with torch.no_grad():
             # Progress bar
-            ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
+            if metrics is None:
+                ema_loss_for_log = 0.4 * loss.item() + 0.6 * ema_loss_for_log
+            else:
+                metrics.record(iteration, Ll1, loss)
+                if metrics.due(iteration, opt.iterations):
+                    metrics.flush(tb_writer)
+                    ema_loss_for_log = metrics.ema_loss
             if iteration % 10 == 0:
                 progress_bar.set_postfix({"Loss": f"{ema_loss_for_log:.{7}f}"})
                 progress_bar.update(10)
@@ -128,7 +125,7 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
                 progress_bar.close()
 
             # Log and save
-            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end), testing_iterations, scene, render, (pipe, background))
+            training_report(tb_writer, iteration, Ll1, loss, l1_loss, iter_start.elapsed_time(iter_end) if metrics is None else None, testing_iterations, scene, render, (pipe, background))
             if (iteration in saving_iterations):
                 print("\n[ITER {}] Saving Gaussians".format(iteration))
                 scene.save(iteration)
@@ -136,9 +133,9 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
             # # Densification
             if iteration < opt.densify_until_iter:
                 # Keep track of max radii in image-space for pruning
-                gaussians.max_radii2D[visibility_filter] = torch.max(gaussians.max_radii2D[visibility_filter], radii[visibility_filter])
+                gaussians.max_radii2D = torch.where(visibility_filter, torch.max(gaussians.max_radii2D, radii), gaussians.max_radii2D)
 
-                if gaussians._culling[:,viewpoint_cam.uid].sum()==0:
+                if not gaussians.view_culled(viewpoint_cam.uid):
                     gaussians.add_densification_stats(viewspace_point_tensor, visibility_filter)
                 else:
                     # normalize xy gradient after culling
@@ -220,6 +217,14 @@ def training(dataset, opt, pipe, testing_iterations, saving_iterations, checkpoi
                 print("\n[ITER {}] Saving Checkpoint".format(iteration))
                 torch.save((gaussians.capture(), iteration), scene.model_path + "/chkpnt" + str(iteration) + ".pth")  
 
+            if sync_counter is not None:
+                syncs = sync_counter.step()
+                if tb_writer:
+                    tb_writer.add_scalar('syncs_per_iter', syncs, iteration)
+
+    if sync_counter is not None:
+        print("\n[SYNC] " + sync_counter.summary())
+        sync_counter.close()
     print('Num of Guassians: %d'%(gaussians._xyz.shape[0]))
     return 
 
@@ -248,13 +253,15 @@ def prepare_output_and_logger(args):
     # Create Tensorboard writer
     tb_writer = None
     if TENSORBOARD_FOUND:
+        from torch.utils.tensorboard import SummaryWriter
         tb_writer = SummaryWriter(args.model_path)
     else:
         print("Tensorboard not available: not logging progress")
     return tb_writer
 
 def training_report(tb_writer, iteration, Ll1, loss, l1_loss, elapsed, testing_iterations, scene : Scene, renderFunc, renderArgs):
-    if tb_writer:
+    # elapsed is None in low-sync mode, TrainingMetrics logs the losses
+    if tb_writer and elapsed is not None:
         tb_writer.add_scalar('train_loss_patches/l1_loss', Ll1.item(), iteration)
         tb_writer.add_scalar('train_loss_patches/total_loss', loss.item(), iteration)
         tb_writer.add_scalar('iter_time', elapsed, iteration)
@@ -318,6 +325,10 @@ if __name__ == "__main__":
     pp = PipelineParams(parser)
     parser.add_argument('--ip', type=str, default="127.0.0.1")
     parser.add_argument('--port', type=int, default=6009)
+    parser.add_argument('--gui_max_fps', type=float, default=30.0)
+    parser.add_argument('--gui_iters_per_frame', type=int, default=1)
+    parser.add_argument('--gui_snapshot_interval', type=int, default=0, help="render viewer frames on a separate thread from a parameter snapshot refreshed every N iterations")
+    parser.add_argument('--gui_budget', type=float, default=0.1, help="fraction of device time the snapshot viewer may use")
     parser.add_argument('--debug_from', type=int, default=-1)
     parser.add_argument('--detect_anomaly', action='store_true', default=False)
     parser.add_argument("--test_iterations", nargs="+", type=int, default=[])
@@ -325,6 +336,9 @@ if __name__ == "__main__":
     parser.add_argument("--quiet", action="store_true")
     parser.add_argument("--checkpoint_iterations", nargs="+", type=int, default=[])
     parser.add_argument("--start_checkpoint", type=str, default = None)
+    parser.add_argument("--low_sync", action="store_true", help="keep the training metrics on the device and read them back every --sync_interval iterations")
+    parser.add_argument("--sync_interval", type=int, default=100)
+    parser.add_argument("--count_syncs", action="store_true", help="count the host-device synchronisations of every iteration")
 
     parser.add_argument("--imp_metric", required=True, type=str, default = 'outdoor')
 
@@ -354,7 +368,7 @@ if __name__ == "__main__":
     safe_state(args.quiet)
 
     # Start GUI server, configure and run training
-    network_gui.init(args.ip, args.port)
+    network_gui.init(args.ip, args.port, args.gui_max_fps, args.gui_iters_per_frame, args.gui_snapshot_interval, args.gui_budget)
     torch.autograd.set_detect_anomaly(args.detect_anomaly)
 
     training(lp.extract(args), op.extract(args), pp.extract(args), args.test_iterations, args.save_iterations, args.checkpoint_iterations, args.start_checkpoint, args.debug_from, args)
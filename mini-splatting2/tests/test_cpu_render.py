@@ -0,0 +1,108 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Regression tests of the render paths on the CPU reference rasterizer, they
+# need neither a GPU nor the CUDA extensions. Run from mini-splatting2 with
+#   python -m pytest tests   or   python -m unittest discover tests
+
+import os
+import sys
+import math
+import unittest
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from argparse import Namespace
+from scene.gaussian_model import GaussianModel
+from scene.cameras import MiniCam
+from utils.graphics_utils import getWorld2View2, getProjectionMatrix
+from utils.sh_utils import RGB2SH
+from gaussian_renderer import render, render_imp, render_simp
+
+
+def make_camera(width=64, height=48, fovx=math.radians(60)):
+    fovy = 2 * math.atan(math.tan(fovx / 2) * height / width)
+    world_view = torch.tensor(getWorld2View2(np.eye(3), np.zeros(3))).transpose(0, 1)
+    projection = getProjectionMatrix(znear=0.01, zfar=100.0, fovX=fovx, fovY=fovy).transpose(0, 1)
+    full_proj = world_view.unsqueeze(0).bmm(projection.unsqueeze(0)).squeeze(0)
+    return MiniCam(width, height, fovy, fovx, 0.01, 100.0, world_view, full_proj)
+
+
+def make_gaussians(xyz, rgb, scale=0.1, opacity=0.99):
+    """
+    Isotropic, SH degree 0 Gaussians on the CPU.
+    """
+    gaussians = GaussianModel(0, device="cpu")
+    n = xyz.shape[0]
+    gaussians._xyz = xyz.float()
+    gaussians._features_dc = RGB2SH(rgb.float())[:, None, :]
+    gaussians._features_rest = torch.zeros((n, 0, 3))
+    gaussians._scaling = torch.full((n, 3), math.log(scale))
+    gaussians._rotation = torch.tensor([[1.0, 0.0, 0.0, 0.0]]).repeat(n, 1)
+    gaussians._opacity = gaussians.inverse_opacity_activation(torch.full((n, 1), opacity))
+    return gaussians
+
+
+class CPURenderTest(unittest.TestCase):
+    def setUp(self):
+        self.camera = make_camera()
+        self.pipe = Namespace(convert_SHs_python=False, compute_cov3D_python=False, debug=False)
+        self.background = torch.zeros(3)
+        # In front of the camera, left of the centre, then right, then behind it
+        xyz = torch.tensor([[-0.5, 0.0, 3.0], [0.5, 0.0, 3.0], [0.0, 0.0, -3.0]])
+        rgb = torch.tensor([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        self.gaussians = make_gaussians(xyz, rgb)
+
+    def test_render(self):
+        with torch.no_grad():
+            out = render(self.camera, self.gaussians, self.pipe, self.background)
+        image, radii = out["render"], out["radii"]
+        self.assertEqual(tuple(image.shape), (3, 48, 64))
+        self.assertTrue(torch.isfinite(image).all())
+        self.assertEqual(radii.tolist()[2], 0)
+        self.assertTrue((radii[:2] > 0).all())
+        self.assertTrue(torch.equal(out["visibility_filter"], radii > 0))
+
+        # Red on the left, green on the right, background in the corners
+        left, right = image[:, 24, 64 // 2 - 10], image[:, 24, 64 // 2 + 10]
+        self.assertGreater(left[0].item(), 0.5)
+        self.assertLess(left[1].item(), 0.1)
+        self.assertGreater(right[1].item(), 0.5)
+        self.assertLess(right[0].item(), 0.1)
+        self.assertTrue(torch.allclose(image[:, 0, 0], self.background))
+
+    def test_background(self):
+        background = torch.tensor([1.0, 1.0, 1.0])
+        gaussians = make_gaussians(torch.tensor([[0.0, 0.0, -3.0]]), torch.ones(1, 3))
+        with torch.no_grad():
+            out = render(self.camera, gaussians, self.pipe, background)
+        self.assertTrue(torch.allclose(out["render"], background[:, None, None].expand(3, 48, 64)))
+        self.assertFalse(out["visibility_filter"].any())
+
+    def test_render_paths_agree(self):
+        with torch.no_grad():
+            reference = render(self.camera, self.gaussians, self.pipe, self.background)
+            imp = render_imp(self.camera, self.gaussians, self.pipe, self.background)
+            simp = render_simp(self.camera, self.gaussians, self.pipe, self.background)
+        for out in (imp, simp):
+            self.assertTrue(torch.allclose(out["render"], reference["render"], atol=1e-6))
+            self.assertTrue(torch.equal(out["radii"], reference["radii"]))
+        self.assertTrue(torch.equal(imp["visibility_filter"], reference["visibility_filter"]))
+        self.assertEqual(simp["visibility_filter"].flatten().tolist(), [0, 1])
+        # Only visible Gaussians collect blending weights
+        self.assertTrue((simp["accum_weights"][:2] > 0).all())
+        self.assertEqual(simp["accum_weights"][2].item(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
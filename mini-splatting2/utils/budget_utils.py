@@ -0,0 +1,119 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Wall-clock budget for training. Every check_interval iterations the time per
+# iteration of the last window gives the number of iterations the remaining
+# budget still affords, and every milestone of the schedule that has not been
+# reached yet (total iterations, densification end, simplification steps, LR
+# decay length, ...) is moved to its original value times the same scale.
+# Milestones already reached are left alone and a milestone is never moved
+# before the current iteration, so no schedule event is skipped.
+# scale_schedule and scale_iterations apply a fixed scale up front, e.g.
+# 1 / batch_size when every step renders batch_size views.
+
+import time
+
+
+def scale_schedule(milestones, scale):
+    """
+    Multiply the iteration numbers (or intervals) held by milestones by scale.
+    Values <= 0 mean disabled and are left alone, the others stay >= 1.
+    :param milestones: list of (object, attribute)
+    """
+    for obj, attr in milestones:
+        value = getattr(obj, attr)
+        if value > 0:
+            setattr(obj, attr, max(int(round(value * scale)), 1))
+
+
+def scale_iterations(iterations, scale):
+    """
+    scale_schedule for a list of iterations (e.g. save_iterations).
+    """
+    return sorted(set(max(int(round(i * scale)), 1) if i > 0 else i for i in iterations))
+
+
+class TimeBudget:
+    """
+    :param budget: seconds for the training loop, measured from start()
+    :param milestones: list of (object, attribute) holding iteration numbers,
+                       the first one is the total number of iterations
+    :param margin: fraction of the budget kept for evaluation and saving
+    :param min_scale, max_scale: bounds of the scale of the schedule
+    """
+    def __init__(self, budget, milestones, check_interval=500, first_check=200, margin=0.05, min_scale=0.05, max_scale=1.0):
+        self.budget = budget
+        self.milestones = [(obj, attr, getattr(obj, attr)) for obj, attr in milestones]
+        self.check_interval = check_interval
+        self.first_check = first_check
+        self.margin = margin
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale = 1.0
+        self.previous_total = self.total
+        self._start = None
+        self._window = None
+
+    @property
+    def total(self):
+        obj, attr, _ = self.milestones[0]
+        return getattr(obj, attr)
+
+    @property
+    def max_total(self):
+        return int(self.milestones[0][2] * self.max_scale)
+
+    def start(self, iteration):
+        self._start = time.time()
+        self._window = (self._start, iteration)
+        self._next_check = iteration + self.first_check
+
+    def update(self, iteration):
+        """
+        Call at the end of every iteration.
+        :return True when the schedule was rescaled
+        """
+        if iteration < self._next_check or iteration >= self.total:
+            return False
+        now = time.time()
+        window_start, window_iteration = self._window
+        seconds_per_iteration = (now - window_start) / max(iteration - window_iteration, 1)
+        self._window = (now, iteration)
+        self._next_check = iteration + self.check_interval
+
+        remaining = self.budget * (1 - self.margin) - (now - self._start)
+        original_total = self.milestones[0][2]
+        total = iteration + max(remaining, 0) / seconds_per_iteration
+        scale = min(max(total / original_total, self.min_scale), self.max_scale)
+        if abs(scale - self.scale) * original_total < 1:
+            return False
+        self.scale = scale
+        self.previous_total = self.total
+
+        for obj, attr, original in self.milestones:
+            if getattr(obj, attr) > iteration:
+                setattr(obj, attr, max(int(round(original * scale)), iteration + 1))
+        return True
+
+    def rescale(self, iterations, originals, iteration):
+        """
+        Move every iteration of a list that is not reached yet (e.g. checkpoint_iterations)
+        to its original value times the current scale, like the milestones.
+        :param originals: the list before any rescaling, aligned with iterations
+        """
+        return [i if i <= iteration else max(int(round(original * self.scale)), iteration + 1)
+                for i, original in zip(iterations, originals)]
+
+    def remap(self, iterations):
+        """
+        Move the last iteration in a list of iterations (e.g. save_iterations) to the rescaled total.
+        """
+        return [self.total if i == self.previous_total else i for i in iterations]
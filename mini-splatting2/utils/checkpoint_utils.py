@@ -0,0 +1,193 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Compact checkpoint format:
+#   8 bytes magic | uint64 header size | JSON header | raw tensor blobs
+# Every blob starts on an ALIGNMENT boundary so that it can be viewed in place
+# from a memory map, restoring a checkpoint then only touches the pages that
+# are actually used instead of unpickling the whole file.
+
+import json
+import struct
+import numpy as np
+import torch
+
+MAGIC = b"GSCKPT\x00\x01"
+ALIGNMENT = 64
+
+CAPTURE_FIELDS = ["active_sh_degree", "xyz", "features_dc", "features_rest", "scaling", "rotation", "opacity",
+                  "max_radii2D", "xyz_gradient_accum", "denom", "optimizer", "spatial_lr_scale"]
+
+# Adam moments are the only tensors that may be stored in half precision
+MOMENT_KEYS = ("exp_avg", "exp_avg_sq")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _json_value(value):
+    if torch.is_tensor(value):
+        return value.item()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def _encode_moment(key, tensor):
+    # The second moment is stored as its square root, squared gradients
+    # routinely fall below the smallest float16 value
+    tensor = tensor.float()
+    if key == "exp_avg_sq":
+        tensor = tensor.sqrt()
+    fp16_max = torch.finfo(torch.float16).max
+    return tensor.clamp(-fp16_max, fp16_max).half()
+
+
+def save_checkpoint(path, model_args, iteration, extras=None, fp16_moments=False):
+    """
+    Write the output of GaussianModel.capture() in the compact format.
+    :param extras: optional dict of additional tensors, e.g. the culling state
+    :param fp16_moments: store the Adam moments in half precision
+    """
+    tensors = {}
+    header = {"iteration": iteration, "fields": {}, "optimizer": {}, "tensors": {}}
+    for name, value in zip(CAPTURE_FIELDS, model_args):
+        if name == "optimizer":
+            continue
+        if torch.is_tensor(value):
+            tensors[name] = value
+        else:
+            header["fields"][name] = _json_value(value)
+
+    opt_dict = model_args[CAPTURE_FIELDS.index("optimizer")]
+    header["optimizer"]["param_groups"] = [{k: _json_value(v) for k, v in group.items()} for group in opt_dict["param_groups"]]
+    header["optimizer"]["state"] = {}
+    for idx, state in opt_dict["state"].items():
+        scalars = {}
+        for key, value in state.items():
+            if torch.is_tensor(value) and value.dim() > 0:
+                if fp16_moments and key in MOMENT_KEYS:
+                    value = _encode_moment(key, value)
+                tensors["optimizer.{}.{}".format(idx, key)] = value
+            else:
+                scalars[key] = _json_value(value)
+        header["optimizer"]["state"][str(idx)] = scalars
+    header["optimizer"]["fp16_moments"] = fp16_moments
+
+    for name, value in (extras or {}).items():
+        tensors["extras." + name] = value
+
+    offset = 0
+    arrays = {}
+    for name, value in tensors.items():
+        array = value.detach().cpu().contiguous().numpy()
+        arrays[name] = array
+        header["tensors"][name] = {"dtype": array.dtype.name, "shape": list(array.shape), "offset": offset, "nbytes": array.nbytes}
+        offset = _align(offset + array.nbytes)
+
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + header["tensors"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+
+
+def is_compact_checkpoint(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path):
+    """
+    :return (header dict, byte offset of the first tensor blob)
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a compact checkpoint".format(path))
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size).decode("utf-8"))
+    return header, _align(len(MAGIC) + 8 + header_size)
+
+
+def load_tensors(path, mmap=True):
+    """
+    Tensors of a compact checkpoint. With mmap the tensors are copy-on-write
+    views of the file, pages are read on first access and never written back.
+    """
+    header, data_start = read_header(path)
+    if mmap:
+        buffer = np.memmap(path, dtype=np.uint8, mode="c")
+    else:
+        buffer = np.fromfile(path, dtype=np.uint8)
+
+    tensors = {}
+    for name, info in header["tensors"].items():
+        start = data_start + info["offset"]
+        array = buffer[start:start + info["nbytes"]].view(np.dtype(info["dtype"])).reshape(info["shape"])
+        tensors[name] = torch.from_numpy(array)
+    return header, tensors
+
+
+def load_checkpoint(path, mmap=True):
+    """
+    Load a checkpoint written either by save_checkpoint or by torch.save((capture(), iteration), path).
+    :return (model_args for GaussianModel.restore, iteration, extras dict)
+    """
+    if not is_compact_checkpoint(path):
+        (model_args, iteration) = torch.load(path, weights_only=False)
+        return model_args, iteration, {}
+
+    header, tensors = load_tensors(path, mmap=mmap)
+    fp16_moments = header["optimizer"]["fp16_moments"]
+    opt_state = {}
+    for idx, scalars in header["optimizer"]["state"].items():
+        state = {key: torch.tensor(value) if key == "step" else value for key, value in scalars.items()}
+        prefix = "optimizer.{}.".format(idx)
+        for name, tensor in tensors.items():
+            if name.startswith(prefix):
+                state[name[len(prefix):]] = tensor
+        if fp16_moments and "exp_avg_sq" in state:
+            state["exp_avg_sq"] = state["exp_avg_sq"].float() ** 2
+            # Where the second moment underflowed the first one would produce huge steps
+            state["exp_avg"] = state["exp_avg"].float() * (state["exp_avg_sq"] > 0)
+        opt_state[int(idx)] = state
+    opt_dict = {"state": opt_state, "param_groups": header["optimizer"]["param_groups"]}
+
+    model_args = []
+    for name in CAPTURE_FIELDS:
+        if name == "optimizer":
+            model_args.append(opt_dict)
+        elif name in tensors:
+            model_args.append(tensors[name])
+        else:
+            model_args.append(header["fields"][name])
+    extras = {name[len("extras."):]: tensor for name, tensor in tensors.items() if name.startswith("extras.")}
+    return tuple(model_args), header["iteration"], extras
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Inspect a compact checkpoint without loading it")
+    parser.add_argument("path", type=str)
+    args = parser.parse_args()
+
+    header, _ = read_header(args.path)
+    print("iteration {}, fields {}".format(header["iteration"], header["fields"]))
+    print("fp16 moments: {}".format(header["optimizer"]["fp16_moments"]))
+    for name, info in header["tensors"].items():
+        print("{:<40s} {:<8s} {:<20s} {:>10.2f} MB".format(name, info["dtype"], str(info["shape"]), info["nbytes"] / 2**20))
@@ -0,0 +1,174 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Compressed Gaussian export. Gaussians are sorted along a Morton curve and
+# grouped in chunks of CHUNK_SIZE spatially coherent points:
+#   position   16 bit per axis, relative to the bounds of its chunk
+#   scale      float16 (log space, as stored in the model)
+#   rotation   8 bit per component of the normalised quaternion
+#   opacity    8 bit (after the sigmoid)
+#   f_dc       float16
+#   f_rest     index into a k-means codebook of float16 SH vectors
+# Everything goes into a compressed .npz archive.
+
+import numpy as np
+import torch
+from utils.general_utils import inverse_sigmoid
+
+FORMAT_VERSION = 1
+CHUNK_SIZE = 256
+
+
+def morton_order(xyz, bits=10):
+    """
+    Permutation sorting the points along a 3D Morton (Z-order) curve.
+    :param xyz: numpy array [N, 3]
+    """
+    minn = xyz.min(0)
+    extent = np.maximum(xyz.max(0) - minn, 1e-12)
+    q = np.clip(((xyz - minn) / extent * (1 << bits)).astype(np.int64), 0, (1 << bits) - 1)
+
+    def part1by2(v):
+        v = v & 0x3ff
+        v = (v ^ (v << 16)) & 0xff0000ff
+        v = (v ^ (v << 8)) & 0x0300f00f
+        v = (v ^ (v << 4)) & 0x030c30c3
+        v = (v ^ (v << 2)) & 0x09249249
+        return v
+
+    code = (part1by2(q[:, 2]) << 2) | (part1by2(q[:, 1]) << 1) | part1by2(q[:, 0])
+    return np.argsort(code, kind="stable")
+
+
+def _chunk_bounds(values, chunk_size):
+    # Per-chunk min/max of a [N, D] array, the last chunk may be partial
+    num_chunks = (values.shape[0] + chunk_size - 1) // chunk_size
+    starts = np.arange(num_chunks) * chunk_size
+    return np.minimum.reduceat(values, starts, axis=0), np.maximum.reduceat(values, starts, axis=0)
+
+
+def _nearest(x, codebook, batch_size=8192):
+    norms = (codebook * codebook).sum(1)
+    out = torch.empty(x.shape[0], dtype=torch.long, device=x.device)
+    for start in range(0, x.shape[0], batch_size):
+        xb = x[start:start + batch_size]
+        out[start:start + batch_size] = (norms[None] - 2 * xb @ codebook.T).argmin(1)
+    return out
+
+
+def kmeans_codebook(x, codebook_size=4096, iterations=10, sample_size=262144):
+    """
+    Vector quantisation of the rows of x with k-means. The codebook is fitted
+    on a random subset of the rows and then used to encode all of them.
+    Entry 0 is pinned to the zero vector so Gaussians without view dependent
+    colour (see GaussianModel.bake_sh_dc) stay exact.
+    :param x: torch tensor [N, D]
+    :return (codebook [K, D], indices [N])
+    """
+    N = x.shape[0]
+    codebook_size = min(codebook_size, N + 1)
+    sample = x[torch.randperm(N, device=x.device)[:sample_size]]
+    codebook = torch.cat([torch.zeros_like(x[:1]), sample[torch.randperm(sample.shape[0], device=x.device)[:codebook_size - 1]]])
+
+    for _ in range(iterations):
+        assign = _nearest(sample, codebook)
+        counts = torch.bincount(assign, minlength=codebook.shape[0]).float()
+        sums = torch.zeros_like(codebook).index_add_(0, assign, sample)
+        updated = sums / counts.clamp_min(1)[:, None]
+        # Re-seed empty clusters with random samples
+        empty = counts == 0
+        updated[empty] = sample[torch.randint(0, sample.shape[0], (int(empty.sum()),), device=x.device)]
+        updated[0] = 0
+        codebook = updated
+
+    return codebook, _nearest(x, codebook)
+
+
+@torch.no_grad()
+def compress_gaussians(gaussians, path, codebook_size=4096, kmeans_iterations=10, chunk_size=CHUNK_SIZE, index=None):
+    """
+    Write the compressed representation of a GaussianModel to path (.npz).
+    :param index: optional subset of the Gaussians to write
+    :return dict with the number of Gaussians and the compressed size in bytes
+    """
+    params = {"xyz": gaussians._xyz, "scaling": gaussians._scaling, "rotation": gaussians._rotation,
+              "opacity": gaussians.get_opacity, "f_dc": gaussians._features_dc, "f_rest": gaussians._features_rest}
+    params = {k: v.detach() if index is None else v.detach()[index] for k, v in params.items()}
+
+    xyz = params["xyz"].cpu().numpy()
+    order = morton_order(xyz)
+    order_t = torch.from_numpy(order).to(params["xyz"].device)
+    xyz = xyz[order]
+    N = xyz.shape[0]
+
+    data = {"version": np.array(FORMAT_VERSION), "chunk_size": np.array(chunk_size),
+            "sh_degree": np.array(gaussians.max_sh_degree), "active_sh_degree": np.array(gaussians.active_sh_degree)}
+
+    position_min, position_max = _chunk_bounds(xyz, chunk_size)
+    chunk = np.arange(N) // chunk_size
+    extent = np.maximum(position_max - position_min, 1e-12)
+    data["position_min"] = position_min.astype(np.float32)
+    data["position_max"] = position_max.astype(np.float32)
+    data["position"] = np.round((xyz - position_min[chunk]) / extent[chunk] * 65535).astype(np.uint16)
+
+    data["scale"] = params["scaling"][order_t].cpu().numpy().astype(np.float16)
+    rotation = torch.nn.functional.normalize(params["rotation"][order_t], dim=1).cpu().numpy()
+    data["rotation"] = np.round(rotation * 127).astype(np.int8)
+    opacity = params["opacity"][order_t].cpu().numpy()[:, 0]
+    data["opacity"] = np.round(opacity * 255).astype(np.uint8)
+    data["f_dc"] = params["f_dc"][order_t, 0].cpu().numpy().astype(np.float16)
+
+    f_rest = params["f_rest"][order_t]
+    if f_rest.shape[1] > 0:
+        codebook, indices = kmeans_codebook(f_rest.flatten(start_dim=1), codebook_size, kmeans_iterations)
+        data["sh_codebook"] = codebook.cpu().numpy().astype(np.float16)
+        index_dtype = np.uint16 if codebook.shape[0] <= 65536 else np.uint32
+        data["sh_indices"] = indices.cpu().numpy().astype(index_dtype)
+
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **data)
+        size = f.tell()
+    return {"num_gaussians": N, "bytes": size}
+
+
+def decompress_gaussians(path):
+    """
+    Decode a file written by compress_gaussians into arrays in the parameter
+    space of GaussianModel (the same quantities load_ply reads).
+    """
+    data = np.load(path)
+    if int(data["version"]) != FORMAT_VERSION:
+        raise ValueError("Unsupported compressed format version {}".format(int(data["version"])))
+
+    chunk_size = int(data["chunk_size"])
+    N = data["position"].shape[0]
+    chunk = np.arange(N) // chunk_size
+    position_min, position_max = data["position_min"], data["position_max"]
+    xyz = position_min[chunk] + data["position"].astype(np.float32) / 65535 * (position_max - position_min)[chunk]
+
+    opacity = np.clip(data["opacity"].astype(np.float32) / 255, 0.5 / 255, 1 - 0.5 / 255)
+    rotation = data["rotation"].astype(np.float32) / 127
+
+    num_rest = (int(data["sh_degree"]) + 1) ** 2 - 1
+    if "sh_codebook" in data:
+        f_rest = data["sh_codebook"].astype(np.float32)[data["sh_indices"].astype(np.int64)].reshape(N, num_rest, 3)
+    else:
+        f_rest = np.zeros((N, num_rest, 3), dtype=np.float32)
+
+    return {"xyz": xyz.astype(np.float32),
+            "f_dc": data["f_dc"].astype(np.float32)[:, None, :],
+            "f_rest": f_rest,
+            "opacity": inverse_sigmoid(torch.from_numpy(opacity)).numpy()[:, None],
+            "scaling": data["scale"].astype(np.float32),
+            "rotation": rotation,
+            "sh_degree": int(data["sh_degree"]),
+            "active_sh_degree": int(data["active_sh_degree"]),
+            }
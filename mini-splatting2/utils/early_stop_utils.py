@@ -0,0 +1,71 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Convergence based early stopping. Every interval iterations (the training
+# loop only asks once densification and simplification are over) the PSNR of
+# a few monitor views is measured. Training stops once the best PSNR improved
+# by less than min_gain dB per 1000 iterations for patience consecutive checks.
+# The monitor views are the test cameras when the scene has some (--eval),
+# training cameras otherwise.
+
+import torch
+from utils.image_utils import psnr
+
+
+def monitor_cameras(scene, num_views):
+    """
+    Up to num_views cameras evenly spread over the test cameras, over the
+    training cameras if there are none.
+    """
+    cameras = scene.getTestCameras() or scene.getTrainCameras()
+    cameras = sorted(cameras, key=lambda camera: camera.image_name)
+    step = max(len(cameras) / max(num_views, 1), 1)
+    return [cameras[int(i * step)] for i in range(min(num_views, len(cameras)))]
+
+
+class EarlyStopping:
+    def __init__(self, cameras, interval=500, min_gain=0.02, patience=3, device="cuda"):
+        self.cameras = cameras
+        # Cached once, the cameras may keep their images on another device
+        self.gt_images = [camera.original_image.to(device) for camera in cameras]
+        self.interval = interval
+        self.min_gain = min_gain
+        self.patience = patience
+        self.history = []
+        self.best = None
+        self.stale = 0
+
+    @torch.no_grad()
+    def evaluate(self, render_fn):
+        """
+        :param render_fn: camera -> image [3, H, W]
+        """
+        value = torch.zeros((), device=self.gt_images[0].device)
+        for camera, gt_image in zip(self.cameras, self.gt_images):
+            image = torch.clamp(render_fn(camera), 0.0, 1.0)
+            value += psnr(image, gt_image).mean()
+        return (value / len(self.cameras)).item()
+
+    def update(self, iteration, render_fn):
+        """
+        Call at the end of every iteration.
+        :return True when training should stop
+        """
+        if not self.cameras or iteration % self.interval != 0:
+            return False
+        value = self.evaluate(render_fn)
+        self.history.append((iteration, value))
+        if self.best is not None and value - self.best < self.min_gain * self.interval / 1000:
+            self.stale += 1
+        else:
+            self.stale = 0
+        self.best = value if self.best is None else max(self.best, value)
+        return self.stale >= self.patience
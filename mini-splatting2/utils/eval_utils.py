@@ -0,0 +1,135 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Test-time evaluation of the training loops, in one of three modes:
+#   sync      render and score every test view inline, as training_report did
+#   async     score a snapshot of the Gaussians on a background thread while
+#             training goes on, at most one evaluation is queued. This only
+#             takes the evaluation off the training loop on the CPU side: the
+#             rasterizer launches on the legacy default stream, so evaluation
+#             kernels still queue with the training kernels
+#   deferred  only L1 and PSNR inline, SSIM and LPIPS for the final evaluation
+# Call finish() after the training loop to wait for pending evaluations.
+
+import queue
+import threading
+import traceback
+import torch
+from utils.loss_utils import l1_loss, ssim
+from utils.image_utils import psnr
+from lpipsPyTorch import lpips
+
+EVAL_MODES = ["sync", "async", "deferred"]
+
+
+class Evaluator:
+    def __init__(self, mode="sync", tb_writer=None, lpips_net="vgg"):
+        assert mode in EVAL_MODES, "choose mode from {}".format(EVAL_MODES)
+        self.mode = mode
+        self.tb_writer = tb_writer
+        self.lpips_net = lpips_net
+        self.results = {}
+        self._queue = queue.Queue(maxsize=1)
+        self._thread = None
+
+    def submit(self, iteration, configs, gaussians, render_fn, first=False, final=False):
+        """
+        :param configs: list of {'name', 'cameras'}
+        :param render_fn: (camera, gaussians) -> image [3, H, W]
+        :param first: first evaluation, the ground truth images are logged
+        :param final: last evaluation, always scored in full
+        """
+        if self.mode == "async":
+            # Copied on the default stream, which the evaluation renders on as well
+            snapshot = gaussians.snapshot()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, daemon=True)
+                self._thread.start()
+            # Blocks while the previous evaluation is still queued
+            self._queue.put((iteration, configs, snapshot, render_fn, first))
+            return
+
+        if self.mode == "sync":
+            torch.cuda.empty_cache()
+        self.evaluate(iteration, configs, gaussians, render_fn, first, full=self.mode == "sync" or final)
+        if self.mode == "sync":
+            torch.cuda.empty_cache()
+
+    def finish(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            iteration, configs, snapshot, render_fn, first = job
+            try:
+                self.evaluate(iteration, configs, snapshot, render_fn, first, full=True)
+            except Exception:
+                print("\n[ITER {}] Evaluation failed".format(iteration))
+                traceback.print_exc()
+
+    @torch.no_grad()
+    def evaluate(self, iteration, configs, gaussians, render_fn, first=False, full=True):
+        tb_writer = self.tb_writer
+        results = {}
+        for config in configs:
+            if config['cameras'] and len(config['cameras']) > 0:
+                l1_test = 0.0
+                psnr_test = 0.0
+                ssims = []
+                lpipss = []
+                for idx, viewpoint in enumerate(config['cameras']):
+                    image = torch.clamp(render_fn(viewpoint, gaussians), 0.0, 1.0)
+                    gt_image = torch.clamp(viewpoint.original_image.to(image.device), 0.0, 1.0)
+
+                    if tb_writer and (idx < 5):
+                        tb_writer.add_images(config['name'] + "_view_{}/render".format(viewpoint.image_name), image[None], global_step=iteration)
+                        if first:
+                            tb_writer.add_images(config['name'] + "_view_{}/ground_truth".format(viewpoint.image_name), gt_image[None], global_step=iteration)
+                    l1_test += l1_loss(image, gt_image).mean().double()
+                    psnr_test += psnr(image, gt_image).mean().double()
+
+                    if full:
+                        ssims.append(ssim(image, gt_image))
+                        lpipss.append(lpips(image, gt_image, net_type=self.lpips_net))
+
+                psnr_test /= len(config['cameras'])
+                l1_test /= len(config['cameras'])
+                results[config['name']] = {"L1": l1_test.item(), "PSNR": psnr_test.item()}
+
+                print("\n[ITER {}] Evaluating {}: ".format(iteration, config['name']))
+                if full:
+                    ssims_test = torch.tensor(ssims).mean()
+                    lpipss_test = torch.tensor(lpipss).mean()
+                    results[config['name']].update({"SSIM": ssims_test.item(), "LPIPS": lpipss_test.item()})
+                    print("  SSIM : {:>12.7f}".format(ssims_test.mean(), ".5"))
+                print("  PSNR : {:>12.7f}".format(psnr_test.mean(), ".5"))
+                if full:
+                    print("  LPIPS : {:>12.7f}".format(lpipss_test.mean(), ".5"))
+                print("")
+
+                if tb_writer:
+                    tb_writer.add_scalar(config['name'] + '/loss_viewpoint - l1_loss', l1_test, iteration)
+                    tb_writer.add_scalar(config['name'] + '/loss_viewpoint - psnr', psnr_test, iteration)
+                    if full:
+                        tb_writer.add_scalar(config['name'] + '/loss_viewpoint - ssim', ssims_test, iteration)
+                        tb_writer.add_scalar(config['name'] + '/loss_viewpoint - lpips', lpipss_test, iteration)
+
+        if tb_writer:
+            tb_writer.add_histogram("scene/opacity_histogram", gaussians.get_opacity, iteration)
+            tb_writer.add_scalar('total_points', gaussians.get_xyz.shape[0], iteration)
+        self.results[iteration] = results
+        return results
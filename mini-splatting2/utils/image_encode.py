@@ -0,0 +1,37 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Runs in the ImageWriter worker processes. encode_image only needs numpy and
+# PIL and never initialises CUDA. The workers still carry torch: the
+# forkserver preloads the calling script (render.py) once before forking them.
+
+import os
+import numpy as np
+from PIL import Image
+
+
+def encode_image(array, path, quality):
+    """
+    Encode array (H, W, 3) to path, by way of a temporary file.
+    """
+    base, extension = os.path.splitext(path)
+    tmp = base + ".tmp" + extension
+    if extension == ".exr":
+        os.environ.setdefault("OPENCV_IO_ENABLE_OPENEXR", "1")
+        import cv2
+        if not cv2.imwrite(tmp, np.ascontiguousarray(array[..., ::-1])):
+            raise IOError("Could not write {}".format(path))
+    elif extension in (".jpg", ".jpeg"):
+        Image.fromarray(array).save(tmp, quality=quality)
+    else:
+        Image.fromarray(array).save(tmp)
+    os.replace(tmp, path)
+    return path
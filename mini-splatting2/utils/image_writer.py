@@ -0,0 +1,90 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import multiprocessing
+from collections import deque
+from importlib.util import find_spec
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import torch
+from utils.image_encode import encode_image
+
+IMAGE_FORMATS = ["png", "jpg", "exr"]
+
+
+class ImageWriter:
+    """
+    Encodes and writes images in a pool of worker processes. The caller only
+    pays for the conversion to a uint8 host buffer (float32 for EXR), the
+    format follows the file extension. At most max_pending images are in
+    flight, further writes wait for the oldest one so that host memory stays
+    bounded. workers=0 writes on the calling thread. The worker processes are
+    started by a forkserver, never forked from the caller, which by then has
+    CUDA, tqdm and torch threads running.
+    """
+    def __init__(self, workers=4, max_pending=16, processes=True, quality=95):
+        self.quality = quality
+        self.max_pending = max(max_pending, 1)
+        self.pending = deque()
+        self.written = 0
+        self.pool = None
+        if workers > 0 and processes:
+            # Forking a multithreaded process can deadlock, the workers come
+            # from a fresh single-threaded forkserver instead. The server
+            # imports the calling script once, the workers inherit its modules
+            # (torch included) but never initialise CUDA
+            context = multiprocessing.get_context("forkserver") if "forkserver" in multiprocessing.get_all_start_methods() else None
+            self.pool = ProcessPoolExecutor(workers, mp_context=context)
+        elif workers > 0:
+            self.pool = ThreadPoolExecutor(workers)
+
+    def write(self, image, path):
+        """
+        :param image: tensor [3, H, W] in [0, 1], on any device
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".exr":
+            if find_spec("cv2") is None:
+                raise ImportError("Writing EXR images needs OpenCV (opencv-python)")
+            array = image.detach().permute(1, 2, 0).float().cpu().numpy()
+        else:
+            # Same rounding as torchvision.utils.save_image
+            array = image.detach().mul(255).add_(0.5).clamp_(0, 255).to(torch.uint8).permute(1, 2, 0).cpu().numpy()
+
+        if self.pool is None:
+            encode_image(array, path, self.quality)
+            self.written += 1
+            return
+        while len(self.pending) >= self.max_pending:
+            self._wait_oldest()
+        self.pending.append(self.pool.submit(encode_image, array, path, self.quality))
+
+    def _wait_oldest(self):
+        self.pending.popleft().result()
+        self.written += 1
+
+    def close(self):
+        """
+        Wait for every pending image, re-raising the first error of a worker.
+        """
+        try:
+            while self.pending:
+                self._wait_oldest()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=True)
+                self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,213 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import torch
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from simple_knn._C import distCUDA2
+except ImportError:
+    distCUDA2 = None
+
+# 27 neighbouring cells (including the cell itself) of a uniform grid
+_CELL_OFFSETS = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij"), -1).reshape(-1, 3)
+
+
+def _grid_keys(coords, dims):
+    return (coords[:, 0] * dims[1] + coords[:, 1]) * dims[2] + coords[:, 2]
+
+
+def _initial_cell_size(points, target_occupancy=4):
+    # Robust bounds so that a few far away COLMAP outliers do not blow up the cells
+    lo = np.percentile(points, 1, axis=0)
+    hi = np.percentile(points, 99, axis=0)
+    extent = np.maximum(hi - lo, 1e-6)
+    cell_size = float(np.cbrt(np.prod(extent) / points.shape[0]))
+
+    # Point clouds are mostly surfaces, shrink the cells until the occupied ones
+    # hold roughly target_occupancy points
+    for _ in range(8):
+        coords = np.floor((points - points.min(0)) / cell_size).astype(np.int64)
+        occupied = np.unique(_grid_keys(coords, coords.max(0) + 1)).shape[0]
+        if points.shape[0] / occupied <= target_occupancy:
+            break
+        cell_size *= 0.5
+    return cell_size
+
+
+def _grid_pass(points, queries, k, cell_size, num_workers, chunk_size):
+    """
+    One pass of grid-hashed k-NN. Returns the k best squared distances for every
+    query and a mask of queries whose result is guaranteed exact, i.e. whose
+    k-th neighbour lies within one cell size (anything outside the 3x3x3 block
+    around the query cell is at least that far away).
+    """
+    minn = points.min(0)
+    coords = np.floor((points - minn) / cell_size).astype(np.int64) + 1
+    dims = coords.max(0) + 2
+    keys = _grid_keys(coords, dims)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_pts = points[order]
+
+    # Table of occupied cells: key -> [start, end) range in the sorted arrays
+    cell_keys, cell_start, cell_count = np.unique(sorted_keys, return_index=True, return_counts=True)
+
+    # Position of every original point in the sorted arrays, used to skip the query itself.
+    # Queries are processed in grid order so that all lookups below hit sorted inputs.
+    rank = np.empty_like(order)
+    rank[order] = np.arange(order.shape[0])
+    q_rank = rank[queries]
+    q_order = np.argsort(q_rank)
+    q_rank = q_rank[q_order]
+
+    deltas = _grid_keys(_CELL_OFFSETS, dims)
+
+    best = np.full((queries.shape[0], k), np.inf, dtype=np.float32)
+    exact = np.zeros(queries.shape[0], dtype=bool)
+
+    def work(lo, hi):
+        q_sorted = q_rank[lo:hi]
+        m = hi - lo
+
+        start = np.empty((m, deltas.shape[0]), dtype=np.int64)
+        counts = np.zeros((m, deltas.shape[0]), dtype=np.int64)
+        for j, delta in enumerate(deltas):
+            neighbour_keys = sorted_keys[q_sorted] + delta
+            cell = np.minimum(np.searchsorted(cell_keys, neighbour_keys), cell_keys.shape[0] - 1)
+            found = cell_keys[cell] == neighbour_keys
+            start[:, j] = cell_start[cell]
+            counts[:, j] = np.where(found, cell_count[cell], 0)
+        start, counts = start.ravel(), counts.ravel()
+
+        # Flatten the variable sized candidate ranges of every (query, cell) pair
+        total = int(counts.sum())
+        owner = np.repeat(np.repeat(np.arange(m), deltas.shape[0]), counts)
+        cand = np.repeat(start, counts) + (np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts))
+
+        keep = cand != q_sorted[owner]
+        owner, cand = owner[keep], cand[keep]
+        diff = sorted_pts[cand] - sorted_pts[q_sorted[owner]]
+        d2 = np.einsum("ij,ij->i", diff, diff)
+
+        # Candidates are grouped by query, extract the k smallest of every segment
+        # with k segmented min reductions (much cheaper than sorting them)
+        num = np.bincount(owner, minlength=m)
+        seg = np.cumsum(num) - num
+        nonempty = num > 0
+        for j in range(k):
+            mins = np.full(m, np.inf, dtype=np.float32)
+            mins[nonempty] = np.minimum.reduceat(d2, seg[nonempty])
+            best[q_order[lo:hi], j] = mins
+            # Drop exactly one occurrence of the minimum so duplicates are kept
+            hit = np.flatnonzero(d2 == mins[owner])
+            first = np.ones(hit.shape[0], dtype=bool)
+            first[1:] = owner[hit[1:]] != owner[hit[:-1]]
+            d2[hit[first]] = np.inf
+        exact[q_order[lo:hi]] = (num >= k) & (mins <= cell_size * cell_size)
+
+    bounds = [(lo, min(lo + chunk_size, queries.shape[0])) for lo in range(0, queries.shape[0], chunk_size)]
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        list(pool.map(lambda b: work(*b), bounds))
+
+    return best, exact
+
+
+def distCPU(points, k=3, num_workers=None, chunk_size=32768):
+    """
+    CPU counterpart of simple_knn's distCUDA2: mean squared distance of every
+    point to its k nearest neighbours (the point itself excluded).
+    Uses a uniform hash grid, the queries whose neighbours fall outside the
+    searched cells are re-run on a coarser grid until all results are exact.
+    :param points: torch tensor [N, 3] on any device
+    :return torch tensor [N] on the device of points
+    """
+    device = points.device
+    pts = points.detach().float().cpu().numpy()
+    N = pts.shape[0]
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    if N <= k:
+        # Not enough neighbours, average over the ones we have like a brute force search would
+        d2 = ((pts[:, None, :] - pts[None, :, :]) ** 2).sum(-1)
+        np.fill_diagonal(d2, np.inf)
+        d2 = np.sort(d2, axis=1)[:, :k]
+        d2[~np.isfinite(d2)] = np.finfo(np.float32).max
+        return torch.from_numpy(d2.mean(1).astype(np.float32)).to(device)
+
+    result = np.empty(N, dtype=np.float32)
+    pending = np.arange(N)
+    cell_size = _initial_cell_size(pts)
+    max_extent = float((pts.max(0) - pts.min(0)).max())
+
+    while pending.shape[0] > 0:
+        best, exact = _grid_pass(pts, pending, k, cell_size, num_workers, chunk_size)
+        # Once a cell spans the whole cloud the 3x3x3 block sees every point
+        if cell_size >= max_extent:
+            exact[:] = True
+        result[pending[exact]] = best[exact].mean(1)
+        pending = pending[~exact]
+        cell_size *= 2.0
+
+    return torch.from_numpy(result).to(device)
+
+
+def distKNN(points):
+    """
+    Mean squared 3-NN distance used to initialise Gaussian scales. Dispatches to
+    the simple_knn CUDA kernel when possible and to distCPU otherwise.
+    """
+    if points.is_cuda and distCUDA2 is not None:
+        return distCUDA2(points)
+    return distCPU(points)
+
+
+if __name__ == "__main__":
+    import time
+    from argparse import ArgumentParser
+    from plyfile import PlyData
+
+    parser = ArgumentParser(description="Benchmark CPU k-NN initialisation")
+    parser.add_argument("--ply", type=str, default=None, help="COLMAP points3D.ply, random points if omitted")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--num_workers", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.ply:
+        vertices = PlyData.read(args.ply)["vertex"]
+        base = np.vstack([vertices["x"], vertices["y"], vertices["z"]]).T.astype(np.float32)
+    else:
+        base = np.random.rand(max(args.sizes), 3).astype(np.float32)
+
+    for size in args.sizes:
+        # Larger sizes than the cloud are obtained by jittered resampling
+        idx = np.random.choice(base.shape[0], size, replace=size > base.shape[0])
+        pts = base[idx]
+        if size > base.shape[0]:
+            pts = pts + np.random.normal(scale=1e-3 * pts.std(), size=pts.shape).astype(np.float32)
+        pts = torch.from_numpy(pts)
+
+        start = time.time()
+        dist_cpu = distCPU(pts, num_workers=args.num_workers)
+        elapsed = time.time() - start
+        line = "N={:>9d}  cpu {:8.3f}s".format(size, elapsed)
+
+        if distCUDA2 is not None and torch.cuda.is_available():
+            torch.cuda.synchronize()
+            start = time.time()
+            dist_gpu = distCUDA2(pts.cuda())
+            torch.cuda.synchronize()
+            line += "  cuda {:8.3f}s  max rel err {:.2e}".format(time.time() - start,
+                ((dist_gpu.cpu() - dist_cpu).abs() / dist_cpu.clamp_min(1e-12)).max().item())
+        print(line)
@@ -0,0 +1,176 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Level of detail hierarchy. Gaussians are bucketed into the cells of an
+# octree over the scene bounds, every LOD level merges all Gaussians that
+# share a cell at some octree depth into a single one:
+#   mean, covariance  moment matched, weighted by opacity * footprint area
+#   colour (all SH)   weighted average
+#   opacity           total weighted footprint over the merged footprint
+# The finest level holds the original Gaussians. Level i is split into the
+# octree cells of depth i, one PLY per cell, so that a viewer can start from
+# the single tile of level 0 and replace a tile by its (up to 8) children of
+# the next level where more detail is needed. lod.json lists the tiles.
+
+import os
+import json
+import numpy as np
+from utils.system_utils import mkdir_p
+from utils.spatial_index import octree_codes
+
+LOD_VERSION = 1
+
+
+def _quat_to_rotmat(q):
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    r, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.stack([1 - 2 * (y*y + z*z), 2 * (x*y - r*z), 2 * (x*z + r*y),
+                     2 * (x*y + r*z), 1 - 2 * (x*x + z*z), 2 * (y*z - r*x),
+                     2 * (x*z - r*y), 2 * (y*z + r*x), 1 - 2 * (x*x + y*y)], 1).reshape(-1, 3, 3)
+
+
+def _rotmat_to_quat(R):
+    # Shepperd's method, branch on the largest of w, x, y, z
+    m = R
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    cand = np.stack([trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]], 1)
+    case = cand.argmax(1)
+    q = np.empty((R.shape[0], 4))
+
+    s = np.sqrt(np.maximum(1 + cand[np.arange(len(case)), case] * 2 - trace, 1e-12)) * 2
+    w = case == 0
+    q[w] = np.stack([0.25 * s[w], (m[w, 2, 1] - m[w, 1, 2]) / s[w], (m[w, 0, 2] - m[w, 2, 0]) / s[w], (m[w, 1, 0] - m[w, 0, 1]) / s[w]], 1)
+    x = case == 1
+    q[x] = np.stack([(m[x, 2, 1] - m[x, 1, 2]) / s[x], 0.25 * s[x], (m[x, 0, 1] + m[x, 1, 0]) / s[x], (m[x, 0, 2] + m[x, 2, 0]) / s[x]], 1)
+    y = case == 2
+    q[y] = np.stack([(m[y, 0, 2] - m[y, 2, 0]) / s[y], (m[y, 0, 1] + m[y, 1, 0]) / s[y], 0.25 * s[y], (m[y, 1, 2] + m[y, 2, 1]) / s[y]], 1)
+    z = case == 3
+    q[z] = np.stack([(m[z, 1, 0] - m[z, 0, 1]) / s[z], (m[z, 0, 2] + m[z, 2, 0]) / s[z], (m[z, 1, 2] + m[z, 2, 1]) / s[z], 0.25 * s[z]], 1)
+    return q / np.linalg.norm(q, axis=1, keepdims=True)
+
+
+def _footprint(scale):
+    # Area of the ellipse seen along the shortest axis (up to a factor pi)
+    s = np.sort(scale, axis=1)
+    return s[:, 1] * s[:, 2]
+
+
+def _sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def _take(data, index):
+    return {k: (v if k == "attributes" else v[index]) for k, v in data.items()}
+
+
+def merge_gaussians(data, starts):
+    """
+    Merge the runs data[starts[i]:starts[i+1]] into one Gaussian each.
+    :param data: dict in the layout of GaussianModel.capture_ply
+    :param starts: sorted start index of every run, starting with 0
+    """
+    N = data["xyz"].shape[0]
+    xyz = data["xyz"].astype(np.float64)
+    scale = np.exp(data["scale"].astype(np.float64))
+    alpha = _sigmoid(data["opacities"][:, 0].astype(np.float64))
+    R = _quat_to_rotmat(data["rotation"].astype(np.float64))
+    cov = (R * (scale * scale)[:, None, :]) @ R.transpose(0, 2, 1)
+
+    w = alpha * _footprint(scale) + 1e-20
+    W = np.add.reduceat(w, starts)
+    group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, N)))
+
+    mean = np.add.reduceat(w[:, None] * xyz, starts) / W[:, None]
+    d = xyz - mean[group]
+    second = cov + d[:, :, None] * d[:, None, :]
+    merged_cov = np.add.reduceat(w[:, None, None] * second, starts) / W[:, None, None]
+
+    eigval, eigvec = np.linalg.eigh(merged_cov)
+    eigvec[np.linalg.det(eigvec) < 0, :, 0] *= -1
+    merged_scale = np.sqrt(np.maximum(eigval, 1e-20))
+    merged_alpha = np.clip(W / _footprint(merged_scale), 1e-4, 1 - 1e-4)
+
+    return {"attributes": data["attributes"],
+            "xyz": mean.astype(np.float32),
+            "f_dc": (np.add.reduceat(w[:, None] * data["f_dc"], starts) / W[:, None]).astype(np.float32),
+            "f_rest": (np.add.reduceat(w[:, None] * data["f_rest"], starts) / W[:, None]).astype(np.float32),
+            "opacities": np.log(merged_alpha / (1 - merged_alpha))[:, None].astype(np.float32),
+            "scale": np.log(merged_scale).astype(np.float32),
+            "rotation": _rotmat_to_quat(eigvec).astype(np.float32),
+            }
+
+
+def build_lod(data, max_depth=10, min_depth=2, reduction=0.5):
+    """
+    LOD levels from coarse to fine, the last one is the input itself.
+    An octree depth becomes a level only if it has at most reduction times
+    as many Gaussians as the next finer level.
+    :param data: dict in the layout of GaussianModel.capture_ply
+    :return (levels, origin, size), every level a dict with its octree depth,
+            the Gaussians in Morton order and their octree code at max_depth
+    """
+    # Level i is tiled at octree depth i, which needs min_depth >= 1
+    assert 1 <= min_depth <= max_depth
+    codes, origin, size = octree_codes(data["xyz"], max_depth)
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    finest = _take(data, order)
+
+    levels = [{"depth": None, "data": finest, "codes": codes}]
+    count = codes.shape[0]
+    for depth in range(max_depth, min_depth - 1, -1):
+        keys = codes >> (3 * (max_depth - depth))
+        starts = np.flatnonzero(np.diff(keys, prepend=-1))
+        if starts.shape[0] > reduction * count:
+            continue
+        levels.append({"depth": depth, "data": merge_gaussians(finest, starts), "codes": codes[starts]})
+        count = starts.shape[0]
+    return levels[::-1], origin, size
+
+
+def save_lod(gaussians, path, max_depth=10, min_depth=2, reduction=0.5):
+    """
+    Write the LOD hierarchy of a GaussianModel to the directory path.
+    :return the manifest, also written to path/lod.json
+    """
+    levels, origin, size = build_lod(gaussians.capture_ply(), max_depth, min_depth, reduction)
+    manifest = {"version": LOD_VERSION, "origin": origin.tolist(), "size": size, "max_depth": max_depth,
+                "levels": [], "tiles": []}
+
+    for level, entry in enumerate(levels):
+        data = entry["data"]
+        tile_keys = entry["codes"] >> (3 * (max_depth - level))
+        starts = np.flatnonzero(np.diff(tile_keys, prepend=-1))
+        ends = np.append(starts[1:], tile_keys.shape[0])
+        manifest["levels"].append({"level": level, "octree_depth": entry["depth"], "count": int(tile_keys.shape[0]), "tiles": int(starts.shape[0])})
+
+        mkdir_p(os.path.join(path, "L{}".format(level)))
+        cell = size / (1 << level)
+        for start, end in zip(starts, ends):
+            node = int(tile_keys[start])
+            tile = _take(data, slice(start, end))
+            ijk = [sum(((node >> (3 * b + axis)) & 1) << b for b in range(level)) for axis in range(3)]
+            radius = 3 * np.exp(tile["scale"].max(1, keepdims=True))
+            filename = os.path.join("L{}".format(level), "{}.ply".format(node))
+            gaussians.write_ply(tile, os.path.join(path, filename))
+            manifest["tiles"].append({
+                "level": level,
+                "node": node,
+                "parent": node >> 3 if level > 0 else None,
+                "file": filename.replace(os.sep, "/"),
+                "count": int(end - start),
+                "cell": [(origin + np.array(ijk) * cell).tolist(), (origin + (np.array(ijk) + 1) * cell).tolist()],
+                "bounds": [(tile["xyz"] - radius).min(0).tolist(), (tile["xyz"] + radius).max(0).tolist()],
+            })
+
+    with open(os.path.join(path, "lod.json"), "w") as f:
+        json.dump(manifest, f)
+    return manifest
@@ -0,0 +1,504 @@
+import numpy as np
+from typing import Tuple
+
+def normalize(x):
+    return x / np.linalg.norm(x)
+
+
+def normalize_rows(x):
+    return x / np.linalg.norm(x, axis=-1, keepdims=True)
+
+
+def views_to_poses(views):
+    """Camera to world matrices [N, 4, 4] of views, with OpenGL y/z axes, in one pass."""
+    w2c = np.tile(np.eye(4), (len(views), 1, 1))
+    w2c[:, :3, :3] = np.stack([view.R.T for view in views])
+    w2c[:, :3, 3] = np.stack([view.T for view in views])
+    poses = np.linalg.inv(w2c)
+    poses[:, :, 1:3] *= -1
+    return poses
+
+
+def lookat_render_poses(positions, center, up, transform, radius_scale=1.0):
+    """World to camera matrices [N, 4, 4] looking from positions [N, 3] to center,
+    taken back out of the frame of transform (see transform_poses_pca)."""
+    vec2 = normalize_rows(positions - center)
+    vec0 = normalize_rows(np.cross(up, vec2))
+    vec1 = normalize_rows(np.cross(vec2, vec0))
+    render_poses = np.tile(np.eye(4), (len(positions), 1, 1))
+    render_poses[:, :3] = np.stack([vec0, vec1, vec2, positions], axis=-1)
+    render_poses = np.linalg.inv(transform) @ render_poses
+    render_poses[:, :3, 1:3] *= -1
+    render_poses[:, :3, 3] *= radius_scale
+    return np.linalg.inv(render_poses)
+
+
+def viewmatrix(lookdir, up, position, subtract_position=False):
+  """Construct lookat view matrix."""
+  vec2 = normalize((lookdir - position) if subtract_position else lookdir)
+  vec0 = normalize(np.cross(up, vec2))
+  vec1 = normalize(np.cross(vec2, vec0))
+  m = np.stack([vec0, vec1, vec2, position], axis=1)
+  return m
+
+
+def poses_avg(poses):
+  """New pose using average position, z-axis, and up vector of input poses."""
+  position = poses[:, :3, 3].mean(0)
+  z_axis = poses[:, :3, 2].mean(0)
+  up = poses[:, :3, 1].mean(0)
+  cam2world = viewmatrix(z_axis, up, position)
+  return cam2world
+
+
+def focus_point_fn(poses):
+    """Calculate nearest point to all focal axes in poses."""
+    directions, origins = poses[:, :3, 2:3], poses[:, :3, 3:4]
+    m = np.eye(3) - directions * np.transpose(directions, [0, 2, 1])
+    mt_m = np.transpose(m, [0, 2, 1]) @ m
+    focus_pt = np.linalg.inv(mt_m.mean(0)) @ (mt_m @ origins).mean(0)[:, 0]
+    return focus_pt
+
+
+
+def recenter_poses(poses: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+  """Recenter poses around the origin."""
+  cam2world = poses_avg(poses)
+  transform = np.linalg.inv(pad_poses(cam2world))
+  poses = transform @ pad_poses(poses)
+  return unpad_poses(poses), transform
+
+
+
+def generate_spiral_path(poses_arr,
+                         n_frames: int = 180,
+                         n_rots: int = 2,
+                         zrate: float = .5) -> np.ndarray:
+  """Calculates a forward facing spiral path for rendering."""
+  poses = poses_arr[:, :-2].reshape([-1, 3, 5])
+  bounds = poses_arr[:, -2:]
+  fix_rotation = np.array([
+      [0, -1, 0, 0],
+      [1, 0, 0, 0],
+      [0, 0, 1, 0],
+      [0, 0, 0, 1],
+  ], dtype=np.float32)
+  poses = poses[:, :3, :4] @ fix_rotation
+
+  scale = 1. / (bounds.min() * .75)
+  poses[:, :3, 3] *= scale
+  bounds *= scale
+  poses, transform = recenter_poses(poses)
+
+  close_depth, inf_depth = bounds.min() * .9, bounds.max() * 5.
+  dt = .75
+  focal = 1 / (((1 - dt) / close_depth + dt / inf_depth))
+
+  # Get radii for spiral path using 90th percentile of camera positions.
+  positions = poses[:, :3, 3]
+  radii = np.percentile(np.abs(positions), 90, 0)
+  radii = np.concatenate([radii, [1.]])
+
+  # Generate poses for spiral path.
+  render_poses = []
+  cam2world = poses_avg(poses)
+  up = poses[:, :3, 1].mean(0)
+  for theta in np.linspace(0., 2. * np.pi * n_rots, n_frames, endpoint=False):
+    t = radii * [np.cos(theta), -np.sin(theta), -np.sin(theta * zrate), 1.]
+    position = cam2world @ t
+    lookat = cam2world @ [0, 0, -focal, 1.]
+    z_axis = position - lookat
+    render_pose = np.eye(4)
+    render_pose[:3] = viewmatrix(z_axis, up, position)
+    render_pose = np.linalg.inv(transform) @ render_pose
+    render_pose[:3, 1:3] *= -1
+    # render_pose[:3, 3] *= scale*100 # For trex
+    render_pose[:3, 3] /= scale*1.25
+    render_poses.append(np.linalg.inv(render_pose))
+  render_poses = np.stack(render_poses, axis=0)
+  return render_poses
+
+
+###自己实现的功能###
+###2025.09.18###
+def generate_spiral_path_from_views(views, n_frames=600, n_rots=2, z_rate=0.5):
+    """
+    基于views生成螺旋路径，模仿椭圆路径代码的风格
+    
+    参数:
+        views: 视图列表，每个视图包含R(旋转矩阵)和T(平移向量)
+        n_frames: 生成的帧数
+        n_rots: 螺旋旋转的圈数
+        z_rate: z轴变化率，控制螺旋的垂直变化
+    
+    返回:
+        render_poses: 渲染姿态数组
+    """
+    # 将views转换为4x4姿态矩阵
+    poses = views_to_poses(views)
+    
+    # 对姿态进行PCA变换以中心化
+    poses, transform = transform_poses_pca(poses)
+    
+    # 计算焦点（所有相机指向的点）
+    center = focus_point_fn(poses)
+    
+    # 计算螺旋半径（使用相机位置的90%分位数）
+    positions = poses[:, :3, 3]
+    radii = np.percentile(np.abs(positions - center[:3]), 90, axis=0)
+    radii = np.concatenate([radii, [1.]])  # 添加齐次坐标
+    
+    # 计算平均上向量
+    avg_up = poses[:, :3, 1].mean(0)
+    avg_up = avg_up / np.linalg.norm(avg_up)
+    
+    # 选择最接近平均上向量的轴作为上方向
+    ind_up = np.argmax(np.abs(avg_up))
+    up = np.eye(3)[ind_up] * np.sign(avg_up[ind_up])
+    
+    # 生成螺旋路径：一次计算所有帧的位置（相机看向中心点）
+    theta = np.linspace(0., 2. * np.pi * n_rots, n_frames, endpoint=False)
+    t = radii[:3] * np.stack([np.cos(theta), -np.sin(theta), -np.sin(theta * z_rate)], -1)
+    positions = t + center[:3]  # 添加中心偏移
+
+    # 应用逆变换并调整坐标系
+    return lookat_render_poses(positions, center, up, transform)
+
+
+
+def pad_poses(p):
+    """Pad [..., 3, 4] pose matrices with a homogeneous bottom row [0,0,0,1]."""
+    bottom = np.broadcast_to([0, 0, 0, 1.], p[..., :1, :4].shape)
+    return np.concatenate([p[..., :3, :4], bottom], axis=-2)
+
+def unpad_poses(p):
+    """Remove the homogeneous bottom row from [..., 4, 4] pose matrices."""
+    return p[..., :3, :4]
+
+def transform_poses_pca(poses):
+    """Transforms poses so principal components lie on XYZ axes.
+
+  Args:
+    poses: a (N, 3, 4) array containing the cameras' camera to world transforms.
+
+  Returns:
+    A tuple (poses, transform), with the transformed poses and the applied
+    camera_to_world transforms.
+  """
+    t = poses[:, :3, 3]
+    t_mean = t.mean(axis=0)
+    t = t - t_mean
+
+    eigval, eigvec = np.linalg.eig(t.T @ t)
+    # Sort eigenvectors in order of largest to smallest eigenvalue.
+    inds = np.argsort(eigval)[::-1]
+    eigvec = eigvec[:, inds]
+    rot = eigvec.T
+    if np.linalg.det(rot) < 0:
+        rot = np.diag(np.array([1, 1, -1])) @ rot
+
+    transform = np.concatenate([rot, rot @ -t_mean[:, None]], -1)
+    poses_recentered = unpad_poses(transform @ pad_poses(poses))
+    transform = np.concatenate([transform, np.eye(4)[3:]], axis=0)
+
+    # Flip coordinate system if z component of y-axis is negative
+    if poses_recentered.mean(axis=0)[2, 1] < 0:
+        poses_recentered = np.diag(np.array([1, -1, -1])) @ poses_recentered
+        transform = np.diag(np.array([1, -1, -1, 1])) @ transform
+
+    # Just make sure it's it in the [-1, 1]^3 cube
+    scale_factor = 1. / np.max(np.abs(poses_recentered[:, :3, 3]))
+    poses_recentered[:, :3, 3] *= scale_factor
+    transform = np.diag(np.array([scale_factor] * 3 + [1])) @ transform
+    return poses_recentered, transform
+
+def _trans_t(t):
+    return np.array(
+        [
+            [1, 0, 0, 0],
+            [0, 1, 0, 0],
+            [0, 0, 1, t],
+            [0, 0, 0, 1],
+        ],
+        dtype=np.float32,
+    )
+
+def _rot_theta(th):
+    return np.array(
+        [
+            [np.cos(th), 0, -np.sin(th), 0],
+            [0, 1, 0, 0],
+            [np.sin(th), 0, np.cos(th), 0],
+            [0, 0, 0, 1],
+        ],
+        dtype=np.float32,
+    )
+
+def generate_arf_path(views, n_frames=600, radius=0.85):
+    poses = []
+    # Generate vec_up
+    for view in views:
+        tmp_view = np.eye(4,4)
+        tmp_view[:3] = np.concatenate([view.R.T, view.T[:, None]], 1)
+        tmp_view = np.linalg.inv(tmp_view)
+        # tmp_view[:, 1:3] *= -1
+        cam_center = tmp_view[:3, 3]
+        cam_center = (cam_center + view.trans) * view.scale
+        tmp_view[:3, 3] = cam_center
+        poses.append(tmp_view)
+        
+    poses = np.stack(poses, 0)
+    up_rot = poses[:, :3, :3]
+    ups = np.matmul(up_rot, np.array([0, -1.0, 0])[None, :, None])[..., 0]
+    vec_up = np.mean(ups, axis=0)
+    vec_up /= np.linalg.norm(vec_up)
+    print('  Auto vec_up', vec_up)
+
+    render_poses = []
+    for angle in np.linspace(0, 360, n_frames + 1):
+        c2w = _trans_t(radius)
+        c2w = _rot_theta(angle / 180.0 * np.pi) @ c2w
+        c2w = (
+            np.array(
+                [[-1, 0, 0, 0], [0, 0, 1, 0], [0, 1, 0, 0], [0, 0, 0, 1]],
+                dtype=np.float32,
+            )
+            @ c2w
+        )
+
+        vec_up = vec_up / np.linalg.norm(vec_up)
+        vec_1 = np.array([vec_up[0], -vec_up[2], vec_up[1]])
+        vec_2 = np.cross(vec_up, vec_1)
+
+        trans = np.eye(4, 4, dtype=np.float32)
+        trans[:3, 0] = vec_1
+        trans[:3, 1] = vec_2
+        trans[:3, 2] = vec_up
+        c2w = trans @ c2w
+        c2w = c2w @ np.diag(np.array([1, -1, -1, 1], dtype=np.float32))
+        render_poses.append(c2w)
+
+    return render_poses
+
+def generate_ellipse_path(views, n_frames=600, const_speed=True, z_variation=0., z_phase=0.):
+    poses = views_to_poses(views)
+
+    poses, transform = transform_poses_pca(poses)
+
+    # Calculate the focal point for the path (cameras point toward this).
+    center = focus_point_fn(poses)
+    # Path height sits at z=0 (in middle of zero-mean capture pattern).
+    offset = np.array([center[0] , center[1],  0 ])
+    # Calculate scaling for ellipse axes based on input camera positions.
+    sc = np.percentile(np.abs(poses[:, :3, 3] - offset), 90, axis=0)
+
+    # Use ellipse that is symmetric about the focal point in xy.
+    low = -sc + offset
+    high = sc + offset
+    # Optional height variation need not be symmetric
+    z_low = np.percentile((poses[:, :3, 3]), 10, axis=0)
+    z_high = np.percentile((poses[:, :3, 3]), 90, axis=0)
+
+    def get_positions(theta):
+        # Interpolate between bounds with trig functions to get ellipse in x-y.
+        # Optionally also interpolate in z to change camera height along path.
+        return np.stack([
+            (low[0] + (high - low)[0] * (np.cos(theta) * .5 + .5)),
+            (low[1] + (high - low)[1] * (np.sin(theta) * .5 + .5)),
+            z_variation * (z_low[2] + (z_high - z_low)[2] *
+                           (np.cos(theta + 2 * np.pi * z_phase) * .5 + .5)),
+        ], -1)
+
+    theta = np.linspace(0, 2. * np.pi, n_frames + 1, endpoint=True)
+    positions = get_positions(theta)
+
+    if const_speed:
+        # Resample theta angles so that the velocity is closer to constant.
+        lengths = np.linalg.norm(positions[1:] - positions[:-1], axis=-1)
+        theta = sample_np(None, theta, np.log(lengths), n_frames + 1)
+        positions = get_positions(theta)
+
+    # Throw away duplicated last position.
+    positions = positions[:-1]
+
+    # Set path's up vector to axis closest to average of input pose up vectors.
+    avg_up = poses[:, :3, 1].mean(0)
+    avg_up = avg_up / np.linalg.norm(avg_up)
+    ind_up = np.argmax(np.abs(avg_up))
+    up = np.eye(3)[ind_up] * np.sign(avg_up[ind_up])
+    # up = normalize(poses[:, :3, 1].sum(0))
+
+    # scale the radius
+    return lookat_render_poses(positions, center, up, transform, radius_scale=1.1)
+
+
+
+def generate_random_poses_llff(views):
+    """Generates random poses."""
+    n_poses = 10000 # args.n_random_poses
+    poses, bounds = [], []
+    for view in views:
+        tmp_view = np.eye(4)
+        tmp_view[:3] = np.concatenate([view.R.T, view.T[:, None]], 1)
+        tmp_view = np.linalg.inv(tmp_view)
+        tmp_view[:, 1:3] *= -1
+        poses.append(tmp_view)
+        bounds.append(view.bounds)
+    poses = np.stack(poses, 0)
+    bounds = np.stack(bounds) # np.array([[ 16.21311152, 153.86329729]])
+
+    scale = 1. / (bounds.min() * .75)
+    poses[:, :3, 3] *= scale
+    bounds *= scale
+    poses, transform = recenter_poses(poses)
+
+    # Find a reasonable 'focus depth' for this dataset as a weighted average
+    # of near and far bounds in disparity space.
+    close_depth, inf_depth = bounds.min() * .9, bounds.max() * 5.
+    dt = .75
+    focal = 1 / (((1 - dt) / close_depth + dt / inf_depth))
+
+    # Get radii for spiral path using 90th percentile of camera positions.
+    positions = poses[:, :3, 3]
+    radii = np.percentile(np.abs(positions), 100, 0)
+    radii = np.concatenate([radii, [1.]])
+
+    # Generate random poses.
+    random_poses = []
+    cam2world = poses_avg(poses)
+    up = poses[:, :3, 1].mean(0)
+    for _ in range(n_poses):
+      t = radii * np.concatenate([2 * np.random.rand(3) - 1., [1,]])
+      position = cam2world @ t
+      lookat = cam2world @ [0, 0, -focal, 1.]
+      z_axis = position - lookat
+      random_pose = np.eye(4)
+      random_pose[:3] = viewmatrix(z_axis, up, position)
+      random_pose = np.linalg.inv(transform) @ random_pose
+      random_pose[:3, 1:3] *= -1
+      random_pose[:3, 3] /= scale
+      random_poses.append(np.linalg.inv(random_pose))
+    render_poses = np.stack(random_poses, axis=0)
+    return render_poses
+
+
+
+def generate_random_poses_360(views, n_frames=600, z_variation=0.1, z_phase=0):
+    poses = []
+    for view in views:
+        tmp_view = np.eye(4)
+        tmp_view[:3] = np.concatenate([view.R.T, view.T[:, None]], 1)
+        tmp_view = np.linalg.inv(tmp_view)
+        tmp_view[:, 1:3] *= -1
+        poses.append(tmp_view)
+    poses = np.stack(poses, 0)
+    poses, transform = transform_poses_pca(poses)
+
+    # Calculate the focal point for the path (cameras point toward this).
+    center = focus_point_fn(poses)
+    # Path height sits at z=0 (in middle of zero-mean capture pattern).
+    offset = np.array([center[0] , center[1],  0 ])
+    # Calculate scaling for ellipse axes based on input camera positions.
+    sc = np.percentile(np.abs(poses[:, :3, 3] - offset), 90, axis=0)
+
+    # Use ellipse that is symmetric about the focal point in xy.
+    low = -sc + offset
+    high = sc + offset
+    # Optional height variation need not be symmetric
+    z_low = np.percentile((poses[:, :3, 3]), 10, axis=0)
+    z_high = np.percentile((poses[:, :3, 3]), 90, axis=0)
+
+
+    def get_positions(theta):
+        # Interpolate between bounds with trig functions to get ellipse in x-y.
+        # Optionally also interpolate in z to change camera height along path.
+        return np.stack([
+            (low[0] + (high - low)[0] * (np.cos(theta) * .5 + .5)),
+            (low[1] + (high - low)[1] * (np.sin(theta) * .5 + .5)),
+            z_variation * (z_low[2] + (z_high - z_low)[2] *
+                           (np.cos(theta + 2 * np.pi * z_phase) * .5 + .5)),
+        ], -1)
+
+    theta = np.random.rand(n_frames) * 2. * np.pi
+    positions = get_positions(theta)
+
+    # Throw away duplicated last position.
+    positions = positions[:-1]
+
+    # Set path's up vector to axis closest to average of input pose up vectors.
+    avg_up = poses[:, :3, 1].mean(0)
+    avg_up = avg_up / np.linalg.norm(avg_up)
+    ind_up = np.argmax(np.abs(avg_up))
+    up = np.eye(3)[ind_up] * np.sign(avg_up[ind_up])
+    # up = normalize(poses[:, :3, 1].sum(0))
+
+    render_poses = []
+    for p in positions:
+        render_pose = np.eye(4)
+        render_pose[:3] = viewmatrix(p - center, up, p)
+        render_pose = np.linalg.inv(transform) @ render_pose
+        render_pose[:3, 1:3] *= -1
+        render_poses.append(np.linalg.inv(render_pose))
+    return render_poses
+
+
+def sample_np(rand,
+              t,
+              w_logits,
+              num_samples,
+              single_jitter=False,
+              deterministic_center=False):
+    """
+    Piecewise-Constant PDF sampling from a step function.
+    """
+    eps = np.finfo(np.float32).eps
+
+    # Draw uniform samples.
+    if not rand:
+        if deterministic_center:
+            pad = 1 / (2 * num_samples)
+            u = np.linspace(pad, 1. - pad - eps, num_samples)
+        else:
+            u = np.linspace(0, 1. - eps, num_samples)
+        u = np.broadcast_to(u, t.shape[:-1] + (num_samples,))
+    else:
+        # `u` is in [0, 1) --- it can be zero, but it can never be 1.
+        u_max = eps + (1 - eps) / num_samples
+        max_jitter = (1 - u_max) / (num_samples - 1) - eps
+        d = 1 if single_jitter else num_samples
+        u = np.linspace(0, 1 - u_max, num_samples) + \
+            np.random.rand(*t.shape[:-1], d) * max_jitter
+
+    return invert_cdf_np(u, t, w_logits)
+
+def invert_cdf_np(u, t, w_logits):
+    """Invert the CDF defined by (t, w) at the points specified by u in [0, 1)."""
+    # Compute the PDF and CDF for each weight vector.
+    w = np.exp(w_logits) / np.exp(w_logits).sum(axis=-1, keepdims=True)
+    cw = integrate_weights_np(w)
+    # Interpolate into the inverse CDF.
+    interp_fn = np.interp
+    t_new = interp_fn(u, cw, t)
+    return t_new
+
+def integrate_weights_np(w):
+    """Compute the cumulative sum of w, assuming all weight vectors sum to 1.
+
+  The output's size on the last dimension is one greater than that of the input,
+  because we're computing the integral corresponding to the endpoints of a step
+  function, not the integral of the interior/bin values.
+
+  Args:
+    w: Tensor, which will be integrated along the last axis. This is assumed to
+      sum to 1 along the last axis, and this function will (silently) break if
+      that is not the case.
+
+  Returns:
+    cw0: Tensor, the integral of w, where cw0[..., 0] = 0 and cw0[..., -1] = 1
+  """
+    cw = np.minimum(1, np.cumsum(w[..., :-1], axis=-1))
+    shape = cw.shape[:-1] + (1,)
+    # Ensure that the CDF starts with exactly 0 and ends with exactly 1.
+    cw0 = np.concatenate([np.zeros(shape), cw,
+                          np.ones(shape)], axis=-1)
+    return cw0
\ No newline at end of file
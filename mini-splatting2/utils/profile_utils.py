@@ -0,0 +1,211 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Lightweight instrumentation for the training loops.
+#   with profiler.region("render"): ...   CPU wall time of a named region,
+#                                         optionally CUDA event time as well
+#   profiler.count("visible", tensor)     counter, tensors are only read back
+#                                         when the summary is written
+#   profiler.phase("loss")                ends the previous phase, starts loss
+#   profiler.step(iteration)              end of an iteration
+# A disabled profiler costs one attribute test per call, guard count() with
+# profiler.enabled when computing its value launches work. save() writes a
+# summary table and, if requested, a Chrome trace (chrome://tracing or
+# https://ui.perfetto.dev) with one span per region call.
+
+import os
+import json
+import time
+import contextlib
+from collections import deque
+import torch
+
+_NULL_REGION = contextlib.nullcontext()
+
+
+class _Region:
+    __slots__ = ("calls", "wall", "device", "device_calls", "max_wall")
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.device = 0.0
+        self.device_calls = 0
+        self.max_wall = 0.0
+
+
+class Profiler:
+    """
+    :param enabled: when False every call is a no-op
+    :param device_timing: also time the regions with CUDA events, the events
+                          are read back once they have completed, without sync
+    :param trace: keep the spans of every region call for save_trace()
+    """
+    def __init__(self, enabled=True, device_timing=False, trace=False):
+        self.enabled = enabled
+        self.device_timing = enabled and device_timing and torch.cuda.is_available()
+        self.trace = enabled and trace
+        self.regions = {}
+        self.counters = {}
+        self._pending = deque()
+        self._spans = []
+        self._counter_events = []
+        self._depth = 0
+        self._phase = None
+        self._origin = time.perf_counter()
+        self._start = None
+        self._last_step = None
+        self.iterations = 0
+
+    def region(self, name):
+        if not self.enabled:
+            return _NULL_REGION
+        return self._region(name)
+
+    @contextlib.contextmanager
+    def _region(self, name):
+        token = self._begin(name)
+        try:
+            yield
+        finally:
+            self._end(token)
+
+    def phase(self, name):
+        """
+        End the current phase and start the phase name, for timing consecutive
+        parts of the loop body without indenting them. step() ends the last one.
+        """
+        if not self.enabled:
+            return
+        if self._phase is not None:
+            self._end(self._phase)
+        self._phase = self._begin(name)
+
+    def _begin(self, name):
+        events = None
+        if self.device_timing:
+            events = (torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True))
+            events[0].record()
+        self._depth += 1
+        start = time.perf_counter()
+        if self._start is None:
+            self._start = start
+        return (name, start, events)
+
+    def _end(self, token):
+        name, start, events = token
+        end = time.perf_counter()
+        self._depth -= 1
+        region = self.regions.get(name)
+        if region is None:
+            region = self.regions[name] = _Region()
+        region.calls += 1
+        region.wall += end - start
+        region.max_wall = max(region.max_wall, end - start)
+        if events is not None:
+            events[1].record()
+            self._pending.append((region, events))
+        if self.trace:
+            self._spans.append((name, start - self._origin, end - start, self._depth))
+
+    def count(self, name, value):
+        """
+        Record a sample of a counter (a number or a scalar tensor).
+        """
+        if not self.enabled:
+            return
+        samples = self.counters.get(name)
+        if samples is None:
+            samples = self.counters[name] = []
+        if isinstance(value, torch.Tensor):
+            value = value.detach().reshape(())
+        samples.append(value)
+        if self.trace:
+            self._counter_events.append((name, time.perf_counter() - self._origin, len(samples) - 1))
+
+    def step(self, iteration):
+        if not self.enabled:
+            return
+        if self._phase is not None:
+            self._end(self._phase)
+            self._phase = None
+        self._last_step = time.perf_counter()
+        self.iterations += 1
+        self._collect(block=False)
+
+    def _collect(self, block):
+        while self._pending:
+            region, (start, end) = self._pending[0]
+            if not block and not end.query():
+                break
+            if block:
+                end.synchronize()
+            region.device += start.elapsed_time(end) / 1000
+            region.device_calls += 1
+            self._pending.popleft()
+
+    def _counter_values(self, name):
+        samples = self.counters[name]
+        tensors = [i for i, v in enumerate(samples) if isinstance(v, torch.Tensor)]
+        if tensors:
+            values = torch.stack([samples[i].to("cpu", torch.float64) for i in tensors]).tolist()
+            for i, v in zip(tensors, values):
+                samples[i] = v
+        return samples
+
+    def summary(self):
+        self._collect(block=True)
+        # Wall time from the first region to the last step
+        total = max(self._last_step - self._start, 1e-12) if self.iterations > 0 and self._start is not None else 1e-12
+        lines = ["{} iterations, {:.3f} s".format(self.iterations, total), ""]
+        header = "{:<28s} {:>8s} {:>11s} {:>10s} {:>10s} {:>7s}".format("region", "calls", "total s", "mean ms", "max ms", "%")
+        if self.device_timing:
+            header += " {:>11s} {:>10s}".format("device s", "dev ms")
+        lines += [header, "-" * len(header)]
+        for name, region in sorted(self.regions.items(), key=lambda item: -item[1].wall):
+            line = "{:<28s} {:>8d} {:>11.3f} {:>10.3f} {:>10.3f} {:>7.2f}".format(
+                name, region.calls, region.wall, 1000 * region.wall / region.calls, 1000 * region.max_wall, 100 * region.wall / total)
+            if self.device_timing:
+                line += " {:>11.3f} {:>10.3f}".format(region.device, 1000 * region.device / max(region.device_calls, 1))
+            lines.append(line)
+
+        if self.counters:
+            lines += ["", "{:<28s} {:>8s} {:>14s} {:>14s} {:>14s} {:>14s}".format("counter", "samples", "last", "mean", "min", "max")]
+            lines.append("-" * len(lines[-1]))
+            for name in sorted(self.counters):
+                values = self._counter_values(name)
+                lines.append("{:<28s} {:>8d} {:>14.6g} {:>14.6g} {:>14.6g} {:>14.6g}".format(
+                    name, len(values), values[-1], sum(values) / len(values), min(values), max(values)))
+        return "\n".join(lines)
+
+    def save(self, path, trace_path=None):
+        """
+        Write the summary table to path and, when tracing, the Chrome trace to
+        trace_path (next to path by default).
+        """
+        if not self.enabled:
+            return
+        summary = self.summary()
+        with open(path, "w") as f:
+            f.write(summary + "\n")
+        if self.trace:
+            self.save_trace(trace_path or os.path.join(os.path.dirname(path), "trace.json"))
+        return summary
+
+    def save_trace(self, path):
+        pid = os.getpid()
+        events = [{"name": name, "ph": "X", "ts": 1e6 * start, "dur": 1e6 * duration, "pid": pid, "tid": depth, "cat": "cpu"}
+                  for name, start, duration, depth in self._spans]
+        values = {name: self._counter_values(name) for name in self.counters}
+        events += [{"name": name, "ph": "C", "ts": 1e6 * start, "pid": pid, "args": {name: values[name][index]}}
+                   for name, start, index in self._counter_events]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
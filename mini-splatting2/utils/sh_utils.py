@@ -111,6 +111,68 @@ def eval_sh(deg, sh, dirs):
                             C4[8] * (xx * (xx - 3 * yy) - yy * (3 * xx - yy)) * sh[..., 24])
     return result
 
+def eval_sh_basis(deg, dirs):
+    """
+    Real SH basis of degree deg at unit directions, same polynomials and
+    ordering as eval_sh.
+    Args:
+        deg: int SH deg. Currently, 0-4 supported
+        dirs: torch.Tensor unit directions [..., 3]
+    Returns:
+        [..., (deg + 1) ** 2]
+    """
+    assert deg <= 4 and deg >= 0
+    x, y, z = dirs[..., 0], dirs[..., 1], dirs[..., 2]
+    basis = [torch.full_like(x, C0)]
+    if deg > 0:
+        basis += [-C1 * y, C1 * z, -C1 * x]
+
+        if deg > 1:
+            xx, yy, zz = x * x, y * y, z * z
+            xy, yz, xz = x * y, y * z, x * z
+            basis += [C2[0] * xy,
+                      C2[1] * yz,
+                      C2[2] * (2.0 * zz - xx - yy),
+                      C2[3] * xz,
+                      C2[4] * (xx - yy)]
+
+            if deg > 2:
+                basis += [C3[0] * y * (3 * xx - yy),
+                          C3[1] * xy * z,
+                          C3[2] * y * (4 * zz - xx - yy),
+                          C3[3] * z * (2 * zz - 3 * xx - 3 * yy),
+                          C3[4] * x * (4 * zz - xx - yy),
+                          C3[5] * z * (xx - yy),
+                          C3[6] * x * (xx - 3 * yy)]
+
+                if deg > 3:
+                    basis += [C4[0] * xy * (xx - yy),
+                              C4[1] * yz * (3 * xx - yy),
+                              C4[2] * xy * (7 * zz - 1),
+                              C4[3] * yz * (7 * zz - 3),
+                              C4[4] * (zz * (35 * zz - 30) + 3),
+                              C4[5] * xz * (7 * zz - 3),
+                              C4[6] * (xx - yy) * (7 * zz - 1),
+                              C4[7] * xz * (xx - 3 * yy),
+                              C4[8] * (xx * (xx - 3 * yy) - yy * (3 * xx - yy))]
+    return torch.stack(basis, dim=-1)
+
+def eval_sh_batched(deg, sh, dirs):
+    """
+    Batched version of eval_sh: the basis is built once for all directions
+    and contracted with the coefficients in a single matmul.
+    Args:
+        deg: int SH deg. Currently, 0-4 supported
+        sh: torch.Tensor SH coeffs [..., K, C] with K >= (deg + 1) ** 2,
+            i.e. the layout of GaussianModel.get_features
+        dirs: torch.Tensor unit directions [..., 3]
+    Returns:
+        [..., C]
+    """
+    basis = eval_sh_basis(deg, dirs)
+    assert sh.shape[-2] >= basis.shape[-1]
+    return (basis.unsqueeze(-2) @ sh[..., :basis.shape[-1], :]).squeeze(-2)
+
 def RGB2SH(rgb):
     return (rgb - 0.5) / C0
 
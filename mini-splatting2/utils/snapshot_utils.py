@@ -0,0 +1,133 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import json
+import time
+import queue
+import threading
+import torch
+from utils.system_utils import mkdir_p
+from utils.checkpoint_utils import save_checkpoint
+
+
+def copy_to_cpu(obj):
+    """
+    Detached CPU copy of every tensor in a nested tuple/list/dict, so that
+    later in-place updates of the training state cannot leak into a snapshot.
+    """
+    if torch.is_tensor(obj):
+        return obj.detach().to("cpu", copy=True)
+    if isinstance(obj, dict):
+        return {k: copy_to_cpu(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(copy_to_cpu(v) for v in obj)
+    return obj
+
+
+def write_json_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class SnapshotWriter:
+    """
+    Writes PLY snapshots and checkpoints on a background thread.
+    The training loop only pays for a device to host copy of the parameters,
+    files are written under a temporary name and renamed once complete.
+    At most max_pending snapshots wait in the queue, further requests block
+    until the writer catches up so that host memory stays bounded.
+    Progress is mirrored to <model_path>/snapshots.json for the backend.
+    """
+    def __init__(self, model_path, max_pending=2, checkpoint_format="compact", fp16_moments=False):
+        self.model_path = model_path
+        self.checkpoint_format = checkpoint_format
+        self.fp16_moments = fp16_moments
+        self.status_path = os.path.join(model_path, "snapshots.json")
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.lock = threading.Lock()
+        self.status = {"pending": [], "completed": [], "failed": []}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def save_ply(self, gaussians, iteration):
+        path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration), "point_cloud.ply")
+        self._submit("ply", iteration, path, gaussians.write_ply, gaussians.capture_ply())
+
+    def save_checkpoint(self, gaussians, iteration):
+        if self.checkpoint_format == "pth":
+            path = os.path.join(self.model_path, "chkpnt" + str(iteration) + ".pth")
+            self._submit("checkpoint", iteration, path, torch.save, (copy_to_cpu(gaussians.capture()), iteration))
+            return
+
+        extras = {}
+        if hasattr(gaussians, "_culling"):
+            extras = {"culling": gaussians._culling, "factor_culling": gaussians.factor_culling}
+        path = os.path.join(self.model_path, "chkpnt" + str(iteration) + ".gsckpt")
+        self._submit("checkpoint", iteration, path, self._write_compact, (copy_to_cpu(gaussians.capture()), iteration, copy_to_cpu(extras)))
+
+    def _write_compact(self, data, path):
+        model_args, iteration, extras = data
+        save_checkpoint(path, model_args, iteration, extras=extras, fp16_moments=self.fp16_moments)
+
+    def _submit(self, kind, iteration, path, write_fn, data):
+        entry = {"kind": kind, "iteration": iteration, "path": path}
+        with self.lock:
+            self.status["pending"].append(entry)
+            self._publish()
+        self.queue.put((entry, write_fn, data))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            entry, write_fn, data = item
+            start = time.time()
+            path = entry["path"]
+            tmp = path + ".tmp"
+            try:
+                mkdir_p(os.path.dirname(path))
+                write_fn(data, tmp)
+                os.replace(tmp, path)
+                result = "completed"
+            except Exception as e:
+                print("\n[Snapshot] Failed to write {}: {}".format(path, e))
+                entry["error"] = str(e)
+                result = "failed"
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            entry["seconds"] = round(time.time() - start, 3)
+            with self.lock:
+                self.status["pending"].remove(entry)
+                self.status[result].append(entry)
+                self._publish()
+            self.queue.task_done()
+
+    def _publish(self):
+        try:
+            mkdir_p(self.model_path)
+            write_json_atomic(self.status_path, self.status)
+        except OSError:
+            pass
+
+    def wait(self):
+        """
+        Block until every submitted snapshot is on disk.
+        """
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
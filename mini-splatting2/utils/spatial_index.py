@@ -0,0 +1,364 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Linear octree over Gaussian centres. Points are sorted by the Morton code
+# of their cell at max_depth, so every octree node at every depth is a
+# contiguous range of the sorted points. Queries walk the octree one depth at
+# a time for all candidate nodes at once: nodes fully outside the query are
+# dropped, fully inside ones are accepted as a whole, small or deepest nodes
+# that straddle the boundary are resolved point by point. Everything is NumPy
+# and runs on the CPU.
+
+import numpy as np
+import torch
+
+
+def interleave_bits(ijk, depth):
+    """
+    Morton code of integer cell coordinates [N, 3] with depth bits per axis.
+    """
+    codes = np.zeros(ijk.shape[0], dtype=np.int64)
+    for bit in range(depth):
+        for axis in range(3):
+            codes |= ((ijk[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def octree_cells(xyz, depth):
+    """
+    Integer coordinates of the octree cells of the given depth containing xyz.
+    The octree spans the cubic bounding box of the points.
+    :return (cells [N, 3] int64, origin [3], size)
+    """
+    assert depth <= 20
+    origin = xyz.min(0).astype(np.float64)
+    size = max(float((xyz.max(0) - origin).max()), 1e-12)
+    cells = np.clip(np.floor((xyz - origin) / size * (1 << depth)), 0, (1 << depth) - 1).astype(np.int64)
+    return cells, origin, size
+
+
+def octree_codes(xyz, depth):
+    """
+    Morton codes of the octree cells of the given depth containing xyz.
+    :return (codes [N] int64, origin [3], size)
+    """
+    cells, origin, size = octree_cells(xyz, depth)
+    return interleave_bits(cells, depth), origin, size
+
+
+def _to_numpy(x):
+    if torch.is_tensor(x):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def _expand_ranges(starts, ends):
+    # Concatenation of arange(s, e) for every pair, without a Python loop
+    counts = ends - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return offsets + np.arange(total)
+
+
+def frustum_planes(camera):
+    """
+    The 6 inward facing planes [6, 4] (normal, offset) of the view frustum
+    of a Camera or MiniCam, normalised so that n.x + d is a distance.
+    """
+    # full_proj_transform maps row vectors, [x, 1] @ M, so rows of M^T are the clip coordinates
+    A = _to_numpy(camera.full_proj_transform).astype(np.float64).T
+    planes = np.stack([A[3] + A[0], A[3] - A[0], A[3] + A[1], A[3] - A[1], A[2], A[3] - A[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1, keepdims=True)
+
+
+def classify_boxes_frustum(planes, lo, hi):
+    """
+    Boxes [M, 3] against frustum planes, see frustum_planes.
+    :return (outside [M], fully inside [M]) boolean masks
+    """
+    normals, offsets = planes[:, :3], planes[:, 3]
+    positive = np.where(normals[None] > 0, hi[:, None], lo[:, None])
+    negative = np.where(normals[None] > 0, lo[:, None], hi[:, None])
+    outside = ((positive * normals[None]).sum(-1) + offsets < 0).any(1)
+    inside = ((negative * normals[None]).sum(-1) + offsets >= 0).all(1)
+    return outside, inside
+
+
+class GaussianOctree:
+    """
+    :param xyz: [N, 3] centres, numpy array or tensor
+    :param radius: optional [N] extent of every Gaussian, see from_gaussians
+    :param max_depth: depth of the finest octree level
+    :param leaf_size: nodes with at most this many points are never subdivided
+    """
+    def __init__(self, xyz, radius=None, max_depth=10, leaf_size=64):
+        xyz = _to_numpy(xyz).astype(np.float64)
+        self.num_points = xyz.shape[0]
+        self.max_depth = max_depth
+        self.leaf_size = leaf_size
+
+        cells, self.origin, self.size = octree_cells(xyz, max_depth)
+        codes = interleave_bits(cells, max_depth)
+        self.order = np.argsort(codes, kind="stable")
+        self.codes = codes[self.order]
+        self.cells = cells[self.order]
+        self.xyz = xyz[self.order]
+        self.radius = np.zeros(self.num_points) if radius is None else _to_numpy(radius).astype(np.float64)[self.order]
+
+        # Per depth: node keys, point ranges and tight bounds of the centres and of the extents
+        self.levels = []
+        for depth in range(max_depth + 1):
+            keys = self.codes >> (3 * (max_depth - depth))
+            starts = np.flatnonzero(np.diff(keys, prepend=-1))
+            ends = np.append(starts[1:], self.num_points)
+            self.levels.append({
+                "keys": keys[starts], "starts": starts, "ends": ends,
+                "center_min": np.minimum.reduceat(self.xyz, starts, axis=0),
+                "center_max": np.maximum.reduceat(self.xyz, starts, axis=0),
+                "extent_min": np.minimum.reduceat(self.xyz - self.radius[:, None], starts, axis=0),
+                "extent_max": np.maximum.reduceat(self.xyz + self.radius[:, None], starts, axis=0),
+            })
+
+    @classmethod
+    def from_gaussians(cls, gaussians, sigma=3.0, **kwargs):
+        """
+        Index a GaussianModel, every Gaussian extends sigma times its largest scale.
+        """
+        radius = sigma * gaussians.get_scaling.detach().max(dim=1).values
+        return cls(gaussians.get_xyz, radius, **kwargs)
+
+    def _children(self, depth, nodes):
+        # Children of node k at the next depth have keys in [8k, 8k + 8)
+        child_keys = self.levels[depth + 1]["keys"]
+        parent_keys = self.levels[depth]["keys"][nodes]
+        lo = np.searchsorted(child_keys, parent_keys << 3)
+        hi = np.searchsorted(child_keys, (parent_keys << 3) + 8)
+        return _expand_ranges(lo, hi)
+
+    def partition(self, max_count):
+        """
+        Split the points into the largest octree nodes holding at most
+        max_count points (nodes at max_depth may hold more).
+        :return list of index arrays into the original point order
+        """
+        parts = []
+        frontier = np.zeros(1 if self.num_points else 0, dtype=np.int64)
+        for depth in range(self.max_depth + 1):
+            level = self.levels[depth]
+            starts, ends = level["starts"][frontier], level["ends"][frontier]
+            done = ((ends - starts) <= max_count) | (depth == self.max_depth)
+            parts += [self.order[start:end] for start, end in zip(starts[done], ends[done])]
+            if done.all():
+                break
+            frontier = self._children(depth, frontier[~done])
+        return parts
+
+    def _query(self, classify_nodes, test_points, use_extent):
+        """
+        :param classify_nodes: (lo [M, 3], hi [M, 3]) -> (outside [M], inside [M])
+        :param test_points: sorted point indices -> bool mask
+        :return indices into the original point order, sorted
+        """
+        bound = "extent" if use_extent else "center"
+        accepted, pending = [], []
+        frontier = np.zeros(1, dtype=np.int64)
+        for depth in range(self.max_depth + 1):
+            level = self.levels[depth]
+            outside, inside = classify_nodes(level[bound + "_min"][frontier], level[bound + "_max"][frontier])
+            inside &= ~outside
+            partial = ~(outside | inside)
+            starts, ends = level["starts"][frontier], level["ends"][frontier]
+            accepted.append(_expand_ranges(starts[inside], ends[inside]))
+
+            small = partial & ((ends - starts) <= self.leaf_size)
+            if depth == self.max_depth:
+                small = partial
+            pending.append(_expand_ranges(starts[small], ends[small]))
+
+            refine = frontier[partial & ~small]
+            if refine.shape[0] == 0:
+                break
+            frontier = self._children(depth, refine)
+
+        pending = np.concatenate(pending)
+        hits = np.concatenate(accepted + [pending[test_points(pending)]])
+        return np.sort(self.order[hits])
+
+    def query_frustum(self, camera, use_extent=True):
+        """
+        Gaussians (partially) inside the view frustum of a Camera or MiniCam.
+        """
+        planes = frustum_planes(camera)
+        normals, offsets = planes[:, :3], planes[:, 3]
+
+        def classify_nodes(lo, hi):
+            return classify_boxes_frustum(planes, lo, hi)
+
+        def test_points(idx):
+            r = self.radius[idx] if use_extent else 0
+            return (self.xyz[idx] @ normals.T + offsets >= -np.reshape(r, (-1, 1))).all(1)
+
+        return self._query(classify_nodes, test_points, use_extent)
+
+    def query_aabb(self, box_min, box_max, use_extent=False):
+        """
+        Gaussians whose centre (or with use_extent any part) lies in the box.
+        """
+        box_min, box_max = np.asarray(box_min, dtype=np.float64), np.asarray(box_max, dtype=np.float64)
+
+        def classify_nodes(lo, hi):
+            outside = ((hi < box_min) | (lo > box_max)).any(1)
+            inside = ((lo >= box_min) & (hi <= box_max)).all(1)
+            return outside, inside
+
+        def test_points(idx):
+            r = self.radius[idx, None] if use_extent else 0
+            return ((self.xyz[idx] + r >= box_min) & (self.xyz[idx] - r <= box_max)).all(1)
+
+        return self._query(classify_nodes, test_points, use_extent)
+
+    def query_sphere(self, center, radius, use_extent=False):
+        """
+        Gaussians whose centre (or with use_extent any part) lies in the sphere.
+        """
+        center = np.asarray(center, dtype=np.float64)
+
+        def classify_nodes(lo, hi):
+            nearest = np.clip(center, lo, hi)
+            farthest = np.where(np.abs(lo - center) > np.abs(hi - center), lo, hi)
+            outside = ((nearest - center) ** 2).sum(1) > radius ** 2
+            inside = ((farthest - center) ** 2).sum(1) <= radius ** 2
+            return outside, inside
+
+        def test_points(idx):
+            r = self.radius[idx] if use_extent else 0
+            return np.linalg.norm(self.xyz[idx] - center, axis=1) <= radius + r
+
+        return self._query(classify_nodes, test_points, use_extent)
+
+    def _top_k(self, queries, owner, candidates, k):
+        # Scatter the candidates of every query into a padded row, then partition the rows
+        row_start = np.searchsorted(owner, np.arange(queries.shape[0]))
+        column = np.arange(owner.shape[0]) - row_start[owner]
+        width = max(int(column.max()) + 1 if column.shape[0] else 0, k)
+        d2 = np.full((queries.shape[0], width), np.inf)
+        d2[owner, column] = ((self.xyz[candidates] - queries[owner]) ** 2).sum(1)
+        padded = np.full((queries.shape[0], width), -1, dtype=np.int64)
+        padded[owner, column] = candidates
+
+        nearest = np.argpartition(d2, k - 1, axis=1)[:, :k] if width > k else np.broadcast_to(np.arange(width), (queries.shape[0], width))
+        nearest = np.take_along_axis(nearest, np.argsort(np.take_along_axis(d2, nearest, 1), axis=1), 1)
+        return np.sqrt(np.take_along_axis(d2, nearest, 1)), np.take_along_axis(padded, nearest, 1)
+
+    def knn(self, queries, k=1, max_candidates=1 << 24):
+        """
+        Exact k nearest centres of every query point.
+        The k-th distance is first bounded from the 2k points next to the
+        query in Morton order. The query is then resolved in the deepest octree
+        level whose cells are at least that large, where the 3x3x3 block of
+        cells around the query contains every point within the bound.
+        :param max_candidates: distances evaluated at once, bounds the memory
+        :return (distances [M, k], indices [M, k]), inf / -1 where N < k
+        """
+        queries = _to_numpy(queries).astype(np.float64)
+        M, N = queries.shape[0], self.num_points
+        dist = np.full((M, k), np.inf)
+        index = np.full((M, k), -1, dtype=np.int64)
+        if M == 0 or N == 0:
+            return dist, index
+
+        # Upper bound of the k-th distance
+        if N <= 2 * k:
+            bound = np.full(M, np.inf)
+        else:
+            cells = np.clip(np.floor((queries - self.origin) / self.size * (1 << self.max_depth)), 0, (1 << self.max_depth) - 1)
+            position = np.searchsorted(self.codes, interleave_bits(cells.astype(np.int64), self.max_depth))
+            window = np.clip(position - k, 0, N - 2 * k)[:, None] + np.arange(2 * k)[None]
+            d2 = ((self.xyz[window] - queries[:, None]) ** 2).sum(-1)
+            bound = np.sqrt(np.partition(d2, k - 1, axis=1)[:, k - 1])
+
+        with np.errstate(divide="ignore"):
+            depth = np.floor(np.log2(self.size / np.maximum(bound, 1e-300)))
+        depth = np.clip(np.nan_to_num(depth, posinf=self.max_depth, neginf=0), 0, self.max_depth).astype(np.int64)
+        offsets = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing="ij"), -1).reshape(-1, 3)
+
+        for d in np.unique(depth):
+            qi = np.flatnonzero(depth == d)
+            level = self.levels[d]
+            if d == 0:
+                # The root holds every point, also for queries outside the bounds
+                cells = np.zeros((qi.shape[0], 3), dtype=np.int64)
+            else:
+                cells = np.floor((queries[qi] - self.origin) / (self.size / (1 << d))).astype(np.int64)
+            neighbours = (cells[:, None] + offsets[None]).reshape(-1, 3)
+            valid = ((neighbours >= 0) & (neighbours < (1 << d))).all(1)
+            keys = interleave_bits(np.where(valid[:, None], neighbours, 0), d)
+            slot = np.clip(np.searchsorted(level["keys"], keys), 0, level["keys"].shape[0] - 1)
+            found = valid & (level["keys"][slot] == keys)
+            starts = np.where(found, level["starts"][slot], 0).reshape(-1, offsets.shape[0])
+            ends = np.where(found, level["ends"][slot], 0).reshape(-1, offsets.shape[0])
+
+            # Batches of queries with similar candidate counts, about max_candidates padded distances each
+            counts = (ends - starts).sum(1)
+            by_count = np.argsort(counts, kind="stable")
+            sorted_counts = counts[by_count]
+            begin = 0
+            while begin < qi.shape[0]:
+                padded_size = np.arange(1, qi.shape[0] - begin + 1) * np.maximum(sorted_counts[begin:], k)
+                end = begin + max(1, int(np.searchsorted(padded_size, max_candidates, side="right")))
+                sel = by_count[begin:end]
+                begin = end
+                owner = np.repeat(np.repeat(np.arange(sel.shape[0]), offsets.shape[0]), (ends[sel] - starts[sel]).ravel())
+                candidates = _expand_ranges(starts[sel].ravel(), ends[sel].ravel())
+                dist[qi[sel]], found_index = self._top_k(queries[qi[sel]], owner, candidates, k)
+                index[qi[sel]] = np.where(found_index >= 0, self.order[found_index], -1)
+        return dist, index
+
+
+if __name__ == "__main__":
+    import time
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Benchmark the Gaussian octree on random surface-like points")
+    parser.add_argument("--num_points", type=int, default=1000000)
+    parser.add_argument("--num_queries", type=int, default=100000)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Points near a few planes, closer to reconstructed scenes than a uniform cloud
+    xyz = rng.uniform(-10, 10, (args.num_points, 3))
+    xyz[:, rng.integers(0, 3)] *= 0.01
+    radius = rng.exponential(0.02, args.num_points)
+
+    start = time.time()
+    index = GaussianOctree(xyz, radius)
+    print("build            {:>8.3f} s".format(time.time() - start))
+
+    start = time.time()
+    aabb = index.query_aabb([-2, -2, -2], [3, 3, 3])
+    print("aabb             {:>8.3f} s  {} hits".format(time.time() - start, aabb.shape[0]))
+    assert np.array_equal(aabb, np.flatnonzero(((xyz >= -2) & (xyz <= 3)).all(1)))
+
+    start = time.time()
+    sphere = index.query_sphere([1, 2, 0], 4.0, use_extent=True)
+    print("sphere           {:>8.3f} s  {} hits".format(time.time() - start, sphere.shape[0]))
+    assert np.array_equal(sphere, np.flatnonzero(np.linalg.norm(xyz - [1, 2, 0], axis=1) <= 4.0 + radius))
+
+    queries = xyz[rng.integers(0, args.num_points, args.num_queries)] + rng.normal(0, 0.05, (args.num_queries, 3))
+    start = time.time()
+    dist, nn = index.knn(queries, args.k)
+    print("knn (k={})        {:>8.3f} s  {:.2f} us/query".format(args.k, time.time() - start, (time.time() - start) / args.num_queries * 1e6))
+    for i in range(100):
+        brute = np.sort(np.linalg.norm(xyz - queries[i], axis=1))[:args.k]
+        assert np.allclose(dist[i], brute)
@@ -0,0 +1,93 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Time to first iteration. Created at the top of an entry point, before the
+# heavy imports, a StartupTimer records how long each module import takes
+# (self and cumulative time, like python -X importtime) until the first
+# mark(), and the time between successive marks (imports, arguments, scene,
+# first iteration, ...). report() formats both. A disabled timer does nothing.
+
+import sys
+import time
+import builtins
+import threading
+from importlib.util import resolve_name
+
+
+class StartupTimer:
+    """
+    :param enabled: record and report, otherwise every call is a no-op
+    :param top: number of slowest imports in the report
+    """
+    def __init__(self, enabled=True, top=15):
+        self.enabled = enabled
+        self.top = top
+        self.marks = []
+        self.imports = []
+        self._start = time.perf_counter()
+        self._last = self._start
+        self._stack = []
+        self._import = None
+        if enabled:
+            self._thread = threading.get_ident()
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        key = name
+        if level > 0:
+            try:
+                key = resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                pass
+        if key in sys.modules or threading.get_ident() != self._thread:
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self.imports.append((key, elapsed - children, elapsed, len(self._stack)))
+
+    def _stop_imports(self):
+        if self._import is not None and builtins.__import__ == self._timed_import:
+            builtins.__import__ = self._import
+        self._import = None
+
+    def mark(self, name):
+        """
+        End the current startup phase. The first mark also stops the import timing.
+        """
+        if not self.enabled:
+            return
+        self._stop_imports()
+        now = time.perf_counter()
+        self.marks.append((name, now - self._last))
+        self._last = now
+
+    def report(self):
+        if not self.enabled:
+            return ""
+        self._stop_imports()
+        total = self._last - self._start
+        lines = ["Startup: {:.3f} s".format(total)]
+        for name, seconds in self.marks:
+            lines.append("  {:<24s} {:>8.3f} s {:>6.1f}%".format(name, seconds, 100 * seconds / max(total, 1e-12)))
+        if self.imports:
+            lines.append("Slowest imports (self / cumulative):")
+            for name, self_time, cumulative, depth in sorted(self.imports, key=lambda row: -row[1])[:self.top]:
+                lines.append("  {:>8.3f} s {:>8.3f} s  {}{}".format(self_time, cumulative, "  " * depth, name))
+        return "\n".join(lines)
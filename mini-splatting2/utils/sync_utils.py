@@ -0,0 +1,123 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Low-sync training helpers. Every .item(), boolean mask indexing or Python
+# test on a CUDA tensor stalls the host until the GPU has caught up, which
+# leaves the GPU idle while the next iteration is being queued.
+#   TrainingMetrics  keeps the per-iteration losses and timing events on the
+#                    device and reads them back every interval iterations
+#   SyncCounter      counts the synchronising calls using the sync debug mode
+#                    of PyTorch, to check that an iteration does not sync
+
+import warnings
+import torch
+
+_SYNC_WARNING = "called a synchronizing CUDA operation"
+
+
+class SyncCounter:
+    """
+    Counts the host-device synchronisations PyTorch reports, per iteration.
+    Syncs inside custom CUDA extensions (e.g. the rasterizer reading back the
+    number of rendered Gaussians) are invisible to PyTorch and not counted.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled and torch.cuda.is_available()
+        self.total = 0
+        self.iterations = 0
+        self._count = 0
+        self._showwarning = None
+        if self.enabled:
+            warnings.filterwarnings("always", message=".*" + _SYNC_WARNING)
+            self._showwarning = warnings.showwarning
+            warnings.showwarning = self._on_warning
+            torch.cuda.set_sync_debug_mode("warn")
+
+    def _on_warning(self, message, category, filename, lineno, file=None, line=None):
+        if _SYNC_WARNING in str(message):
+            self._count += 1
+        else:
+            self._showwarning(message, category, filename, lineno, file, line)
+
+    def step(self):
+        """
+        Close the current iteration.
+        :return number of syncs since the previous call
+        """
+        count, self._count = self._count, 0
+        self.total += count
+        self.iterations += 1
+        return count
+
+    def close(self):
+        if self.enabled:
+            torch.cuda.set_sync_debug_mode("default")
+            warnings.showwarning = self._showwarning
+            self.enabled = False
+
+    def summary(self):
+        return "{} syncs in {} iterations ({:.2f} per iteration)".format(self.total, self.iterations, self.total / max(self.iterations, 1))
+
+
+class TrainingMetrics:
+    """
+    Per-iteration L1, total loss and iteration time, read back to the host
+    with a single synchronisation every interval iterations.
+    """
+    def __init__(self, interval=100, timing=True):
+        self.interval = interval
+        self.timing = timing and torch.cuda.is_available()
+        self._events = []
+        self._iterations = []
+        self._values = []
+        self.ema_loss = 0.0
+
+    def events(self):
+        """
+        (start, end) timing events for the current iteration, None without CUDA.
+        The events of a slot are reused after every flush.
+        """
+        if not self.timing:
+            return None, None
+        slot = len(self._iterations)
+        if slot == len(self._events):
+            self._events.append((torch.cuda.Event(enable_timing=True), torch.cuda.Event(enable_timing=True)))
+        return self._events[slot]
+
+    def record(self, iteration, Ll1, loss):
+        self._iterations.append(iteration)
+        self._values.append(torch.stack([Ll1.detach().reshape(()), loss.detach().reshape(())]))
+
+    def due(self, iteration, last_iteration):
+        return len(self._iterations) >= self.interval or (iteration >= last_iteration and len(self._iterations) > 0)
+
+    def flush(self, tb_writer=None):
+        """
+        Read back the buffered iterations, update the EMA of the loss and
+        write the train_loss_patches and iter_time scalars.
+        :return list of (iteration, l1, loss, elapsed ms or None)
+        """
+        if not self._iterations:
+            return []
+        values = torch.stack(self._values).tolist()
+        rows = []
+        for slot, (iteration, (l1, loss)) in enumerate(zip(self._iterations, values)):
+            # The read back above waited for every recorded event
+            elapsed = self._events[slot][0].elapsed_time(self._events[slot][1]) if self.timing else None
+            self.ema_loss = 0.4 * loss + 0.6 * self.ema_loss
+            if tb_writer:
+                tb_writer.add_scalar('train_loss_patches/l1_loss', l1, iteration)
+                tb_writer.add_scalar('train_loss_patches/total_loss', loss, iteration)
+                if elapsed is not None:
+                    tb_writer.add_scalar('iter_time', elapsed, iteration)
+            rows.append((iteration, l1, loss, elapsed))
+        self._iterations, self._values = [], []
+        return rows
@@ -0,0 +1,110 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Tiled export for scenes that do not fit in memory as a single file.
+# The Gaussians are partitioned either on a regular grid of cell_size or into
+# the largest octree nodes holding at most target_count Gaussians. Every tile
+# is an independent file of utils/compression_utils.py, tiles.json records
+# the bounds of every tile (including the 3 sigma extent of its Gaussians) so
+# that a loader only has to read the tiles intersecting the view frustum.
+
+import os
+import json
+import numpy as np
+import torch
+from utils.compression_utils import compress_gaussians, decompress_gaussians
+from utils.spatial_index import GaussianOctree, frustum_planes, classify_boxes_frustum
+
+TILES_VERSION = 1
+
+
+def partition_tiles(xyz, cell_size=None, target_count=262144, max_depth=12):
+    """
+    :param xyz: [N, 3] numpy array
+    :param cell_size: edge length of a regular grid, overrides target_count
+    :return list of index arrays, one per non-empty tile
+    """
+    if cell_size is not None:
+        cells = np.floor((xyz - xyz.min(0)) / cell_size).astype(np.int64)
+        _, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        order = np.argsort(inverse, kind="stable")
+        return np.split(order, np.flatnonzero(np.diff(inverse[order])) + 1)
+    return GaussianOctree(xyz, max_depth=max_depth).partition(target_count)
+
+
+@torch.no_grad()
+def save_tiles(gaussians, path, cell_size=None, target_count=262144, sigma=3.0, **kwargs):
+    """
+    Write the tiles of a GaussianModel and path/tiles.json.
+    Keyword arguments are forwarded to compress_gaussians.
+    :return the manifest
+    """
+    xyz = gaussians.get_xyz.detach().cpu().numpy()
+    radius = sigma * gaussians.get_scaling.detach().max(dim=1).values.cpu().numpy()
+    manifest = {"version": TILES_VERSION, "sh_degree": gaussians.max_sh_degree, "cell_size": cell_size,
+                "target_count": target_count, "num_gaussians": int(xyz.shape[0]), "tiles": []}
+
+    for i, index in enumerate(partition_tiles(xyz, cell_size, target_count)):
+        filename = "tile_{:05d}.npz".format(i)
+        stats = compress_gaussians(gaussians, os.path.join(path, filename), index=torch.from_numpy(index).to(gaussians.get_xyz.device), **kwargs)
+        manifest["tiles"].append({
+            "file": filename,
+            "count": stats["num_gaussians"],
+            "bytes": stats["bytes"],
+            "center_bounds": [xyz[index].min(0).tolist(), xyz[index].max(0).tolist()],
+            "bounds": [(xyz[index] - radius[index, None]).min(0).tolist(), (xyz[index] + radius[index, None]).max(0).tolist()],
+        })
+
+    with open(os.path.join(path, "tiles.json"), "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+
+def load_manifest(path):
+    with open(os.path.join(path, "tiles.json")) as f:
+        manifest = json.load(f)
+    if manifest["version"] != TILES_VERSION:
+        raise ValueError("Unsupported tiles version {}".format(manifest["version"]))
+    return manifest
+
+
+def tiles_in_frustum(manifest, camera):
+    """
+    Indices of the tiles whose bounds intersect the view frustum of a Camera or MiniCam.
+    """
+    if not manifest["tiles"]:
+        return []
+    bounds = np.array([tile["bounds"] for tile in manifest["tiles"]], dtype=np.float64)
+    outside, _ = classify_boxes_frustum(frustum_planes(camera), bounds[:, 0], bounds[:, 1])
+    return np.flatnonzero(~outside).tolist()
+
+
+def load_tiles(path, tiles=None, camera=None):
+    """
+    Decode and concatenate tiles, in the layout of decompress_gaussians.
+    :param tiles: tile indices to load, all by default
+    :param camera: only load the tiles visible from this camera
+    """
+    manifest = load_manifest(path)
+    if tiles is None:
+        tiles = tiles_in_frustum(manifest, camera) if camera is not None else range(len(manifest["tiles"]))
+    parts = [decompress_gaussians(os.path.join(path, manifest["tiles"][i]["file"])) for i in tiles]
+
+    num_rest = (manifest["sh_degree"] + 1) ** 2 - 1
+    data = {"xyz": np.zeros((0, 3), np.float32), "f_dc": np.zeros((0, 1, 3), np.float32),
+            "f_rest": np.zeros((0, num_rest, 3), np.float32), "opacity": np.zeros((0, 1), np.float32),
+            "scaling": np.zeros((0, 3), np.float32), "rotation": np.zeros((0, 4), np.float32)}
+    if parts:
+        data = {key: np.concatenate([part[key] for part in parts]) for key in data}
+    data["sh_degree"] = manifest["sh_degree"]
+    data["active_sh_degree"] = max([part["active_sh_degree"] for part in parts], default=0)
+    return data
@@ -0,0 +1,184 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Streaming video rendering. path_cameras turns the world to camera matrices of
+# a render path (pose_utils) into cameras in one batched pass, without touching
+# the reference view. VideoEncoder takes the rendered frames: each one is
+# converted to uint8 on the GPU and copied into one of ring_size pinned host
+# buffers, a background thread waits for the copy and hands the frame to
+# ffmpeg (H.264, plays in browsers) or, without ffmpeg, to cv2.VideoWriter.
+# Rendering only blocks when all ring_size buffers wait for the encoder.
+
+import queue
+import shutil
+import threading
+import subprocess
+import numpy as np
+import torch
+
+VIDEO_CODECS = ["auto", "ffmpeg", "opencv"]
+
+
+class PathCamera:
+    """
+    Camera of one video frame, with the fields the rasterizer reads.
+    """
+    def __init__(self, width, height, fovy, fovx, znear, zfar, world_view_transform, full_proj_transform, camera_center, image_name):
+        self.image_width = width
+        self.image_height = height
+        self.FoVy = fovy
+        self.FoVx = fovx
+        self.znear = znear
+        self.zfar = zfar
+        self.world_view_transform = world_view_transform
+        self.full_proj_transform = full_proj_transform
+        self.camera_center = camera_center
+        self.image_name = image_name
+
+
+def video_size(view, resolution_scale=1.0):
+    """
+    Frame size (width, height) of view at resolution_scale, rounded to even
+    numbers as H.264 with yuv420p needs.
+    """
+    width = max(2, int(round(view.image_width * resolution_scale / 2)) * 2)
+    height = max(2, int(round(view.image_height * resolution_scale / 2)) * 2)
+    return width, height
+
+
+def path_cameras(render_poses, view, resolution_scale=1.0):
+    """
+    :param render_poses: world to camera matrices [N, 4, 4] of the path
+    :param view: reference camera, for the field of view, trans and scale
+    :param resolution_scale: frame size relative to view, e.g. 0.5 for a preview
+    """
+    render_poses = np.asarray(render_poses, dtype=np.float64)
+    # getWorld2View2 for all poses at once
+    c2w = np.linalg.inv(render_poses)
+    c2w[:, :3, 3] = (c2w[:, :3, 3] + view.trans) * view.scale
+    w2c = np.linalg.inv(c2w).astype(np.float32)
+
+    device = view.world_view_transform.device
+    world_view = torch.from_numpy(w2c).to(device).transpose(1, 2)
+    projection = view.projection_matrix.to(device)
+    full_proj = world_view.bmm(projection.unsqueeze(0).expand(len(w2c), -1, -1))
+    centers = torch.from_numpy(c2w[:, :3, 3].astype(np.float32)).to(device)
+
+    width, height = video_size(view, resolution_scale)
+    return [PathCamera(width, height, view.FoVy, view.FoVx, view.znear, view.zfar,
+                       world_view[idx], full_proj[idx], centers[idx], view.image_name)
+            for idx in range(len(w2c))]
+
+
+class VideoEncoder:
+    """
+    :param path: output .mp4
+    :param size: (width, height) of the frames
+    :param ring_size: frames in flight between the renderer and the encoder
+    :param codec: auto uses ffmpeg when it is on PATH, opencv otherwise
+    """
+    def __init__(self, path, fps, size, ring_size=8, codec="auto", crf=20):
+        assert codec in VIDEO_CODECS, "choose codec from {}".format(VIDEO_CODECS)
+        self.path = path
+        self.width, self.height = size
+        self.frames = 0
+        self.error = None
+        self.process = None
+        self.writer = None
+
+        ffmpeg = shutil.which("ffmpeg") if codec != "opencv" else None
+        if codec == "ffmpeg" and ffmpeg is None:
+            raise RuntimeError("ffmpeg was not found on PATH")
+        if ffmpeg is not None:
+            self.process = subprocess.Popen(
+                [ffmpeg, "-y", "-loglevel", "error",
+                 "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", "{}x{}".format(self.width, self.height), "-r", str(fps), "-i", "-",
+                 "-c:v", "libx264", "-preset", "veryfast", "-crf", str(crf), "-pix_fmt", "yuv420p", "-movflags", "+faststart", path],
+                stdin=subprocess.PIPE)
+        else:
+            import cv2
+            self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (self.width, self.height))
+            if not self.writer.isOpened():
+                raise IOError("Could not open {} for writing".format(path))
+
+        pin = torch.cuda.is_available()
+        self.slots = [torch.empty((self.height, self.width, 3), dtype=torch.uint8, pin_memory=pin) for _ in range(max(ring_size, 1))]
+        self.events = [torch.cuda.Event() if pin else None for _ in self.slots]
+        self.free = queue.Queue()
+        for slot in range(len(self.slots)):
+            self.free.put(slot)
+        self.ready = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def write(self, image):
+        """
+        :param image: tensor [3, H, W] in [0, 1], on any device
+        """
+        if self.error is not None:
+            raise self.error
+        # Blocks while every buffer waits for the encoder
+        slot = self.free.get()
+        # Same rounding as ImageWriter and torchvision.utils.save_image
+        frame = image.detach().clamp(0, 1).mul(255).add_(0.5).to(torch.uint8).permute(1, 2, 0)
+        self.slots[slot].copy_(frame, non_blocking=self.events[slot] is not None)
+        if self.events[slot] is not None:
+            self.events[slot].record()
+        self.ready.put(slot)
+
+    def _worker(self):
+        while True:
+            slot = self.ready.get()
+            if slot is None:
+                return
+            try:
+                if self.error is None:
+                    if self.events[slot] is not None:
+                        self.events[slot].synchronize()
+                    frame = self.slots[slot].numpy()
+                    if self.process is not None:
+                        self.process.stdin.write(frame.tobytes())
+                    else:
+                        self.writer.write(np.ascontiguousarray(frame[..., ::-1]))
+                    self.frames += 1
+            except Exception as e:
+                # Keep draining so that write() never waits on a dead encoder
+                self.error = e
+            finally:
+                self.free.put(slot)
+
+    def close(self, raise_error=True):
+        """
+        Encode the pending frames and finish the file, re-raising an encoder error.
+        """
+        if self.thread is None:
+            return
+        self.ready.put(None)
+        self.thread.join()
+        self.thread = None
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            if self.process.wait() != 0 and self.error is None:
+                self.error = RuntimeError("ffmpeg exited with code {}".format(self.process.returncode))
+        if self.writer is not None:
+            self.writer.release()
+        if self.error is not None and raise_error:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # An encoder error must not hide the exception already propagating
+        self.close(raise_error=exc_type is None)
@@ -0,0 +1,206 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+# Long-lived training worker. Keeps the interpreter, torch, the CUDA context
+# and the rasterizer extensions loaded and runs the scripts of this directory
+# (msv2/train.py, gs/train.py, render.py, ...) in-process, one job at a time,
+# instead of paying the startup of a new Python process for every job.
+#
+# Jobs are sent over a local multiprocessing.connection socket:
+#   {"script": "msv2/train.py", "argv": [...], "log_file": path, "cwd": path}
+# cwd is optional (this directory by default). The worker answers
+#   {"status": "queued", "position": n}, {"status": "running"}
+#   {"status": "done", "exit_code": n, "seconds": t}
+# The script runs as __main__ with its own sys.argv, its stdout and stderr
+# (including output of CUDA extensions) appended to log_file. sys.argv,
+# sys.path, sys.stdout, the working directory and the CUDA cache are restored
+# after every job. backend/train_worker.py is the client.
+#
+# Messages are pickled, so the authkey (--authkey or TRAIN_WORKER_AUTHKEY) is
+# required and must stay secret: any client that knows it can run code in the
+# worker. After a CUDA error the context is unusable, the worker answers the
+# job and exits so that the backend falls back to starting new processes.
+
+import os
+import gc
+import sys
+import time
+import queue
+import runpy
+import threading
+import traceback
+from argparse import ArgumentParser
+from multiprocessing.connection import Listener, deliver_challenge, answer_challenge, AuthenticationError
+import torch
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds a client has to send its job after connecting
+RECV_TIMEOUT = 30
+
+# Modules imported once at startup so that the first job does not pay for them
+WARM_MODULES = ["scene", "gaussian_renderer", "utils.loss_utils", "utils.image_utils", "fused_ssim", "lpipsPyTorch",
+                "diff_gaussian_rasterization_ms", "simple_knn._C"]
+
+
+def warm_up():
+    if BASE_DIR not in sys.path:
+        sys.path.insert(0, BASE_DIR)
+    for name in WARM_MODULES:
+        try:
+            __import__(name)
+        except ImportError as e:
+            print("Not preloading {}: {}".format(name, e))
+    if torch.cuda.is_available():
+        # Create the CUDA context
+        torch.zeros(1, device="cuda")
+        torch.cuda.synchronize()
+
+
+def is_cuda_failure(error):
+    """
+    True for errors that leave the CUDA context unusable (illegal memory
+    access, launch failures, ...). Out of memory errors are recoverable.
+    """
+    while error is not None:
+        if isinstance(error, torch.cuda.OutOfMemoryError):
+            return False
+        if isinstance(error, RuntimeError) and ("CUDA error" in str(error) or "CUDA kernel errors" in str(error)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def run_job(job):
+    """
+    Run job["script"] as __main__ with job["argv"], output appended to job["log_file"].
+    :return exit code, whether the CUDA context is broken
+    """
+    script = os.path.abspath(os.path.join(BASE_DIR, job["script"]))
+    with open(job["log_file"], "a") as log:
+        if not script.startswith(BASE_DIR + os.sep) or not os.path.isfile(script):
+            log.write("Unknown script {}\n".format(job["script"]))
+            return 2, False
+
+        saved = (list(sys.argv), list(sys.path), sys.stdout, sys.stderr, os.getcwd())
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = (os.dup(1), os.dup(2))
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        exit_code = 0
+        cuda_failure = False
+        try:
+            os.chdir(job.get("cwd") or BASE_DIR)
+            sys.argv = [script] + [str(arg) for arg in job.get("argv", [])]
+            runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                exit_code = e.code or 0
+            else:
+                print(e.code)
+                exit_code = 1
+        except Exception as e:
+            traceback.print_exc()
+            exit_code = 1
+            cuda_failure = is_cuda_failure(e)
+        finally:
+            # safe_state() replaces sys.stdout, flush whatever wraps it now
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.argv, sys.path[:], sys.stdout, sys.stderr = saved[0], saved[1], saved[2], saved[3]
+            os.chdir(saved[4])
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+
+    if cuda_failure:
+        return exit_code, True
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+        torch.cuda.reset_peak_memory_stats()
+    return exit_code, False
+
+
+def serve(address, authkey):
+    jobs = queue.Queue()
+
+    def receive(conn):
+        # One thread per connection, a silent client only blocks itself
+        try:
+            deliver_challenge(conn, authkey)
+            answer_challenge(conn, authkey)
+            if not conn.poll(RECV_TIMEOUT):
+                conn.close()
+                return
+            job = conn.recv()
+            conn.send({"status": "queued", "position": jobs.qsize()})
+        except AuthenticationError:
+            conn.close()
+            return
+        except Exception:
+            traceback.print_exc()
+            conn.close()
+            return
+        jobs.put((conn, job))
+
+    def accept_loop(listener):
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                traceback.print_exc()
+                continue
+            threading.Thread(target=receive, args=(conn,), daemon=True).start()
+
+    # Authentication happens in receive(), not in accept()
+    listener = Listener(address)
+    threading.Thread(target=accept_loop, args=(listener,), daemon=True).start()
+    print("Training worker listening on {}:{}".format(*address))
+
+    # Jobs run on the main thread, which owns the CUDA context
+    while True:
+        conn, job = jobs.get()
+        try:
+            conn.send({"status": "running"})
+        except OSError:
+            # The client went away while the job was queued
+            continue
+        print("Running {} {}".format(job.get("script"), " ".join(str(arg) for arg in job.get("argv", []))))
+        start = time.time()
+        exit_code, cuda_failure = run_job(job)
+        print("Finished with exit code {} in {:.1f} s".format(exit_code, time.time() - start))
+        try:
+            conn.send({"status": "done", "exit_code": exit_code, "seconds": time.time() - start})
+            conn.close()
+        except OSError:
+            pass
+        if cuda_failure:
+            # Queued clients see the connection drop and start their own process
+            print("CUDA context is broken, exiting")
+            listener.close()
+            os._exit(1)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Training worker parameters")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6100)
+    parser.add_argument("--authkey", type=str, default=os.getenv("TRAIN_WORKER_AUTHKEY", ""),
+                        help="shared secret of the clients, TRAIN_WORKER_AUTHKEY by default")
+    args = parser.parse_args(sys.argv[1:])
+    if not args.authkey:
+        parser.error("set --authkey or TRAIN_WORKER_AUTHKEY, jobs are pickled and can run arbitrary code")
+
+    warm_up()
+    serve((args.host, args.port), args.authkey.encode())